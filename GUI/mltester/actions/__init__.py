@@ -3,4 +3,15 @@ from common_steps import *
 from test_environment import *
 from tf_cnn_benchmarks import *
 from tf_compile import *
-from analyze_verbs import *
\ No newline at end of file
+from verbs_table import *
+from analyze_verbs import *
+from verbs_follow import *
+from trace_reader import *
+from trace_table import *
+from trace_slicer import *
+from trace_index import *
+from trace_merge import *
+from timeline_file import *
+from analyze_trace import *
+from analyze_layers import *
+from trace_simulator import *
\ No newline at end of file
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from commonpylib.log import FormattedTable, ScreenLogWriter, UniBorder, LOG_LEVEL_NOTE
+
+#--------------------------------------------------------------------#
+
+def groupIds(*keys):
+    ''' Dense group ids for rows of integer key columns.
+        Returns (ids, first) where first[g] is the index of a row of group g. '''
+    num_rows = len(keys[0])
+    if num_rows == 0:
+        return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+    order = np.lexsort(keys[::-1])
+    is_new = np.zeros(num_rows, dtype = bool)
+    is_new[0] = True
+    for key in keys:
+        sorted_key = key[order]
+        is_new[1:] |= sorted_key[1:] != sorted_key[:-1]
+    ids = np.empty(num_rows, dtype = np.int64)
+    ids[order] = np.cumsum(is_new) - 1
+    return ids, order[is_new]
+
+#--------------------------------------------------------------------#
+
+def groupStats(ids, num_groups, values, percentiles = (50, 90, 99)):
+    ''' Per-group count, total, mean, min, max and percentiles (linear interpolation, as numpy.percentile). '''
+    values = np.asarray(values, dtype = np.float64)
+    count = np.bincount(ids, minlength = num_groups)
+    total = np.bincount(ids, weights = values, minlength = num_groups)
+    res = {"count": count,
+           "total": total,
+           "mean": total / np.maximum(count, 1)}
+    empty = count == 0
+    if len(values) == 0:
+        zeros = np.zeros(num_groups)
+        res["min"] = res["max"] = zeros
+        for q in percentiles:
+            res["p%s" % q] = zeros
+        return res
+    
+    sorted_values = values[np.lexsort((values, ids))]
+    first = np.minimum(np.cumsum(count) - count, len(values) - 1)
+    last = np.minimum(first + np.maximum(count, 1) - 1, len(values) - 1)
+    res["min"] = np.where(empty, 0.0, sorted_values[first])
+    res["max"] = np.where(empty, 0.0, sorted_values[last])
+    for q in percentiles:
+        pos = first + np.maximum(count - 1, 0) * (q / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        frac = pos - lo
+        res["p%s" % q] = np.where(empty, 0.0, sorted_values[lo] * (1.0 - frac) + sorted_values[hi] * frac)
+    return res
+
+#--------------------------------------------------------------------#
+
+class LogHistogram(object):
+    ''' Counts of values in log-spaced bins, bins_per_decade per power of 10 from lo to hi, plus an underflow and an
+        overflow bin. Histograms with the same bins merge by adding their counts, so a huge log can be summarized in
+        parts. Quantiles are accurate to a bin, a factor of 10 ** (1.0 / bins_per_decade). '''
+
+    def __init__(self, lo = 1.0, hi = 1e7, bins_per_decade = 10):
+        num_bins = int(round(np.log10(float(hi) / lo) * bins_per_decade))
+        self.edges = np.logspace(np.log10(lo), np.log10(hi), num_bins + 1)
+        self.counts = np.zeros(num_bins + 2, dtype = np.int64)     # [< lo, bins..., >= hi]
+
+    # -------------------------------------------------------------------- #
+
+    def bins(self, values):
+        return np.searchsorted(self.edges, values, side = "right")
+
+    # -------------------------------------------------------------------- #
+
+    def add(self, values):
+        self.counts += np.bincount(self.bins(values), minlength = len(self.counts))
+
+    # -------------------------------------------------------------------- #
+
+    def addValue(self, value):
+        ''' add() of a single value, without building arrays. '''
+        self.counts[self.bins(value)] += 1
+
+    # -------------------------------------------------------------------- #
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Can't merge histograms with different bins.")
+        self.counts += other.counts
+
+    # -------------------------------------------------------------------- #
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    # -------------------------------------------------------------------- #
+
+    def quantile(self, q):
+        ''' The q-th percentile (0-100): the geometric middle of its bin, or the edge for the under/overflow bins. '''
+        total = self.counts.sum()
+        if total == 0:
+            return 0.0
+        rank = max(np.ceil(q / 100.0 * total), 1)
+        i = int(np.searchsorted(np.cumsum(self.counts), rank))
+        if i == 0:
+            return self.edges[0]
+        if i >= len(self.edges):
+            return self.edges[-1]
+        return np.sqrt(self.edges[i - 1] * self.edges[i])
+
+    # -------------------------------------------------------------------- #
+
+    def labels(self):
+        return ["<%.3g" % self.edges[0]] + ["%.3g-%.3g" % (lo, hi) for lo, hi in zip(self.edges[:-1], self.edges[1:])] + [">=%.3g" % self.edges[-1]]
+
+#--------------------------------------------------------------------#
+
+def groupHistograms(ids, num_groups, values, lo = 1.0, hi = 1e7, bins_per_decade = 10):
+    ''' A LogHistogram of the values of each group. '''
+    res = [LogHistogram(lo, hi, bins_per_decade) for _ in xrange(num_groups)]
+    if num_groups == 0:
+        return res
+    num_bins = len(res[0].counts)
+    counts = np.bincount(ids * num_bins + res[0].bins(values), minlength = num_groups * num_bins).reshape(num_groups, num_bins)
+    for hist, group_counts in zip(res, counts):
+        hist.counts += group_counts
+    return res
+
+#--------------------------------------------------------------------#
+
+def mergeIntervals(starts, ends):
+    ''' Union of [start, end) intervals as sorted, disjoint (starts, ends) arrays. '''
+    if len(starts) == 0:
+        return starts[:0], ends[:0]
+    order = np.argsort(starts, kind = "mergesort")
+    starts = starts[order]
+    running_end = np.maximum.accumulate(ends[order])
+    is_new = np.ones(len(starts), dtype = bool)
+    is_new[1:] = starts[1:] > running_end[:-1]
+    first = np.nonzero(is_new)[0]
+    last = np.append(first[1:] - 1, len(starts) - 1)
+    return starts[first], running_end[last]
+
+#--------------------------------------------------------------------#
+
+def unionLength(starts, ends):
+    merged_starts, merged_ends = mergeIntervals(starts, ends)
+    return int((merged_ends - merged_starts).sum())
+
+#--------------------------------------------------------------------#
+
+def writeReport(columns, rows, csv_path, max_screen_rows = None):
+    ''' Writes all rows to a csv file and prints the first ones as a formatted table (none if max_screen_rows is 0).
+        columns is a list of (name, width) pairs. '''
+    def createTable():
+        table = FormattedTable()
+        for name, width in columns:
+            table.addColumn(FormattedTable.Column(name, width))
+        return table
+
+    with open(csv_path, "w") as csv_file:
+        table = createTable()
+        table.bind([FormattedTable.CsvStream(csv_file, print_header = True)])
+        for row in rows:
+            table.addRow(row)
+        table.unbind()
+
+    if max_screen_rows != 0:
+        table = createTable()
+        table.bind([FormattedTable.UniborderStream(ScreenLogWriter(None, log_level=LOG_LEVEL_NOTE), style=UniBorder.BORDER_STYLE_STRONG)])
+        for row in rows[:max_screen_rows]:
+            table.addRow(row)
+        table.unbind()
+    print "Report: %s" % csv_path
+
+#--------------------------------------------------------------------#
+
+def estimateClockOffset(forward_delays, backward_delays):
+    ''' NTP-style offset of clock B relative to clock A from messages in both directions:
+        forward_delays are (B receive time - A send time), backward_delays are (A receive time - B send time).
+        The fastest message each way bounds the offset; returns (offset, uncertainty), both in the delays' units. '''
+    forward = np.min(forward_delays)
+    backward = np.min(backward_delays)
+    return (forward - backward) / 2.0, (forward + backward) / 2.0
+
+#--------------------------------------------------------------------#
+
+def alignClocks(pair_offsets, reference):
+    ''' Offset of every clock relative to the reference clock, chaining pairwise estimates breadth-first.
+        pair_offsets: {(a, b): (offset of b relative to a, uncertainty)}. Returns {clock: (offset, uncertainty)};
+        clocks without a path to the reference are left out. '''
+    neighbors = {}
+    for (a, b), (offset, uncertainty) in pair_offsets.iteritems():
+        neighbors.setdefault(a, []).append((b, offset, uncertainty))
+        neighbors.setdefault(b, []).append((a, -offset, uncertainty))
+    res = {reference: (0.0, 0.0)}
+    queue = [reference]
+    while queue:
+        a = queue.pop(0)
+        # Prefer the most certain estimate when a clock can be reached more than one way:
+        for b, offset, uncertainty in sorted(neighbors.get(a, []), key = lambda neighbor: neighbor[2]):
+            if b not in res:
+                res[b] = (res[a][0] + offset, res[a][1] + uncertainty)
+                queue.append(b)
+    return res
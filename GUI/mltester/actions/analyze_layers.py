@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import numpy as np
+
+from mltester.actions.analysis_util import writeReport
+from mltester.actions.analyze_trace import TraceDevices, TensorTransfers, detectSteps
+
+# tf_cnn_benchmarks builds every model under the "cg" scope of ConvNetBuilder; the next scope is the layer
+# (conv0, mpool0, affine0, ...) or composite block (resnet_v10, incept_v3_a0, ...). Backward ops repeat the
+# forward path under ".../gradients/":
+LAYER_SCOPE = re.compile(r"(?:^|/)cg/([^/]+)")
+
+# Variables are read through ".../<variable>/read"; each one's gradient has the same size:
+VARIABLE_READ = re.compile(r"/read(:0)?$")
+
+# Per model: (layer prefix, number of consecutive layers in each block) of the TFCnnBenchmarksStep.MODELS
+# that have a block structure; layers of other models (and other prefixes) are their own blocks:
+MODEL_BLOCKS = {"vgg16": ("conv", [2, 2, 3, 3, 3]),
+                "vgg19": ("conv", [2, 2, 4, 4, 4]),
+                "resnet50": ("resnet_v1", [3, 4, 6, 3]),
+                "resnet101": ("resnet_v1", [3, 4, 23, 3]),
+                "resnet152": ("resnet_v1", [3, 8, 36, 3])}
+
+#--------------------------------------------------------------------#
+
+def layerName(node_name):
+    ''' The model layer of a graph node, or None for nodes outside the model (input pipeline, optimizer, ...). '''
+    m = LAYER_SCOPE.search(node_name)
+    return m.group(1) if m else None
+
+#--------------------------------------------------------------------#
+
+def blockName(layer, model = None):
+    ''' The block of a layer: "block<i>" for the numbered layers of models in MODEL_BLOCKS, else the layer. '''
+    if model not in MODEL_BLOCKS:
+        return layer
+    prefix, sizes = MODEL_BLOCKS[model]
+    m = re.match(r"^%s([0-9]+)$" % re.escape(prefix), layer)
+    if m is None:
+        return layer
+    block = np.searchsorted(np.cumsum(sizes), int(m.group(1)), side = "right")
+    return "block%u" % (block + 1) if block < len(sizes) else layer
+
+#--------------------------------------------------------------------#
+
+class LayerCosts(object):
+    ''' Per-step compute, communication and variable (= gradient) size of every model layer, in execution order.
+        Compute is taken from the op lanes only (stream lanes repeat it as kernels), and communication from the
+        send/recv/copy/collective ops and memcpy lanes. '''
+
+    def __init__(self, table, model = None):
+        devices = TraceDevices(table)
+        num_steps = float(max(len(detectSteps(table)), 1))
+        is_comm = devices.communicationMask(table)
+        on_op_lane = np.in1d(table.pid, [pid for pid, pname in table.processes.iteritems() if pname.startswith("/job:")])
+        complete = table.mask(ph = "X") & (table.node_id >= 0)
+        compute = complete & on_op_lane & ~is_comm
+        comm = complete & is_comm & (on_op_lane | np.in1d(table.pid, list(devices.is_memcpy)))
+
+        # Layers in the order their first compute op ran, then those with communication only:
+        compute_nodes = table.node_id[compute][np.argsort(table.ts[compute], kind = "mergesort")]
+        _, first = np.unique(compute_nodes, return_index = True)
+        self.layers = []
+        layer_index = {}
+        node_layer = np.full(len(table.names), -1, dtype = np.int64)
+        for node_id in compute_nodes[np.sort(first)].tolist() + np.unique(table.node_id[comm]).tolist():
+            layer = layerName(table.names[node_id])
+            if layer is None:
+                continue
+            if layer not in layer_index:
+                layer_index[layer] = len(self.layers)
+                self.layers.append(layer)
+            node_layer[node_id] = layer_index[layer]
+
+        num_layers = len(self.layers)
+        is_backward = np.array(["gradients/" in name for name in table.names.strings] or [False])
+
+        def perLayer(mask):
+            layer_ids = node_layer[table.node_id[mask]]
+            valid = layer_ids >= 0
+            return np.bincount(layer_ids[valid], weights = table.dur[mask][valid], minlength = num_layers) / num_steps
+
+        self.forward = perLayer(compute & ~is_backward[table.node_id])
+        self.backward = perLayer(compute & is_backward[table.node_id])
+        self.exchange = perLayer(comm)
+
+        # Exchanged bytes from the trace's flows; variable sizes from the tensor snapshots:
+        transfers = TensorTransfers(table)
+        unique_ids, inverse = np.unique(transfers.name_id, return_inverse = True)
+        transfer_layers = np.array([layer_index.get(layerName(table.names[i]), -1) for i in unique_ids.tolist()], dtype = np.int64)[inverse]
+        valid = transfer_layers >= 0
+        self.exchanged_bytes = np.bincount(transfer_layers[valid], weights = transfers.size[valid], minlength = num_layers) / num_steps
+
+        snapshots = table.mask(ph = "O")
+        variable_sizes = {}
+        for name_id, size in zip(table.name_id[snapshots].tolist(), table.value[snapshots].tolist()):
+            name = table.names[name_id]
+            if VARIABLE_READ.search(name) and ("gradients/" not in name):
+                variable = VARIABLE_READ.sub("", name)
+                variable_sizes[variable] = max(variable_sizes.get(variable, 0), size)
+        self.gradient_bytes = np.zeros(num_layers)
+        for variable, size in variable_sizes.iteritems():
+            layer = layerName(variable)
+            if layer in layer_index:
+                self.gradient_bytes[layer_index[layer]] += size
+
+        self.blocks = [blockName(layer, model) for layer in self.layers]
+        self.compute = self.forward + self.backward
+        self.is_comm_bound = self.exchange > self.compute
+
+    # -------------------------------------------------------------------- #
+
+    def __len__(self):
+        return len(self.layers)
+
+#--------------------------------------------------------------------#
+
+def generateLayerReport(table, output_dir, model = None):
+    ''' Per-layer and per-block compute time, gradient size and exchange time, flagging communication-bound layers. '''
+    costs = LayerCosts(table, model)
+    columns = [("Layer", 20), ("Block", 12), ("Forward (us)", 12), ("Backward (us)", 13), ("Exchange (us)", 13),
+               ("Gradient (bytes)", 16), ("Exchanged (bytes)", 17), ("Comm bound", 10)]
+    rows = []
+    for i in xrange(len(costs)):
+        rows.append([costs.layers[i], costs.blocks[i], "%.1lf" % costs.forward[i], "%.1lf" % costs.backward[i],
+                     "%.1lf" % costs.exchange[i], "%.0lf" % costs.gradient_bytes[i], "%.0lf" % costs.exchanged_bytes[i],
+                     "*" if costs.is_comm_bound[i] else ""])
+    writeReport(columns, rows, os.path.join(output_dir, "layers.csv"), max_screen_rows = len(rows))
+
+    blocks = []
+    for block in costs.blocks:
+        if block not in blocks:
+            blocks.append(block)
+    columns = [("Block", 12), ("Layers", 6), ("Compute (us)", 12), ("Exchange (us)", 13), ("Gradient (bytes)", 16), ("Comm bound", 10)]
+    rows = []
+    for block in blocks:
+        in_block = np.array([b == block for b in costs.blocks])
+        compute = costs.compute[in_block].sum()
+        exchange = costs.exchange[in_block].sum()
+        rows.append([block, in_block.sum(), "%.1lf" % compute, "%.1lf" % exchange, "%.0lf" % costs.gradient_bytes[in_block].sum(),
+                     "*" if exchange > compute else ""])
+    writeReport(columns, rows, os.path.join(output_dir, "blocks.csv"), max_screen_rows = len(rows))
+    return costs
@@ -0,0 +1,898 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import re
+import numpy as np
+
+from commonpylib.util import toFileName
+from mltester.actions.analysis_util import groupIds, groupStats, mergeIntervals, unionLength, writeReport
+from mltester.actions.trace_table import NO_EVENT_ID, TraceTable
+
+# trace_<job>_<task>.json as copied by TFCnnBenchmarksStep._copyResults:
+TRACE_FILE_NAME = re.compile(r"^trace_(.+)_([0-9]+)\.json(\.gz|\.zst)?$")
+
+# Op types (and GPU kernels) that move tensors rather than compute:
+COMMUNICATION_OPS = re.compile(r"^(_Send|_Recv|_HostSend|_HostRecv|RecvTensor|MEMCPY|[Nn]ccl|Collective)")
+
+# /job:<job>/replica:<replica>/task:<task> prefix of a device name:
+JOB_TASK = re.compile(r"^/job:([^/]+)/replica:[0-9]+/task:([0-9]+)")
+
+# Graph node every partition runs first in each step:
+STEP_MARKER_NODE = "_SOURCE"
+
+#--------------------------------------------------------------------#
+
+class OpStatistics(object):
+    ''' Duration statistics of trace events grouped by (process, op name), sorted by total time.
+        share is the per-step total (total / num_steps) as a percentage of step_time; without a step_time,
+        the span of the events counts as a single step. '''
+    
+    PERCENTILES = (50, 90, 99)
+    
+    def __init__(self, table, mask = None, step_time = None, num_steps = 1):
+        if mask is None:
+            mask = table.mask(ph = "X")
+        pids = table.pid[mask]
+        name_ids = table.name_id[mask]
+        durs = table.dur[mask]
+        
+        ids, first = groupIds(pids, name_ids)
+        stats = groupStats(ids, len(first), durs, OpStatistics.PERCENTILES)
+        order = np.argsort(-stats["total"], kind = "mergesort")
+        
+        self.processes = [table.processName(pid) for pid in pids[first][order].tolist()]
+        self.ops = [table.names[name_id] for name_id in name_ids[first][order].tolist()]
+        for key, val in stats.iteritems():
+            setattr(self, key, val[order])
+        
+        if step_time is None:
+            ends = table.end()[mask]
+            step_time = (ends.max() - table.ts[mask].min()) if len(ends) else 0
+            num_steps = 1
+        self.step_time = step_time
+        self.num_steps = max(num_steps, 1)
+        self.per_step = self.total / float(self.num_steps)
+        self.share = self.per_step * 100.0 / step_time if step_time else np.zeros(len(order))
+    
+    # -------------------------------------------------------------------- #
+    
+    def __len__(self):
+        return len(self.ops)
+    
+    # -------------------------------------------------------------------- #
+    
+    def keys(self):
+        return zip(self.processes, self.ops)
+
+#--------------------------------------------------------------------#
+
+def generateOpReport(table, output_dir, max_screen_rows = 30):
+    ''' Per-op statistics over the complete steps of the trace. Step % is the op's time per step over the mean step time. '''
+    steps = detectSteps(table)
+    stats = OpStatistics(table, steps.completeMask(table), steps.meanDuration(), steps.numComplete())
+    columns = [("Process", 50), ("Op", 40), ("Count", 7), ("Total (us)", 12), ("Per step (us)", 13), ("Mean (us)", 10),
+               ("P50 (us)", 10), ("P90 (us)", 10), ("P99 (us)", 10), ("Max (us)", 10), ("Step %", 7)]
+    rows = []
+    for i in xrange(len(stats)):
+        rows.append([stats.processes[i],
+                     stats.ops[i],
+                     stats.count[i],
+                     "%.0lf" % stats.total[i],
+                     "%.0lf" % stats.per_step[i],
+                     "%.1lf" % stats.mean[i],
+                     "%.1lf" % stats.p50[i],
+                     "%.1lf" % stats.p90[i],
+                     "%.1lf" % stats.p99[i],
+                     "%.0lf" % stats.max[i],
+                     "%.2lf" % stats.share[i]])
+    writeReport(columns, rows, os.path.join(output_dir, "op_stats.csv"), max_screen_rows)
+    print "Step time: mean %.0lf us of %u steps (from %s)" % (stats.step_time, stats.num_steps, steps.source)
+    return stats
+
+#--------------------------------------------------------------------#
+
+class OpDiff(object):
+    ''' Per-op change between two runs, aligned by (process, op). Counts and totals are per step.
+        Sorted by contribution to the step time change: the ops that moved the step time most come first. '''
+    
+    def __init__(self, stats_a, stats_b, num_steps_a = 1, num_steps_b = 1):
+        keys = sorted(set(stats_a.keys()) | set(stats_b.keys()))
+        
+        def align(stats, num_steps):
+            index = dict((key, i) for i, key in enumerate(stats.keys()))
+            pos = np.array([index.get(key, -1) for key in keys], dtype = np.int64)
+            found = pos >= 0
+            count = np.where(found, stats.count[pos.clip(0)], 0) if len(stats) else np.zeros(len(keys))
+            total = np.where(found, stats.total[pos.clip(0)], 0.0) if len(stats) else np.zeros(len(keys))
+            return count / float(max(num_steps, 1)), total / float(max(num_steps, 1)), total / np.maximum(count, 1)
+        
+        count_a, total_a, mean_a = align(stats_a, num_steps_a)
+        count_b, total_b, mean_b = align(stats_b, num_steps_b)
+        self.step_time_a = stats_a.step_time
+        self.step_time_b = stats_b.step_time
+        self.step_delta = self.step_time_b - self.step_time_a
+        
+        delta = total_b - total_a
+        order = np.argsort(-delta * (1 if self.step_delta >= 0 else -1), kind = "mergesort")
+        self.processes = [keys[i][0] for i in order.tolist()]
+        self.ops = [keys[i][1] for i in order.tolist()]
+        self.count_a = count_a[order]
+        self.count_b = count_b[order]
+        self.total_a = total_a[order]
+        self.total_b = total_b[order]
+        self.mean_a = mean_a[order]
+        self.mean_b = mean_b[order]
+        self.delta = delta[order]
+        self.contribution = self.delta * 100.0 / self.step_delta if self.step_delta else np.zeros(len(order))
+    
+    # -------------------------------------------------------------------- #
+    
+    def __len__(self):
+        return len(self.ops)
+
+#--------------------------------------------------------------------#
+
+def generateDiffReport(table_a, table_b, output_dir, max_screen_rows = 30):
+    ''' Which ops made run B slower (or faster) than run A. '''
+    steps_a = detectSteps(table_a)
+    steps_b = detectSteps(table_b)
+    stats_a = OpStatistics(table_a, steps_a.completeMask(table_a), steps_a.meanDuration(), steps_a.numComplete())
+    stats_b = OpStatistics(table_b, steps_b.completeMask(table_b), steps_b.meanDuration(), steps_b.numComplete())
+    diff = OpDiff(stats_a, stats_b, steps_a.numComplete(), steps_b.numComplete())
+    
+    def mean(val, count):
+        return "%.1lf" % val if count else "---"
+    
+    columns = [("Process", 50), ("Op", 40), ("Count A", 7), ("Count B", 7), ("Total A (us)", 12), ("Total B (us)", 12),
+               ("Delta (us)", 10), ("Mean A (us)", 11), ("Mean B (us)", 11), ("Step change %", 13)]
+    rows = []
+    for i in xrange(len(diff)):
+        rows.append([diff.processes[i],
+                     diff.ops[i],
+                     "%.1lf" % diff.count_a[i],
+                     "%.1lf" % diff.count_b[i],
+                     "%.0lf" % diff.total_a[i],
+                     "%.0lf" % diff.total_b[i],
+                     "%+.0lf" % diff.delta[i],
+                     mean(diff.mean_a[i], diff.count_a[i]),
+                     mean(diff.mean_b[i], diff.count_b[i]),
+                     "%.1lf" % diff.contribution[i]])
+    writeReport(columns, rows, os.path.join(output_dir, "op_diff.csv"), max_screen_rows)
+    print "Step time: %.0lf us (%u steps) -> %.0lf us (%u steps): %+.0lf us (%+.1lf%%)" % \
+        (diff.step_time_a, steps_a.numComplete(), diff.step_time_b, steps_b.numComplete(), diff.step_delta,
+         diff.step_delta * 100.0 / diff.step_time_a if diff.step_time_a else 0.0)
+    return diff
+
+#--------------------------------------------------------------------#
+
+class TraceDevices(object):
+    ''' Maps the processes of a trace (op lanes, GPU stream lanes and memcpy lanes) to devices. '''
+    
+    LANE_SUFFIX = re.compile(r" (Compute|Tensors)$")
+    STREAM_SUFFIX = re.compile(r"/(stream:[^/]*|memcpy)$")
+    
+    def __init__(self, table):
+        self.device = {}        # pid -> device name
+        self.is_memcpy = set()  # pids of memcpy lanes
+        for pid, pname in table.processes.iteritems():
+            name = TraceDevices.LANE_SUFFIX.sub("", pname)
+            m = TraceDevices.STREAM_SUFFIX.search(name)
+            if m:
+                name = name[:m.start()]
+                if m.group(1) == "memcpy":
+                    self.is_memcpy.add(pid)
+            self.device[pid] = name
+        
+        # Stream lanes of local runs are named /device:GPU:0/stream:N while the
+        # matching op lane is /job:localhost/replica:0/task:0/device:GPU:0:
+        full_names = {}
+        for name in set(self.device.values()):
+            if name.startswith("/job:") and ("/device:" in name):
+                full_names.setdefault(name[name.index("/device:"):], set()).add(name)
+        for pid, name in self.device.items():
+            matches = full_names.get(name, ())
+            if len(matches) == 1:
+                self.device[pid] = list(matches)[0]
+    
+    # -------------------------------------------------------------------- #
+    
+    def deviceName(self, pid):
+        return self.device.get(pid, "pid_%d" % pid)
+    
+    # -------------------------------------------------------------------- #
+    
+    def isGpu(self, pid):
+        return "/device:GPU:" in self.deviceName(pid)
+    
+    # -------------------------------------------------------------------- #
+    
+    def pidsByDevice(self, pids):
+        res = {}
+        for pid in np.unique(pids).tolist():
+            res.setdefault(self.deviceName(pid), []).append(pid)
+        return sorted(res.items())
+    
+    # -------------------------------------------------------------------- #
+    
+    def communicationMask(self, table):
+        ''' True for events that transfer data: send/recv/copy/collective ops and memcpy lanes. '''
+        is_comm_name = np.array([COMMUNICATION_OPS.match(name) is not None for name in table.names.strings] or [False])
+        res = is_comm_name[table.name_id]
+        if self.is_memcpy:
+            res |= np.in1d(table.pid, list(self.is_memcpy))
+        return res
+
+#--------------------------------------------------------------------#
+
+class Steps(object):
+    ''' Training-step boundaries of a trace. Step i is [start[i], end[i]).
+        When there are several steps, the last one ends with the trace rather than at a next boundary, so it is
+        usually cut short: it is kept for per-step attribution but marked incomplete, and left out of step time statistics. '''
+    
+    SOURCE_MARKERS = "markers"
+    SOURCE_PERIODICITY = "periodicity"
+    SOURCE_TRACE = "trace"
+    
+    def __init__(self, starts, end, source):
+        self.start = np.asarray(starts, dtype = np.int64)
+        self.end = np.append(self.start[1:], end).astype(np.int64) if len(self.start) else np.zeros(0, dtype = np.int64)
+        self.duration = self.end - self.start
+        self.complete = np.ones(len(self.start), dtype = bool)
+        if len(self.start) >= 2:
+            self.complete[-1] = False
+        self.source = source
+    
+    # -------------------------------------------------------------------- #
+    
+    def __len__(self):
+        return len(self.start)
+    
+    # -------------------------------------------------------------------- #
+    
+    def numComplete(self):
+        return int(self.complete.sum())
+    
+    # -------------------------------------------------------------------- #
+    
+    def completeDurations(self):
+        return self.duration[self.complete]
+    
+    # -------------------------------------------------------------------- #
+    
+    def meanDuration(self):
+        ''' Mean duration of the complete steps (0 if there are none). '''
+        return self.completeDurations().mean() if self.complete.any() else 0.0
+    
+    # -------------------------------------------------------------------- #
+    
+    def completeMask(self, table):
+        ''' Mask of the complete events of the table that start in a complete step. '''
+        mask = table.mask(ph = "X")
+        if self.complete.any():
+            mask &= (table.ts >= self.start[0]) & (table.ts < self.end[self.complete][-1])
+        return mask
+    
+    # -------------------------------------------------------------------- #
+    
+    def windows(self):
+        return zip(self.start.tolist(), self.end.tolist())
+
+#--------------------------------------------------------------------#
+
+def _mostRepeated(pids, keys):
+    ''' Of all (pid, key) pairs, the indices of the most frequent one. '''
+    ids, _ = groupIds(pids, keys)
+    counts = np.bincount(ids)
+    return np.nonzero(ids == np.argmax(counts))[0]
+
+#--------------------------------------------------------------------#
+
+def detectSteps(table):
+    ''' Step boundaries from the _SOURCE node every partition runs at the start of a step, or else from the
+        periodicity of the first node run on each device (graph nodes run once per step).
+        Events before the first boundary are attributed to the first step. '''
+    mask = table.mask(ph = "X")
+    if not mask.any():
+        return Steps([], 0, Steps.SOURCE_TRACE)
+    pids = table.pid[mask]
+    starts = table.ts[mask]
+    trace_start = int(starts.min())
+    trace_end = int(table.end()[mask].max())
+    
+    marker_id = table.names.find(STEP_MARKER_NODE)
+    markers = np.nonzero(table.node_id[mask] == marker_id)[0] if marker_id >= 0 else []
+    if len(markers):
+        # The device that ran the most steps:
+        step_starts = np.sort(starts[markers[_mostRepeated(pids[markers], np.zeros(len(markers), dtype = np.int64))]])
+        source = Steps.SOURCE_MARKERS
+    else:
+        nodes = np.where(table.node_id[mask] >= 0, table.node_id[mask], table.name_id[mask])
+        order = np.lexsort((starts, pids))
+        is_first = np.ones(len(order), dtype = bool)
+        is_first[1:] = pids[order][1:] != pids[order][:-1]
+        first_nodes = dict(zip(pids[order][is_first].tolist(), nodes[order][is_first].tolist()))
+        candidates = np.nonzero(nodes == np.array([first_nodes[pid] for pid in pids.tolist()]))[0]
+        step_starts = np.sort(starts[candidates[_mostRepeated(pids[candidates], nodes[candidates])]])
+        source = Steps.SOURCE_PERIODICITY if len(step_starts) >= 2 else Steps.SOURCE_TRACE
+    step_starts[0] = min(step_starts[0], trace_start)
+    return Steps(step_starts, trace_end, source)
+
+#--------------------------------------------------------------------#
+
+def stepWindows(table):
+    ''' [(start, end)] of the steps of a trace. '''
+    return detectSteps(table).windows()
+
+#--------------------------------------------------------------------#
+
+class DeviceUtilization(object):
+    def __init__(self, step, device, window, busy, compute, comm):
+        self.step = step
+        self.device = device
+        self.window = window
+        self.busy = busy            # Union of all events on the device
+        self.compute = compute      # Union of compute events
+        self.comm = comm            # Union of communication events
+        self.overlap = compute + comm - busy
+        self.idle = window - busy
+    
+    # -------------------------------------------------------------------- #
+    
+    def overlapPercent(self):
+        ''' Share of the communication time hidden behind compute. '''
+        return self.overlap * 100.0 / self.comm if self.comm else 0.0
+
+#--------------------------------------------------------------------#
+
+def _windowUtilization(step, device, starts, ends, is_comm, window):
+    ''' Utilization of events sorted by start, clipped to a window. '''
+    t0, t1 = window
+    max_dur = (ends - starts).max() if len(starts) else 0
+    lo = np.searchsorted(starts, t0 - max_dur)
+    hi = np.searchsorted(starts, t1)
+    s = np.maximum(starts[lo:hi], t0)
+    e = np.minimum(ends[lo:hi], t1)
+    valid = e > s
+    comm = valid & is_comm[lo:hi]
+    compute = valid & ~is_comm[lo:hi]
+    return DeviceUtilization(step, device, t1 - t0,
+                             unionLength(s[valid], e[valid]),
+                             unionLength(s[compute], e[compute]),
+                             unionLength(s[comm], e[comm]))
+
+#--------------------------------------------------------------------#
+
+def deviceUtilization(table, windows = None):
+    ''' Busy/idle/compute/communication time of every device in every window (default: every step). '''
+    if windows is None:
+        windows = stepWindows(table)
+    devices = TraceDevices(table)
+    mask = table.mask(ph = "X")
+    pids = table.pid[mask]
+    starts = table.ts[mask]
+    ends = starts + table.dur[mask]
+    is_comm = devices.communicationMask(table)[mask]
+    
+    res = []
+    for device, device_pids in devices.pidsByDevice(pids):
+        on_device = np.in1d(pids, device_pids)
+        order = np.argsort(starts[on_device], kind = "mergesort")
+        for step, window in enumerate(windows):
+            res.append(_windowUtilization(step, device, starts[on_device][order], ends[on_device][order], is_comm[on_device][order], window))
+    return res
+
+#--------------------------------------------------------------------#
+
+def stepBreakdown(table, steps = None):
+    ''' Compute, communication and idle time of every step, over all devices together. '''
+    if steps is None:
+        steps = detectSteps(table)
+    mask = table.mask(ph = "X")
+    order = np.argsort(table.ts[mask], kind = "mergesort")
+    starts = table.ts[mask][order]
+    ends = starts + table.dur[mask][order]
+    is_comm = TraceDevices(table).communicationMask(table)[mask][order]
+    return [_windowUtilization(step, "All", starts, ends, is_comm, window) for step, window in enumerate(steps.windows())]
+
+#--------------------------------------------------------------------#
+
+def outlierSteps(durations, percentile = 95):
+    ''' Mask of the steps slower than the given percentile of all step durations, and that threshold. '''
+    durations = np.asarray(durations)
+    if len(durations) == 0:
+        return np.zeros(0, dtype = bool), 0.0
+    threshold = np.percentile(durations, percentile)
+    return durations > threshold, threshold
+
+#--------------------------------------------------------------------#
+
+def generateStepReport(table, output_dir, percentile = 95):
+    ''' Per-step duration and compute/communication/idle breakdown, with outliers flagged. '''
+    steps = detectSteps(table)
+    outliers = np.zeros(len(steps), dtype = bool)
+    outliers[steps.complete], threshold = outlierSteps(steps.completeDurations(), percentile)
+    
+    columns = [("Step", 5), ("Start (us)", 10), ("Duration (us)", 13), ("Compute (us)", 12), ("Comm (us)", 10),
+               ("Overlap (us)", 12), ("Idle (us)", 10), ("Idle %", 6), ("Outlier", 7)]
+    rows = []
+    for sample in stepBreakdown(table, steps):
+        rows.append([sample.step, steps.start[sample.step] - steps.start[0], sample.window, sample.compute, sample.comm,
+                     sample.overlap, sample.idle, "%.1lf" % (sample.idle * 100.0 / max(sample.window, 1)),
+                     "*" if outliers[sample.step] else ("partial" if not steps.complete[sample.step] else "")])
+    writeReport(columns, rows, os.path.join(output_dir, "steps.csv"), max_screen_rows = len(rows))
+    
+    if len(steps):
+        print "Steps: %u (from %s)%s" % (len(steps), steps.source, "" if steps.complete.all() else ", the last one partial")
+        print "Step time: median %.0lf us, mean %.0lf us, p%s %.0lf us" % \
+            (np.median(steps.completeDurations()), steps.meanDuration(), percentile, threshold)
+        print "Outliers: %u (%s)" % (outliers.sum(), ", ".join(str(step) for step in np.nonzero(outliers)[0]) or "none")
+    return steps
+
+#--------------------------------------------------------------------#
+
+def generateUtilizationReport(table, output_dir, windows = None):
+    samples = deviceUtilization(table, windows)
+    sums = {}
+    for sample in samples:
+        acc = sums.setdefault(sample.device, [0, 0, 0, 0])
+        acc[0] += sample.window
+        acc[1] += sample.busy
+        acc[2] += sample.compute
+        acc[3] += sample.comm
+    totals = [DeviceUtilization("Total", device, *sums[device]) for device in sorted(sums.keys())]
+    
+    columns = [("Step", 5), ("Device", 50), ("Window (us)", 11), ("Busy (us)", 10), ("Idle (us)", 10),
+               ("Compute (us)", 12), ("Comm (us)", 10), ("Overlap (us)", 12), ("Overlap %", 9)]
+    rows = []
+    for sample in samples + totals:
+        rows.append([sample.step, sample.device, sample.window, sample.busy, sample.idle,
+                     sample.compute, sample.comm, sample.overlap, "%.1lf" % sample.overlapPercent()])
+    writeReport(columns, rows, os.path.join(output_dir, "utilization.csv"), max_screen_rows = len(rows))
+    return samples
+
+#--------------------------------------------------------------------#
+
+def counterSeries(table, cat = None):
+    ''' {counter name: (ts, values)} of the counter events (e.g. allocator bytes in use), in time order. '''
+    mask = table.mask(ph = "C", cat = cat)
+    name_ids = table.name_id[mask]
+    ts = table.ts[mask]
+    values = table.value[mask]
+    res = {}
+    for name_id in np.unique(name_ids).tolist():
+        on_counter = np.nonzero(name_ids == name_id)[0]
+        order = on_counter[np.argsort(ts[on_counter], kind = "mergesort")]
+        res[table.names[name_id]] = (ts[order], values[order])
+    return res
+
+#--------------------------------------------------------------------#
+
+def writeCounterSeries(table, output_dir, prefix = "MEM", cat = "Memory", scale = 1.0 / (1 << 20)):
+    ''' Writes every counter as a <prefix>-<counter>.csv series for the graph viewer (default: allocator MB over time). '''
+    for name, (ts, values) in sorted(counterSeries(table, cat).items()):
+        file_path = os.path.join(output_dir, "%s-%s.csv" % (prefix, toFileName(name)))
+        with open(file_path, "w") as f:
+            for t, val in zip((ts / 1000000.0).tolist(), (values * scale).tolist()):
+                f.write("%lf, %lf\n" % (t, val))
+        print file_path
+
+#--------------------------------------------------------------------#
+
+class MemoryUsage(object):
+    def __init__(self, step, allocator, start, peak, high_water):
+        self.step = step
+        self.allocator = allocator
+        self.start = start              # Bytes in use when the step started
+        self.peak = peak                # Max bytes in use during the step
+        self.high_water = high_water    # Max bytes in use up to the end of the step
+
+#--------------------------------------------------------------------#
+
+def memoryUsage(table, windows = None):
+    ''' Per-step allocator usage from the "Memory" counters. '''
+    if windows is None:
+        windows = stepWindows(table)
+    res = []
+    for allocator, (ts, values) in sorted(counterSeries(table, "Memory").items()):
+        running_max = np.maximum.accumulate(values)
+        for step, (t0, t1) in enumerate(windows):
+            lo = np.searchsorted(ts, t0)
+            hi = np.searchsorted(ts, t1)
+            # The value in effect at t0 was set by the last sample before it:
+            start = values[lo - 1] if lo > 0 else 0.0
+            peak = max(values[lo:hi].max() if hi > lo else start, start)
+            high_water = max(running_max[hi - 1] if hi > 0 else 0.0, start)
+            res.append(MemoryUsage(step, allocator, start, peak, high_water))
+    return res
+
+#--------------------------------------------------------------------#
+
+def generateMemoryReport(table, output_dir, memory_limit = None, windows = None):
+    ''' MEM-<allocator>.csv series and the per-step peak and high-water of every allocator.
+        If memory_limit (bytes) is given, also how much headroom the high-water mark leaves. '''
+    writeCounterSeries(table, output_dir)
+    MB = float(1 << 20)
+    columns = [("Step", 5), ("Allocator", 30), ("Start (MB)", 10), ("Peak (MB)", 10), ("High-water (MB)", 15), ("Headroom (MB)", 13)]
+    rows = []
+    for usage in memoryUsage(table, windows):
+        headroom = "%.1lf" % ((memory_limit - usage.high_water) / MB) if memory_limit else "---"
+        rows.append([usage.step, usage.allocator, "%.1lf" % (usage.start / MB), "%.1lf" % (usage.peak / MB),
+                     "%.1lf" % (usage.high_water / MB), headroom])
+    writeReport(columns, rows, os.path.join(output_dir, "memory.csv"), max_screen_rows = len(rows))
+
+#--------------------------------------------------------------------#
+
+def tensorName(name):
+    ''' Canonical name of a tensor: graph inputs refer to output 0 as "node", tensor objects as "node:0". '''
+    name = name.lstrip("^")
+    return name[:-2] if name.endswith(":0") else name
+
+#--------------------------------------------------------------------#
+
+def jobName(device):
+    ''' "<job>:<task>" of a device name, like the src/dst jobs of analyze_verbs.RequestInfo. '''
+    m = JOB_TASK.match(device)
+    return "%s:%s" % (m.group(1), m.group(2)) if m else "local"
+
+#--------------------------------------------------------------------#
+
+def matchFlows(table):
+    ''' (src, dst): indices of the matched flow start ("s") and flow end ("t"/"f") events of the trace. '''
+    flow_starts = np.nonzero(table.mask(ph = "s") & (table.id != NO_EVENT_ID))[0]
+    flow_ends = np.nonzero((table.mask(ph = "t") | table.mask(ph = "f")) & (table.id != NO_EVENT_ID))[0]
+    flow_starts = flow_starts[np.argsort(table.id[flow_starts], kind = "mergesort")]
+    pos = np.searchsorted(table.id[flow_starts], table.id[flow_ends]).clip(0, max(len(flow_starts) - 1, 0))
+    matched = (table.id[flow_starts[pos]] == table.id[flow_ends]) if len(flow_starts) else np.zeros(len(flow_ends), dtype = bool)
+    return flow_starts[pos[matched]], flow_ends[matched]
+
+#--------------------------------------------------------------------#
+
+def _flowOps(table, flows, complete):
+    ''' The complete event each flow event is bound to: the last one on the same (pid, tid) that started at or
+        before it (the op a flow start leaves from, or the op a flow end arrives at). -1 if there is none. '''
+    if (len(flows) == 0) or (len(complete) == 0):
+        return np.full(len(flows), -1, dtype = np.int64)
+    threads, _ = groupIds(np.append(table.pid[complete], table.pid[flows]), np.append(table.tid[complete], table.tid[flows]))
+    ts = np.append(table.ts[complete], table.ts[flows])
+    keys = threads * (ts.max() - ts.min() + 1) + (ts - ts.min())
+    op_keys = keys[:len(complete)]
+    order = np.argsort(op_keys, kind = "mergesort")
+    pos = np.searchsorted(op_keys[order], keys[len(complete):], side = "right") - 1
+    found = (pos >= 0) & (threads[:len(complete)][order[pos.clip(0)]] == threads[len(complete):])
+    return np.where(found, complete[order[pos.clip(0)]], -1)
+
+#--------------------------------------------------------------------#
+
+def flowProducers(table):
+    ''' For every event of the table, the index of its latest-ending producer along the flow events
+        (an op on another device whose output it consumed), or -1 if it has no incoming flow. '''
+    complete = np.nonzero(table.mask(ph = "X") & (table.dur > 0))[0]
+    src, dst = matchFlows(table)
+    producers = _flowOps(table, src, complete)
+    consumers = _flowOps(table, dst, complete)
+    valid = (producers >= 0) & (consumers >= 0) & (producers != consumers)
+    producers = producers[valid]
+    consumers = consumers[valid]
+    order = np.lexsort((table.end()[producers], consumers))
+    res = np.full(len(table), -1, dtype = np.int64)
+    res[consumers[order]] = producers[order]    # The latest-ending producer of each consumer is assigned last
+    return res
+
+#--------------------------------------------------------------------#
+
+class TensorTransfers(object):
+    ''' Cross-device tensor transfers, from the flow events ("s" -> "t"/"f") TF emits from the producer of a tensor
+        to its consumer on another device. Latency is from the tensor's creation to the start of the consumer.
+        Size is the requested_bytes of the tensor's object snapshot, or 0 if the trace has none. '''
+    
+    def __init__(self, table):
+        src, dst = matchFlows(table)
+        
+        self.name_id = table.name_id[dst]
+        self.src_pid = table.pid[src]
+        self.dst_pid = table.pid[dst]
+        self.start = table.ts[src]
+        self.end = table.ts[dst]
+        self.latency = self.end - self.start
+        
+        # Tensor sizes by canonical name:
+        snapshots = table.mask(ph = "O")
+        sizes = {}
+        for name_id, size in zip(table.name_id[snapshots].tolist(), table.value[snapshots].tolist()):
+            name = tensorName(table.names[name_id])
+            sizes[name] = max(sizes.get(name, 0), size)
+        unique_ids, inverse = np.unique(self.name_id, return_inverse = True)
+        self.size = np.array([sizes.get(tensorName(table.names[i]), 0) for i in unique_ids.tolist()], dtype = np.float64)[inverse]
+        
+        self.names = table.names
+        devices = TraceDevices(table)
+        self.jobs = dict((pid, jobName(devices.deviceName(pid))) for pid in np.unique(np.append(self.src_pid, self.dst_pid)).tolist())
+    
+    # -------------------------------------------------------------------- #
+    
+    def __len__(self):
+        return len(self.start)
+    
+    # -------------------------------------------------------------------- #
+    
+    def _aggregate(self, ids, num_groups):
+        stats = groupStats(ids, num_groups, self.latency, (50, 99))
+        stats["bytes"] = np.bincount(ids, weights = self.size, minlength = num_groups)
+        stats["size"] = stats["bytes"] / np.maximum(stats["count"], 1)
+        return stats
+    
+    # -------------------------------------------------------------------- #
+    
+    def byTensor(self):
+        ''' ([tensor name], {stat: array}) '''
+        ids, first = groupIds(self.name_id)
+        return [self.names[i] for i in self.name_id[first].tolist()], self._aggregate(ids, len(first))
+    
+    # -------------------------------------------------------------------- #
+    
+    def byJobPair(self):
+        ''' ([(src job, dst job)], {stat: array}) '''
+        job_names = sorted(set(self.jobs.values()))
+        pids = np.array(sorted(self.jobs.keys()), dtype = np.int64)
+        pid_jobs = np.array([job_names.index(self.jobs[pid]) for pid in pids.tolist()], dtype = np.int64)
+        src_ids = pid_jobs[np.searchsorted(pids, self.src_pid)]
+        dst_ids = pid_jobs[np.searchsorted(pids, self.dst_pid)]
+        ids, first = groupIds(src_ids, dst_ids)
+        return [(job_names[src_ids[i]], job_names[dst_ids[i]]) for i in first.tolist()], self._aggregate(ids, len(first))
+
+#--------------------------------------------------------------------#
+
+def generateTransferReport(table, output_dir, max_screen_rows = 30):
+    ''' Per-tensor and per job pair transfer latency and size, from the trace alone (transport independent). '''
+    transfers = TensorTransfers(table)
+    
+    names, stats = transfers.byTensor()
+    order = np.argsort(-stats["total"], kind = "mergesort")
+    columns = [("Tensor", 80), ("Count", 6), ("Size", 10), ("Avg (us)", 10), ("P50 (us)", 10), ("P99 (us)", 10), ("Min (us)", 10), ("Max (us)", 10)]
+    rows = []
+    for i in order.tolist():
+        rows.append([names[i], stats["count"][i], "0x%x" % stats["size"][i], "%.1lf" % stats["mean"][i],
+                     "%.1lf" % stats["p50"][i], "%.1lf" % stats["p99"][i], "%.0lf" % stats["min"][i], "%.0lf" % stats["max"][i]])
+    writeReport(columns, rows, os.path.join(output_dir, "tensor_transfers.csv"), max_screen_rows)
+    
+    pairs, stats = transfers.byJobPair()
+    columns = [("Src", 12), ("Dst", 12), ("Count", 6), ("Bytes", 12), ("Avg (us)", 10), ("P50 (us)", 10), ("P99 (us)", 10), ("Max (us)", 10)]
+    rows = []
+    for i, (src, dst) in enumerate(pairs):
+        rows.append([src, dst, stats["count"][i], "%.0lf" % stats["bytes"][i], "%.1lf" % stats["mean"][i],
+                     "%.1lf" % stats["p50"][i], "%.1lf" % stats["p99"][i], "%.0lf" % stats["max"][i]])
+    writeReport(columns, rows, os.path.join(output_dir, "job_transfers.csv"), max_screen_rows = len(rows))
+    print "Total tensors: %u" % len(names)
+    print "Total transfers: %u" % len(transfers)
+    return transfers
+
+#--------------------------------------------------------------------#
+
+def describeEvent(table, devices, i):
+    return "%s (%s) @%s" % (table.nodeName(i), table.names[table.name_id[i]], devices.deviceName(table.pid[i]))
+
+#--------------------------------------------------------------------#
+
+class CriticalPathSegment(object):
+    def __init__(self, event, wait):
+        self.event = event  # Index into the trace table
+        self.wait = wait    # Gap between the predecessor's end and this event's start
+
+#--------------------------------------------------------------------#
+
+class CriticalPathFinder(object):
+    ''' Walks back from the last event of a window along its dependencies: to the latest-ending producer
+        of its incoming flow events, or, for an op with no incoming flow, to the last event that finished
+        before it started (a time heuristic, which can't tell a dependency from an unrelated event). '''
+    
+    def __init__(self, table):
+        indices = np.nonzero(table.mask(ph = "X") & (table.dur > 0))[0]
+        ends = table.end()[indices]
+        order = np.argsort(ends, kind = "mergesort")
+        self._indices = indices[order]
+        self._ends = ends[order]
+        self._starts = table.ts[self._indices]
+        self._positions = np.full(len(table), -1, dtype = np.int64)
+        self._positions[self._indices] = np.arange(len(self._indices))
+        producers = flowProducers(table)
+        self._producers = np.where(producers >= 0, self._positions[producers.clip(0)], -1)
+    
+    # -------------------------------------------------------------------- #
+    
+    def path(self, t0, t1):
+        ''' Critical path of the window [t0, t1) as segments in time order. '''
+        current = np.searchsorted(self._ends, t1, side = "right") - 1
+        path = []
+        while (current >= 0) and (self._ends[current] > t0):
+            start = self._starts[current]
+            pred = self._producers[self._indices[current]]
+            if not (0 <= pred < current):   # No incoming flow (or one that ended after this op, which would loop)
+                pred = np.searchsorted(self._ends, start, side = "right") - 1
+            if (pred < 0) or (self._ends[pred] <= t0):
+                path.append(CriticalPathSegment(self._indices[current], max(start - t0, 0)))
+                break
+            path.append(CriticalPathSegment(self._indices[current], max(start - self._ends[pred], 0)))
+            current = pred
+        path.reverse()
+        return path
+
+#--------------------------------------------------------------------#
+
+class IdleGap(object):
+    def __init__(self, step, device, start, end, waited_on):
+        self.step = step
+        self.device = device
+        self.start = start
+        self.end = end
+        self.waited_on = waited_on # Index into the trace table of the event waited on, or None
+    
+    # -------------------------------------------------------------------- #
+    
+    def duration(self):
+        return self.end - self.start
+
+#--------------------------------------------------------------------#
+
+def gpuIdleGaps(table, windows = None):
+    ''' Gaps between the compute events of every GPU, sorted by duration within each step.
+        A gap is attributed to the latest-ending flow producer of the ops that end it. If they have no incoming
+        flow, it falls back to the last event elsewhere (other devices, or transfers on the GPU itself) that
+        finished inside it, which is only a time heuristic. '''
+    if windows is None:
+        windows = stepWindows(table)
+    devices = TraceDevices(table)
+    complete = table.mask(ph = "X") & (table.dur > 0)
+    is_comm = devices.communicationMask(table)
+    ends = table.end()
+    producers = flowProducers(table)
+    
+    res = []
+    for device, pids in devices.pidsByDevice(table.pid[complete]):
+        if not devices.isGpu(pids[0]):
+            continue
+        gpu_compute = complete & np.in1d(table.pid, pids) & ~is_comm
+        others = np.nonzero(complete & ~gpu_compute)[0]
+        others = others[np.argsort(ends[others], kind = "mergesort")]
+        other_ends = ends[others]
+        compute = np.nonzero(gpu_compute)[0]
+        compute = compute[np.argsort(table.ts[compute], kind = "mergesort")]
+        compute_starts = table.ts[compute]
+        compute_ends = ends[compute]
+        max_dur = (compute_ends - compute_starts).max() if len(compute) else 0
+        for step, (t0, t1) in enumerate(windows):
+            lo = np.searchsorted(compute_starts, t0 - max_dur)
+            hi = np.searchsorted(compute_starts, t1)
+            starts = np.maximum(compute_starts[lo:hi], t0)
+            stops = np.minimum(compute_ends[lo:hi], t1)
+            valid = stops > starts
+            busy_starts, busy_ends = mergeIntervals(starts[valid], stops[valid])
+            gap_starts = np.append(t0, busy_ends)
+            gap_ends = np.append(busy_starts, t1)
+            keep = gap_ends > gap_starts
+            gap_starts = gap_starts[keep]
+            gap_ends = gap_ends[keep]
+            last = np.searchsorted(other_ends, gap_ends, side = "right") - 1
+            found = (last >= 0) & (other_ends[last.clip(0)] > gap_starts) if len(others) else np.zeros(len(last), dtype = bool)
+            # Ops starting when each gap ends, and their latest-ending producer:
+            first = np.searchsorted(compute_starts, gap_ends, side = "left")
+            after = np.searchsorted(compute_starts, gap_ends, side = "right")
+            for k in np.argsort(gap_starts - gap_ends, kind = "mergesort").tolist():
+                waited_on = others[last[k]] if found[k] else None
+                flow = producers[compute[first[k]:after[k]]]
+                flow = flow[flow >= 0]
+                if len(flow):
+                    waited_on = flow[np.argmax(ends[flow])]
+                res.append(IdleGap(step, device, gap_starts[k], gap_ends[k], waited_on))
+    return res
+
+#--------------------------------------------------------------------#
+
+def generateStallReport(table, output_dir, max_gaps = 10, windows = None):
+    ''' Ranked GPU idle gaps with the op waited on, and the critical path of every step. '''
+    if windows is None:
+        windows = stepWindows(table)
+    devices = TraceDevices(table)
+    
+    columns = [("Step", 5), ("Device", 45), ("Rank", 4), ("Start (us)", 10), ("Idle (us)", 10), ("Waited on", 80)]
+    rows = []
+    ranks = {}
+    for gap in gpuIdleGaps(table, windows):
+        rank = ranks.get((gap.step, gap.device), 0) + 1
+        ranks[(gap.step, gap.device)] = rank
+        if rank > max_gaps:
+            continue
+        waited_on = describeEvent(table, devices, gap.waited_on) if gap.waited_on is not None else "---"
+        rows.append([gap.step, gap.device, rank, gap.start - windows[gap.step][0], gap.duration(), waited_on])
+    writeReport(columns, rows, os.path.join(output_dir, "gpu_idle_gaps.csv"), max_screen_rows = len(rows))
+    
+    columns = [("Step", 5), ("Start (us)", 10), ("Duration (us)", 13), ("Wait (us)", 9), ("Event", 80)]
+    rows = []
+    summary_columns = [("Step", 5), ("Device", 50), ("Time on path (us)", 17), ("Path %", 6)]
+    summary_rows = []
+    finder = CriticalPathFinder(table)
+    for step, (t0, t1) in enumerate(windows):
+        path = finder.path(t0, t1)
+        per_device = {}
+        for segment in path:
+            event = segment.event
+            device = devices.deviceName(table.pid[event])
+            per_device[device] = per_device.get(device, 0) + table.dur[event]
+            rows.append([step, table.ts[event] - t0, table.dur[event], segment.wait, describeEvent(table, devices, event)])
+        per_device["Wait"] = sum(segment.wait for segment in path)
+        for device, time_on_path in sorted(per_device.items(), key = lambda item: -item[1]):
+            summary_rows.append([step, device, time_on_path, "%.1lf" % (time_on_path * 100.0 / max(t1 - t0, 1))])
+    writeReport(columns, rows, os.path.join(output_dir, "critical_path.csv"), max_screen_rows = 0)
+    writeReport(summary_columns, summary_rows, os.path.join(output_dir, "critical_path_summary.csv"), max_screen_rows = len(summary_rows))
+
+#--------------------------------------------------------------------#
+
+def findTraceFiles(logs_dir):
+    ''' [(label, path)] of the trace_<job>_<task>.json files of a step, ordered by job and task. '''
+    res = []
+    for file_name in os.listdir(logs_dir):
+        m = TRACE_FILE_NAME.match(file_name)
+        if m:
+            res.append(((m.group(1), int(m.group(2))), "%s_%s" % (m.group(1), m.group(2)), os.path.join(logs_dir, file_name)))
+    return [(label, path) for _, label, path in sorted(res)]
+
+#--------------------------------------------------------------------#
+
+class WorkerSteps(object):
+    def __init__(self, label, path, windows, complete = None):
+        self.label = label
+        self.path = path
+        self.windows = windows
+        if complete is None:
+            complete = [True] * len(windows)
+        self.durations = [t1 - t0 for (t0, t1), is_complete in zip(windows, complete) if is_complete]  # Of the complete steps
+
+#--------------------------------------------------------------------#
+
+def _analyzeWorkerTrace(args):
+    label, path, use_cache = args
+    steps = detectSteps(TraceTable.fromFile(path, use_cache))
+    return WorkerSteps(label, path, steps.windows(), steps.complete.tolist())
+
+#--------------------------------------------------------------------#
+
+def analyzeWorkers(logs_dir, num_processes = None, use_cache = True):
+    ''' Step windows of every trace file in a step's logs directory, one trace per pool process. '''
+    tasks = [(label, path, use_cache) for label, path in findTraceFiles(logs_dir)]
+    if (num_processes == 1) or (len(tasks) <= 1):
+        return map(_analyzeWorkerTrace, tasks)
+    pool = multiprocessing.Pool(num_processes)
+    try:
+        return pool.map(_analyzeWorkerTrace, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+#--------------------------------------------------------------------#
+
+def generateSkewReport(workers, output_dir):
+    ''' Per step: the slowest worker and how far behind the others it is. '''
+    num_steps = max([len(worker.durations) for worker in workers] or [0])
+    times_slowest = dict((worker.label, 0) for worker in workers)
+    
+    columns = [("Step", 5), ("Slowest", 12), ("Duration (us)", 13), ("Median (us)", 11), ("Fastest (us)", 12),
+               ("Behind median (us)", 18), ("Skew (us)", 10), ("Skew %", 6)]
+    rows = []
+    for step in xrange(num_steps):
+        step_workers = [worker for worker in workers if step < len(worker.durations)]
+        durations = np.array([worker.durations[step] for worker in step_workers])
+        slowest = int(np.argmax(durations))
+        median = np.median(durations)
+        skew = durations.max() - durations.min()
+        times_slowest[step_workers[slowest].label] += 1
+        rows.append([step, step_workers[slowest].label, durations[slowest], "%.0lf" % median, durations.min(),
+                     "%.0lf" % (durations[slowest] - median), skew, "%.1lf" % (skew * 100.0 / max(durations.min(), 1))])
+    writeReport(columns, rows, os.path.join(output_dir, "worker_skew.csv"), max_screen_rows = len(rows))
+    
+    columns = [("Worker", 12), ("Steps", 5), ("Mean step (us)", 14), ("Max step (us)", 13), ("Times slowest", 13), ("Trace", 60)]
+    rows = []
+    for worker in workers:
+        durations = np.array(worker.durations or [0])
+        rows.append([worker.label, len(worker.durations), "%.0lf" % durations.mean(), durations.max(), times_slowest[worker.label], worker.path])
+    writeReport(columns, rows, os.path.join(output_dir, "worker_summary.csv"), max_screen_rows = len(rows))
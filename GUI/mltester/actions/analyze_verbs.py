@@ -4,13 +4,29 @@ Created on Jun 26, 2018
 @author: eladw
 '''
 
+import heapq
 import os
 import sys
-from commonpylib.monitors.measurement import StatsValue
+from itertools import izip
+import numpy as np
+from commonpylib.util import toFileName
+from mltester.actions.analysis_util import alignClocks, estimateClockOffset, groupStats, groupHistograms, mergeIntervals, writeReport
+from mltester.actions.timeline_file import TIMELINE_FORMAT_BINARY, createTimelineWriter
+from mltester.actions.verbs_table import VerbsTable
+
+# Request size buckets (bytes), a factor of 4 apart:
+SIZE_BUCKETS = [1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24]
+
+LATENCY_PERCENTILES = (50, 90, 99, 99.9)
+
+# RDMA_QUEUE_DEPTH that TFCnnBenchmarksStep sets for grpc+verbs (per peer connection):
+DEFAULT_QUEUE_DEPTH = 1024
 
 #--------------------------------------------------------------------#
 
 class ProcessInfo(object):
+    __slots__ = ["job", "replica", "task", "device"]
+
     def __init__(self, s):
         parts = s.split("/")
         self.job        = parts[1].split(":")[1]
@@ -20,20 +36,31 @@ class ProcessInfo(object):
 
 #--------------------------------------------------------------------#
 
+_processes = {}
+
+def getProcessInfo(s):
+    ''' The ProcessInfo of a device name, shared by all the requests from or to it. '''
+    process = _processes.get(s)
+    if process is None:
+        process = _processes[s] = ProcessInfo(s)
+    return process
+
+#--------------------------------------------------------------------#
+
 class RequestInfo(object):
+    __slots__ = ["src", "dst", "name"]
+
     def __init__(self, key):
         parts = key.split(";") 
-        self.src = ProcessInfo(parts[0])
-        self.dst = ProcessInfo(parts[2])
+        self.src = getProcessInfo(parts[0])
+        self.dst = getProcessInfo(parts[2])
         self.name = parts[3]
-        self.size = None
-        self.start_ts = {}
-        self.done_ts = {}
-        self.latency = StatsValue()
 
 #--------------------------------------------------------------------#
 
 class TimelineSample(object):
+    __slots__ = ["start", "end", "label"]
+
     def __init__(self, start, end, label):
         self.start = start
         self.end = end
@@ -42,115 +69,503 @@ class TimelineSample(object):
 #--------------------------------------------------------------------#
 
 class Timeline(object):
-    def __init__(self, file_path):
+    __slots__ = ["index", "last_ts", "file"]
+
+    def __init__(self, file_path_base, timeline_format, index = 0):
+        self.index = index
         self.last_ts = 0
-        self.file = open(file_path, "w")
+        self.file = createTimelineWriter(file_path_base, timeline_format)
 
 #--------------------------------------------------------------------#
 
 class TimelineList(object):
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, timeline_format = TIMELINE_FORMAT_BINARY):
         self._output_dir = output_dir
         self._file_prefix = os.path.join(output_dir, "TL_verbs_")
+        self._timeline_format = timeline_format
         self._timelines = []
+        self._busy = []     # Heap of (last_ts, index) of the timelines in use
+        self._free = []     # Heap of the indices of the timelines that are free
     
     def _addNew(self):
-        file_path = self._file_prefix + "_%03u.csv" % len(self._timelines)
-        tl = Timeline(file_path)
+        tl = Timeline(self._file_prefix + "_%03u" % len(self._timelines), self._timeline_format, len(self._timelines))
         self._timelines.append(tl)
-        print "Created a new timeline: %s" % file_path
+        print "Created a new timeline: %s" % tl.file.file_path
         return tl
     
     def _find(self, start_ts):
-        for tl in self._timelines:
-            if start_ts >= tl.last_ts:
-                return tl
+        ''' The first timeline whose last sample ended by start_ts. Start times must not decrease between calls,
+            so a timeline that becomes free stays free until it is used. '''
+        while self._busy and (self._busy[0][0] <= start_ts):
+            heapq.heappush(self._free, heapq.heappop(self._busy)[1])
+        if self._free:
+            return self._timelines[heapq.heappop(self._free)]
         return self._addNew()
     
-    def generate(self, samples):
-        samples = sorted(samples, key=lambda x: x.start)
+    def generate(self, samples, is_sorted = False):
+        ''' samples may be any iterable if is_sorted (by start). '''
+        if not is_sorted:
+            samples = sorted(samples, key=lambda x: x.start)
         for sample in samples:
             tl = self._find(sample.start)
-            tl.file.write("%lf, 0, %s\n" % (sample.start, sample.label))
-            tl.file.write("%lf, 1\n" % (sample.start))
-            tl.file.write("%lf, 1\n" % (sample.end))
-            tl.file.write("%lf, 0\n" % (sample.end))
+            tl.file.add(sample.start, sample.end, sample.label)
             tl.last_ts = sample.end
+            heapq.heappush(self._busy, (tl.last_ts, tl.index))
+        for tl in self._timelines:
+            tl.file.close()
 
 #--------------------------------------------------------------------#
 
-def generateTimelines(requests, output_dir):
-    tls = TimelineList(output_dir)
-    samples = []
-    for request in requests.values():
-        for key, start_ts in request.start_ts.iteritems():
-            done_ts = request.done_ts[key]
-            label = request.name
-            samples.append(TimelineSample(start_ts, done_ts, label))
-    tls.generate(samples)
+def generateTimelines(table, output_dir, timeline_format = TIMELINE_FORMAT_BINARY):
+    tls = TimelineList(output_dir, timeline_format)
+    names = [RequestInfo(key).name for key in table.keys.strings]
+    # One sample at a time, in start order, rather than an object per request:
+    order = np.argsort(table.start, kind = "mergesort")
+    samples = (TimelineSample(start, done, names[key_id])
+               for start, done, key_id in izip(table.start[order].tolist(), table.done[order].tolist(), table.key_id[order].tolist()))
+    tls.generate(samples, is_sorted = True)
 
 #--------------------------------------------------------------------#
 
-def generateReport(requests, output_dir):
+def _sizeLabel(num_bytes):
+    for unit, shift in [("M", 20), ("K", 10)]:
+        if num_bytes >= (1 << shift):
+            return "%u%s" % (num_bytes >> shift, unit)
+    return "%u" % num_bytes
+
+#--------------------------------------------------------------------#
+
+def sizeBuckets(sizes):
+    ''' (SIZE_BUCKETS bucket of every size, bucket labels) '''
+    labels = ["<%s" % _sizeLabel(SIZE_BUCKETS[0])] + \
+             ["%s-%s" % (_sizeLabel(lo), _sizeLabel(hi)) for lo, hi in zip(SIZE_BUCKETS[:-1], SIZE_BUCKETS[1:])] + \
+             [">=%s" % _sizeLabel(SIZE_BUCKETS[-1])]
+    return np.searchsorted(SIZE_BUCKETS, sizes, side = "right"), labels
+
+#--------------------------------------------------------------------#
+
+def jobTask(process):
+    return "%s:%u" % (process.job, process.task)
+
+#--------------------------------------------------------------------#
+
+def _latencyColumns():
+    return [("Mean (us)", 10), ("Min (us)", 9)] + [("p%s (us)" % q, 10) for q in LATENCY_PERCENTILES] + [("Max (us)", 9)]
+
+def _latencyValues(stats, i):
+    return ["%.1lf" % stats[stat][i] for stat in ["mean", "min"] + ["p%s" % q for q in LATENCY_PERCENTILES] + ["max"]]
+
+#--------------------------------------------------------------------#
+
+def _frequentKeys(table, min_steps):
+    ''' Keys with at least min_steps completed requests (rarely sent tensors say little about the steady state). '''
+    counts = np.bincount(table.key_id, minlength = len(table.keys))
+    return np.nonzero(counts >= min_steps)[0]
+
+#--------------------------------------------------------------------#
+
+def generateReport(table, output_dir, min_steps = 110, max_screen_rows = 30):
+    ''' Per-tensor request latency (exact percentiles), slowest p99 first. '''
+    stats = groupStats(table.key_id, len(table.keys), table.latency * 1000000.0, LATENCY_PERCENTILES)
+    # Size of the last completed request of each key:
+    last_size = np.zeros(len(table.keys), dtype = np.int64)
+    last_size[table.key_id] = table.size
+    key_ids = sorted(_frequentKeys(table, min_steps).tolist(), key = lambda key_id: -stats["p99"][key_id])
+    
+    columns = [("Tensor", 60), ("Src", 8), ("Dst", 8), ("Requests", 8), ("Size", 10)] + _latencyColumns()
+    rows = []
     total_latency = 0.0
-    for request in requests.values():
-        num_steps = len(request.start_ts)
-        if num_steps < 110:
-            continue
-        latency = request.latency
-        total_latency += latency.avg
-        print "(%3u) %-80s [%6s ==> %-6s] Size: 0x%-8x Avg: %.6f Min: %.6f Max: %.6f" % (num_steps, request.name, request.src.job, request.dst.job,
-                                                                                           request.size, latency.avg, latency.min, latency.max)
-    print "Total tensors: %u" % len(requests) 
+    for key_id in key_ids:
+        request = RequestInfo(table.keys[key_id])
+        total_latency += stats["mean"][key_id] / 1000000.0
+        rows.append([request.name, jobTask(request.src), jobTask(request.dst), stats["count"][key_id], last_size[key_id]] + _latencyValues(stats, key_id))
+    writeReport(columns, rows, os.path.join(output_dir, "verbs_latency.csv"), max_screen_rows)
+    print "Total tensors: %u" % len(table.keys) 
     print "Total latency: %.6f" % total_latency
 
 #--------------------------------------------------------------------#
 
+def _writeHistograms(name_column, names, histograms, csv_path):
+    ''' One row per histogram, with the bins that are used by any of them. '''
+    if not histograms:
+        writeReport([name_column, ("Requests", 8)], [], csv_path, max_screen_rows = 0)
+        return
+    counts = np.array([hist.counts for hist in histograms])
+    used = np.nonzero(counts.sum(axis = 0))[0]
+    used = np.arange(used[0], used[-1] + 1) if len(used) else used
+    labels = histograms[0].labels()
+    columns = [name_column, ("Requests", 8)] + [("%s us" % labels[i], 12) for i in used.tolist()]
+    rows = [[name, counts[row].sum()] + counts[row][used].tolist() for row, name in enumerate(names)]
+    writeReport(columns, rows, csv_path, max_screen_rows = 0)
+
+#--------------------------------------------------------------------#
+
+def generateHistogramReport(table, output_dir, min_steps = 110):
+    ''' Latency by request size bucket, and log-scale latency histograms per tensor and per size bucket. '''
+    latency = table.latency * 1000000.0
+    bucket, labels = sizeBuckets(table.size)
+    stats = groupStats(bucket, len(labels), latency, LATENCY_PERCENTILES)
+    used = np.nonzero(stats["count"])[0].tolist()
+    columns = [("Size", 10), ("Requests", 8)] + _latencyColumns()
+    rows = [[labels[i], stats["count"][i]] + _latencyValues(stats, i) for i in used]
+    writeReport(columns, rows, os.path.join(output_dir, "verbs_size_latency.csv"), max_screen_rows = len(rows))
+    
+    histograms = groupHistograms(bucket, len(labels), latency)
+    _writeHistograms(("Size", 10), [labels[i] for i in used], [histograms[i] for i in used], os.path.join(output_dir, "verbs_size_histogram.csv"))
+    key_ids = _frequentKeys(table, min_steps).tolist()
+    histograms = groupHistograms(table.key_id, len(table.keys), latency)
+    _writeHistograms(("Tensor", 60), [RequestInfo(table.keys[key_id]).name for key_id in key_ids], [histograms[key_id] for key_id in key_ids],
+                     os.path.join(output_dir, "verbs_histogram.csv"))
+
+#--------------------------------------------------------------------#
+
+def requestBandwidth(table):
+    ''' Gb/s of every request: its size over its latency. '''
+    return table.size * 8.0 / table.latency / 1e9
+
+#--------------------------------------------------------------------#
+
+def jobPairs(table):
+    ''' (src -> dst job pair id of every request, ["src:task->dst:task"]) '''
+    key_pairs = []
+    for key in table.keys.strings:
+        request = RequestInfo(key)
+        key_pairs.append("%s->%s" % (jobTask(request.src), jobTask(request.dst)))
+    pairs = sorted(set(key_pairs))
+    key_pair_ids = np.array([pairs.index(pair) for pair in key_pairs] or [0], dtype = np.int64)
+    return key_pair_ids[table.key_id], pairs
+
+#--------------------------------------------------------------------#
+
+def linkSeries(start, done, size, bin_width = 0.001):
+    ''' Bytes in flight (averaged over each bin) and bytes completed by the end of each bin, for requests with the
+        given start/done times (seconds) and sizes. Returns (bin ends, in flight, completed). '''
+    if len(start) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    t0 = np.floor(start.min() / bin_width) * bin_width
+    num_bins = int(np.ceil((done.max() - t0) / bin_width)) or 1
+    edges = t0 + np.arange(num_bins + 1) * bin_width
+    
+    # Bytes in flight is a step function: +size at start, -size at done. Its integral is piecewise linear,
+    # so interpolating it at the bin edges is exact:
+    times = np.concatenate([start, done])
+    order = np.argsort(times, kind = "mergesort")
+    times = times[order]
+    level = np.cumsum(np.concatenate([size, -size]).astype(np.float64)[order])
+    integral = np.concatenate([[0.0], np.cumsum(level[:-1] * np.diff(times))])
+    in_flight = np.diff(np.interp(edges, times, integral)) / bin_width
+    completed = np.cumsum(np.histogram(done, bins = edges, weights = size)[0])
+    return edges[1:], in_flight, completed
+
+#--------------------------------------------------------------------#
+
+def writeLinkSeries(table, output_dir, bin_width = 0.001):
+    ''' Per job pair, for the graph viewer: VDTA-<pair>.csv, Mbit completed so far (the viewer plots its rate, like the
+        RDTA/TDTA monitors), VINF-<pair>.csv, MB in flight, and VREQ-<pair>.csv, requests in flight. '''
+    pair_ids, pairs = jobPairs(table)
+    for pair_id, pair in enumerate(pairs):
+        mask = pair_ids == pair_id
+        ts, in_flight, completed = linkSeries(table.start[mask], table.done[mask], table.size[mask], bin_width)
+        _, requests_in_flight, _ = linkSeries(table.start[mask], table.done[mask], np.ones(np.count_nonzero(mask)), bin_width)
+        for prefix, values in [("VDTA", completed * 8.0 / 1e6), ("VINF", in_flight / float(1 << 20)), ("VREQ", requests_in_flight)]:
+            file_path = os.path.join(output_dir, "%s-%s.csv" % (prefix, toFileName(pair.replace("->", "-"))))
+            with open(file_path, "w") as f:
+                for t, val in zip(ts.tolist(), values.tolist()):
+                    f.write("%lf, %lf\n" % (t, val))
+            print file_path
+
+#--------------------------------------------------------------------#
+
+def _bandwidthColumns():
+    return [("Requests", 8), ("MB", 10), ("Mean latency (us)", 17), ("p50 BW (Gb/s)", 13), ("p10 BW (Gb/s)", 13)]
+
+def _bandwidthValues(latency_stats, bandwidth_stats, num_bytes, i):
+    return [latency_stats["count"][i], "%.1lf" % (num_bytes[i] / float(1 << 20)), "%.1lf" % latency_stats["mean"][i],
+            "%.3lf" % bandwidth_stats["p50"][i], "%.3lf" % bandwidth_stats["p10"][i]]
+
+#--------------------------------------------------------------------#
+
+def generateBandwidthReport(table, output_dir, link_bandwidth = None, bin_width = 0.001):
+    ''' Per-request bandwidth by job pair and by size bucket. Per job pair also the throughput while the link had
+        requests in flight, the busiest bin, and (given link_bandwidth in Gb/s) the link utilization. Small requests
+        with low per-request bandwidth on an idle link are latency bound; a busy link near its rate is saturated. '''
+    latency = table.latency * 1000000.0
+    bandwidth = requestBandwidth(table)
+    
+    pair_ids, pairs = jobPairs(table)
+    latency_stats = groupStats(pair_ids, len(pairs), latency, ())
+    bandwidth_stats = groupStats(pair_ids, len(pairs), bandwidth, (10, 50))
+    num_bytes = np.bincount(pair_ids, weights = table.size, minlength = len(pairs))
+    columns = [("Link", 24)] + _bandwidthColumns() + [("Busy %", 6), ("Busy BW (Gb/s)", 14), ("Peak BW (Gb/s)", 14), ("Utilization %", 13)]
+    rows = []
+    for pair_id, pair in enumerate(pairs):
+        mask = pair_ids == pair_id
+        busy_starts, busy_ends = mergeIntervals(table.start[mask], table.done[mask])
+        busy = (busy_ends - busy_starts).sum()
+        span = table.done[mask].max() - table.start[mask].min()
+        busy_bandwidth = num_bytes[pair_id] * 8.0 / busy / 1e9 if busy else 0.0
+        _, _, completed = linkSeries(table.start[mask], table.done[mask], table.size[mask], bin_width)
+        peak_bandwidth = np.diff(np.concatenate([[0.0], completed])).max() * 8.0 / bin_width / 1e9
+        utilization = "%.1lf" % (num_bytes[pair_id] * 8.0 / span / 1e9 * 100.0 / link_bandwidth) if link_bandwidth and span else "---"
+        rows.append([pair] + _bandwidthValues(latency_stats, bandwidth_stats, num_bytes, pair_id) +
+                    ["%.1lf" % (busy * 100.0 / span if span else 0.0), "%.3lf" % busy_bandwidth, "%.3lf" % peak_bandwidth, utilization])
+    writeReport(columns, rows, os.path.join(output_dir, "verbs_bandwidth.csv"), max_screen_rows = len(rows))
+    
+    bucket, labels = sizeBuckets(table.size)
+    latency_stats = groupStats(bucket, len(labels), latency, ())
+    bandwidth_stats = groupStats(bucket, len(labels), bandwidth, (10, 50))
+    num_bytes = np.bincount(bucket, weights = table.size, minlength = len(labels))
+    columns = [("Size", 10)] + _bandwidthColumns()
+    rows = [[labels[i]] + _bandwidthValues(latency_stats, bandwidth_stats, num_bytes, i) for i in np.nonzero(latency_stats["count"])[0].tolist()]
+    writeReport(columns, rows, os.path.join(output_dir, "verbs_size_bandwidth.csv"), max_screen_rows = len(rows))
+
+#--------------------------------------------------------------------#
+
+def concurrencyProfile(start, done):
+    ''' Time (seconds) spent at each number of requests in flight, from the first start to the last done, and the peak.
+        A request done at the same time another starts is not counted with it. '''
+    if len(start) == 0:
+        return np.zeros(1), 0
+    times = np.concatenate([start, done])
+    deltas = np.concatenate([np.ones(len(start), dtype = np.int64), -np.ones(len(done), dtype = np.int64)])
+    order = np.lexsort((deltas, times))
+    level = np.cumsum(deltas[order])
+    return np.bincount(level[:-1], weights = np.diff(times[order]), minlength = 1), int(level.max())
+
+#--------------------------------------------------------------------#
+
+def inFlightAtStart(start, done):
+    ''' The number of requests in flight when each request starts, itself included. '''
+    return np.searchsorted(np.sort(start), start, side = "right") - np.searchsorted(np.sort(done), start, side = "right")
+
+#--------------------------------------------------------------------#
+
+def _levelPercentile(time_at, q):
+    cumulative = np.cumsum(time_at)
+    return int(np.searchsorted(cumulative, cumulative[-1] * q / 100.0)) if cumulative[-1] > 0 else 0
+
+#--------------------------------------------------------------------#
+
+def _concurrencyBuckets(in_flight, queue_depth):
+    ''' Power of 2 buckets of in-flight counts (1, 2-3, 4-7, ...), the last one from queue_depth up. Returns (ids, labels). '''
+    edges = [1 << i for i in xrange(int(np.log2(queue_depth)) + 1) if (1 << i) < queue_depth] + [queue_depth]
+    labels = ["%u" % lo if hi - lo == 1 else "%u-%u" % (lo, hi - 1) for lo, hi in zip(edges[:-1], edges[1:])] + [">=%u" % queue_depth]
+    return np.searchsorted(edges, in_flight, side = "right") - 1, labels
+
+#--------------------------------------------------------------------#
+
+def generateConcurrencyReport(table, output_dir, queue_depth = DEFAULT_QUEUE_DEPTH, max_screen_rows = 30):
+    ''' Requests in flight per job pair (one queue pair each, so queue_depth applies per pair) and in total:
+        verbs_concurrency.csv has the time-weighted distribution, the peak, and how latency correlates with the
+        in-flight count a request started with; verbs_concurrency_latency.csv has latency per in-flight bucket, and its
+        inflation over the least loaded bucket with at least 1% of the requests. Requests with a non-positive latency
+        (possible after a clock correction) aren't in flight at all, and are skipped. '''
+    if queue_depth < 1:
+        raise ValueError("Queue depth must be at least 1 (got %d)." % queue_depth)
+    valid = table.latency > 0
+    if not valid.all():
+        print "Concurrency: skipped %u requests with a non-positive latency." % np.count_nonzero(~valid)
+    pair_ids, pairs = jobPairs(table)
+    links = [(pair, valid & (pair_ids == pair_id)) for pair_id, pair in enumerate(pairs)]
+    if len(pairs) > 1:
+        links.append(("Total", valid))
+    columns = [("Link", 24), ("Requests", 8), ("Mean", 8), ("p50", 6), ("p99", 6), ("Peak", 6), ("Peak/depth %", 12),
+               ("At depth %", 10), ("Latency corr", 12)]
+    rows = []
+    bucket_rows = []
+    for link, mask in links:
+        start, latency = table.start[mask], table.latency[mask]
+        time_at, peak = concurrencyProfile(start, table.done[mask])
+        span = time_at.sum()
+        in_flight = inFlightAtStart(start, table.done[mask])
+        correlation = np.corrcoef(in_flight, latency)[0, 1] if (len(start) > 1) and (in_flight.std() > 0) and (latency.std() > 0) else None
+        rows.append([link, len(start), "%.1lf" % (np.dot(np.arange(len(time_at)), time_at) / span if span > 0 else 0.0),
+                     _levelPercentile(time_at, 50), _levelPercentile(time_at, 99), peak, "%.1lf" % (100.0 * peak / queue_depth),
+                     "%.2lf" % (100.0 * time_at[queue_depth:].sum() / span if span > 0 else 0.0),
+                     "%.3lf" % correlation if correlation is not None else "---"])
+
+        bucket_ids, labels = _concurrencyBuckets(in_flight, queue_depth)
+        stats = groupStats(bucket_ids, len(labels), latency * 1000000.0, (50, 99))
+        base = stats["p50"][np.argmax(stats["count"] >= max(1, 0.01 * len(start)))]
+        for bucket in np.nonzero(stats["count"])[0].tolist():
+            bucket_rows.append([link, labels[bucket], stats["count"][bucket], "%.1lf" % stats["p50"][bucket], "%.1lf" % stats["p99"][bucket],
+                                "%.2lf" % (stats["p50"][bucket] / base if base else 0.0)])
+    writeReport(columns, rows, os.path.join(output_dir, "verbs_concurrency.csv"), max_screen_rows)
+    writeReport([("Link", 24), ("In flight", 10), ("Requests", 8), ("p50 (us)", 10), ("p99 (us)", 10), ("Inflation", 9)], bucket_rows,
+                os.path.join(output_dir, "verbs_concurrency_latency.csv"), max_screen_rows)
+
+#--------------------------------------------------------------------#
+
+def stepStragglers(table):
+    ''' The last request to complete in each step with requests. Returns (step ids, straggler row per step, communication
+        wall time of the step: first start to last done, exposed time: how long the straggler ran after all the
+        other requests of the step were done, or since its own start if later). '''
+    if len(table) == 0:
+        empty = np.zeros(0, dtype = np.int64)
+        return empty, empty, np.zeros(0), np.zeros(0)
+    order = np.lexsort((table.done, table.step_id))
+    step_id = table.step_id[order]
+    last = np.append(np.nonzero(np.diff(step_id))[0], len(order) - 1)
+    first = np.append([0], last[:-1] + 1)
+    stragglers = order[last]
+    first_start = np.full(len(table.steps), np.inf)
+    np.minimum.at(first_start, table.step_id, table.start)
+    steps = step_id[last]
+    wall = table.done[stragglers] - first_start[steps]
+    # The others' last done is the one before the straggler in done order, if the step has other requests:
+    others_done = np.where(last > first, table.done[order[np.maximum(last - 1, 0)]], -np.inf)
+    exposed = table.done[stragglers] - np.maximum(others_done, table.start[stragglers])
+    return steps, stragglers, wall, exposed
+
+#--------------------------------------------------------------------#
+
+def generateStragglerReport(table, output_dir, max_screen_rows = 30):
+    ''' Which tensor completes last in each step, and how much of the step's communication it accounts for:
+        verbs_step_stragglers.csv per step (in time order), verbs_stragglers.csv per tensor, most frequent first. '''
+    steps, stragglers, wall, exposed = stepStragglers(table)
+    share = np.where(wall > 0, table.latency[stragglers] / np.maximum(wall, 1e-12), 0.0)
+    names = [RequestInfo(key).name for key in table.keys.strings]
+    rows = []
+    for i in np.argsort(table.done[stragglers], kind = "mergesort").tolist():
+        row = stragglers[i]
+        rows.append([table.steps[steps[i]], names[table.key_id[row]], "%.1lf" % (wall[i] * 1000000.0),
+                     "%.1lf" % (table.latency[row] * 1000000.0), "%.1lf" % (100.0 * share[i]), "%.1lf" % (exposed[i] * 1000000.0)])
+    writeReport([("Step", 20), ("Straggler", 60), ("Wall (us)", 10), ("Latency (us)", 12), ("Share %", 8), ("Exposed (us)", 12)], rows,
+                os.path.join(output_dir, "verbs_step_stragglers.csv"), 0)
+
+    key_id = table.key_id[stragglers]
+    count = np.bincount(key_id, minlength = len(table.keys))
+    total_share = np.bincount(key_id, weights = share, minlength = len(table.keys))
+    total_exposed = np.bincount(key_id, weights = exposed, minlength = len(table.keys))
+    rows = []
+    for i in sorted(np.nonzero(count)[0].tolist(), key = lambda i: (-count[i], -total_exposed[i])):
+        request = RequestInfo(table.keys[i])
+        rows.append([request.name, jobTask(request.src), jobTask(request.dst), count[i], "%.1lf" % (100.0 * count[i] / len(steps)),
+                     "%.1lf" % (100.0 * total_share[i] / count[i]), "%.1lf" % (total_exposed[i] * 1000000.0 / count[i]),
+                     "%.3lf" % (total_exposed[i] * 1000.0)])
+    writeReport([("Tensor", 60), ("Src", 8), ("Dst", 8), ("Steps", 6), ("% of steps", 10), ("Mean share %", 12), ("Mean exposed (us)", 17),
+                 ("Total exposed (ms)", 18)], rows, os.path.join(output_dir, "verbs_stragglers.csv"), max_screen_rows)
+
+#--------------------------------------------------------------------#
+
+def hostDelays(table, num_hosts):
+    ''' {(start host, done host): latency of the fastest request} between different hosts, on the hosts' own clocks. '''
+    cross = table.start_host != table.done_host
+    fastest = np.full(num_hosts * num_hosts, np.inf)
+    np.minimum.at(fastest, table.start_host[cross].astype(np.int64) * num_hosts + table.done_host[cross], table.latency[cross])
+    return dict((divmod(code, num_hosts), fastest[code]) for code in np.nonzero(np.isfinite(fastest))[0].tolist())
+
+#--------------------------------------------------------------------#
+
+def estimateHostClocks(table, hosts, offsets = None, align = True):
+    ''' {host: (offset, uncertainty)} in seconds relative to hosts[0], estimated NTP-style from the fastest request
+        in each direction between each pair of hosts; offsets ({host: usec}) given explicitly take precedence.
+        Hosts without requests in both directions to an aligned host are left out. '''
+    pair_offsets = {}
+    if align:
+        delays = hostDelays(table, len(hosts))
+        # Pairwise estimates need requests in both directions:
+        for (a, b), forward in delays.iteritems():
+            if (a < b) and ((b, a) in delays):
+                pair_offsets[(hosts[a], hosts[b])] = estimateClockOffset([forward], [delays[(b, a)]])
+    clocks = alignClocks(pair_offsets, hosts[0])
+    for host, offset in (offsets or {}).iteritems():
+        clocks[host] = (offset / 1000000.0, 0.0)
+    return clocks
+
+#--------------------------------------------------------------------#
+
+def generateClockReport(table, hosts, clocks, output_dir, max_screen_rows = 30):
+    ''' The hosts' clock offsets, and one-way request latency per (start host, done host) on the common clock, with
+        the uncertainty of the two hosts' offsets (zero within a host). '''
+    rows = []
+    for host in hosts:
+        offset, uncertainty = clocks.get(host, (0.0, 0.0))
+        rows.append([host, "%.1lf" % (offset * 1000000.0), "%.1lf" % (uncertainty * 1000000.0), "yes" if host in clocks else "no"])
+    writeReport([("Host", 20), ("Offset (us)", 12), ("+/- (us)", 10), ("Aligned", 7)], rows, os.path.join(output_dir, "verbs_clocks.csv"), max_screen_rows)
+
+    num_hosts = len(hosts)
+    pair_id = table.start_host.astype(np.int64) * num_hosts + table.done_host
+    stats = groupStats(pair_id, num_hosts * num_hosts, table.latency * 1000000.0, LATENCY_PERCENTILES)
+    rows = []
+    for code in np.nonzero(stats["count"])[0].tolist():
+        a, b = divmod(code, num_hosts)
+        uncertainty = clocks.get(hosts[a], (0.0, 0.0))[1] + clocks.get(hosts[b], (0.0, 0.0))[1] if a != b else 0.0
+        rows.append([hosts[a], hosts[b], stats["count"][code]] + _latencyValues(stats, code) + ["%.1lf" % (uncertainty * 1000000.0)])
+    writeReport([("Start host", 20), ("Done host", 20), ("Requests", 8)] + _latencyColumns() + [("+/- (us)", 10)], rows,
+                os.path.join(output_dir, "verbs_one_way.csv"), max_screen_rows)
+
+#--------------------------------------------------------------------#
+
+def _generateReports(table, output_dir, generate_report, generate_timelines, timeline_format, generate_link_series, link_bandwidth, queue_depth):
+    if generate_report:
+        generateReport(table, output_dir)
+        generateHistogramReport(table, output_dir)
+        generateBandwidthReport(table, output_dir, link_bandwidth)
+        generateConcurrencyReport(table, output_dir, queue_depth)
+        generateStragglerReport(table, output_dir)
+    if generate_timelines:
+        generateTimelines(table, output_dir, timeline_format)
+    if generate_link_series:
+        writeLinkSeries(table, output_dir)
+
+#--------------------------------------------------------------------#
+
+def mergeVerbs(host_logs,
+               output_dir,
+               offsets = None,
+               align = True,
+               generate_report = True,
+               generate_timelines = False,
+               timeline_format = TIMELINE_FORMAT_BINARY,
+               generate_link_series = False,
+               link_bandwidth = None,
+               queue_depth = DEFAULT_QUEUE_DEPTH):
+    ''' Analyzes the verbs logs of every host of a cluster together: host_logs is [(host, requests_start_file,
+        requests_done_file)], each log on its host's clock. The clocks are aligned to the first host's (see
+        estimateHostClocks) before the reports are generated. Returns (table, clocks); the table has the requests
+        with a positive latency on the common clock. '''
+    hosts = [host for host, _, _ in host_logs]
+    try:
+        table = VerbsTable.fromHosts([(start_file, done_file) for _, start_file, done_file in host_logs])
+    except ValueError as e:
+        print "Error: %s" % e
+        sys.exit(1)
+    
+    clocks = estimateHostClocks(table, hosts, offsets, align)
+    for host in hosts:
+        if host not in clocks:
+            print "Warning: %s is not aligned (no requests in both directions with an aligned host)." % host
+    table.shiftClocks([clocks.get(host, (0.0, 0.0))[0] for host in hosts])
+    generateClockReport(table, hosts, clocks, output_dir)
+    # Left in the one-way report above, as a sign of clock error; the other reports would take them for latencies:
+    num_negative = np.count_nonzero(table.latency <= 0)
+    if num_negative:
+        print "Warning: %u requests have a non-positive latency after the clock correction; they are left out of the reports." % num_negative
+        table = table.select(table.latency > 0)
+    
+    _generateReports(table, output_dir, generate_report, generate_timelines, timeline_format, generate_link_series, link_bandwidth, queue_depth)
+    return table, clocks
+
+#--------------------------------------------------------------------#
+
 def analyzeVerbs(requests_start_file,
                  requests_done_file,
                  output_dir = None,
                  generate_report = True,
-                 generate_timelines = False):
-    requests = {}
+                 generate_timelines = False,
+                 timeline_format = TIMELINE_FORMAT_BINARY,
+                 generate_link_series = False,
+                 link_bandwidth = None,
+                 queue_depth = DEFAULT_QUEUE_DEPTH):
     if output_dir is None:
         output_dir = os.path.dirname(requests_start_file)
     
-    with open(requests_start_file) as f:
-        for line in f:
-            line = line.strip()
-            parts = line.split(",")
-            ts = int(parts[0]) / 1000000.0
-            step_id = parts[1]
-            key = parts[2]
-            request = requests.get(key)
-            if not request:
-                #print "ADDED REQUEST %s" % key 
-                request = RequestInfo(key)
-                requests[key] = request
-            request.start_ts[step_id] = ts
+    try:
+        table = VerbsTable.fromFiles(requests_start_file, requests_done_file)
+    except ValueError as e:
+        print "Error: %s" % e
+        sys.exit(1)
     
-    with open(requests_done_file) as f:
-        for line in f:
-            line = line.strip()
-            parts = line.split(",")
-            ts = int(parts[0]) / 1000000.0
-            step_id = parts[1]
-            key = parts[2]
-            size = int(parts[3], 16)
-            request = requests.get(key)
-            if not request:
-                print "Error at %s: request was not started." % key
-                sys.exit(1)
-            
-            latency = ts - request.start_ts[step_id] 
-            if latency <= 0:
-                print "Error at %s: latency is not a positive number." % key
-                sys.exit(1)
-            request.done_ts[step_id] = ts
-            request.latency.update(latency)
-            request.size = size
-    
-    if generate_report:
-        generateReport(requests, output_dir)
-    if generate_timelines:
-        generateTimelines(requests, output_dir)
+    _generateReports(table, output_dir, generate_report, generate_timelines, timeline_format, generate_link_series, link_bandwidth, queue_depth)
+    return table
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import struct
+import numpy as np
+
+# Binary timeline (.tl) layout, all little endian:
+#   header:  magic "MLTL", uint32 version, uint64 number of records, uint64 number of labels
+#   records: (float64 start, float64 end, int32 label id), packed - memory-mappable
+#   labels:  utf-8 label strings, each prefixed by its uint32 length in bytes
+#            (version 1 separated them by "\n" instead, which labels containing "\n" broke)
+TIMELINE_MAGIC = "MLTL"
+TIMELINE_VERSION = 2
+TIMELINE_HEADER = struct.Struct("<4sIQQ")
+TIMELINE_LABEL_LENGTH = struct.Struct("<I")
+TIMELINE_RECORD = np.dtype([("start", "<f8"), ("end", "<f8"), ("label", "<i4")])
+
+TIMELINE_FORMAT_BINARY = "tl"
+TIMELINE_FORMAT_CSV = "csv"
+TIMELINE_FORMATS = [TIMELINE_FORMAT_BINARY, TIMELINE_FORMAT_CSV]
+
+#--------------------------------------------------------------------#
+
+class TimelineWriter(object):
+    ''' Writes (start, end, label) samples to a binary timeline file. Times are in seconds. '''
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, "wb")
+        self._file.write(TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, 0, 0))
+        self._labels = []
+        self._label_ids = {}
+        self._starts = []
+        self._ends = []
+        self._label_col = []
+        self._count = 0
+
+    # -------------------------------------------------------------------- #
+
+    def _labelId(self, label):
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = len(self._labels)
+            self._label_ids[label] = label_id
+            self._labels.append(label)
+        return label_id
+
+    # -------------------------------------------------------------------- #
+
+    def _writeRecords(self, starts, ends, label_ids):
+        records = np.empty(len(starts), dtype = TIMELINE_RECORD)
+        records["start"] = starts
+        records["end"] = ends
+        records["label"] = label_ids
+        self._file.write(records.tostring())
+        self._count += len(records)
+
+    # -------------------------------------------------------------------- #
+
+    def _flush(self):
+        if self._starts:
+            self._writeRecords(self._starts, self._ends, self._label_col)
+            self._starts, self._ends, self._label_col = [], [], []
+
+    # -------------------------------------------------------------------- #
+
+    def add(self, start, end, label):
+        self._starts.append(start)
+        self._ends.append(end)
+        self._label_col.append(self._labelId(label))
+        if len(self._starts) >= TimelineWriter.CHUNK_SIZE:
+            self._flush()
+
+    # -------------------------------------------------------------------- #
+
+    def addMany(self, starts, ends, label_ids, labels):
+        ''' Bulk add. label_ids index into labels (e.g. the names of a TraceTable). '''
+        self._flush()
+        unique_ids, inverse = np.unique(label_ids, return_inverse = True)
+        local_ids = np.array([self._labelId(labels[i]) for i in unique_ids.tolist()], dtype = np.int32)
+        self._writeRecords(starts, ends, local_ids[inverse])
+
+    # -------------------------------------------------------------------- #
+
+    def close(self):
+        self._flush()
+        for label in self._labels:
+            label = label.encode("utf-8") if isinstance(label, unicode) else label
+            self._file.write(TIMELINE_LABEL_LENGTH.pack(len(label)))
+            self._file.write(label)
+        self._file.seek(0)
+        self._file.write(TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, self._count, len(self._labels)))
+        self._file.close()
+
+#--------------------------------------------------------------------#
+
+class CsvTimelineWriter(object):
+    ''' Writes samples in the legacy csv format: 4 rows per sample, the square wave the viewer draws. '''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, "w")
+
+    # -------------------------------------------------------------------- #
+
+    def add(self, start, end, label):
+        self._file.write("%lf, 0, %s\n" % (start, label))
+        self._file.write("%lf, 1\n" % (start))
+        self._file.write("%lf, 1\n" % (end))
+        self._file.write("%lf, 0\n" % (end))
+
+    # -------------------------------------------------------------------- #
+
+    def addMany(self, starts, ends, label_ids, labels):
+        for start, end, label_id in zip(np.asarray(starts).tolist(), np.asarray(ends).tolist(), np.asarray(label_ids).tolist()):
+            self.add(start, end, labels[label_id])
+
+    # -------------------------------------------------------------------- #
+
+    def close(self):
+        self._file.close()
+
+#--------------------------------------------------------------------#
+
+def createTimelineWriter(file_path_base, timeline_format = TIMELINE_FORMAT_BINARY):
+    ''' Creates a writer for file_path_base + ".tl" or ".csv". '''
+    if timeline_format == TIMELINE_FORMAT_BINARY:
+        return TimelineWriter(file_path_base + ".tl")
+    if timeline_format == TIMELINE_FORMAT_CSV:
+        return CsvTimelineWriter(file_path_base + ".csv")
+    raise ValueError("Unknown timeline format: %s (expected one of %s)." % (timeline_format, ", ".join(TIMELINE_FORMATS)))
+
+#--------------------------------------------------------------------#
+
+class TimelineFile(object):
+    ''' Read-only view of a binary timeline file. The records are memory-mapped. '''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            header = f.read(TIMELINE_HEADER.size)
+            if len(header) < TIMELINE_HEADER.size:
+                raise ValueError("%s is not a timeline file." % file_path)
+            magic, version, count, num_labels = TIMELINE_HEADER.unpack(header)
+            if magic != TIMELINE_MAGIC:
+                raise ValueError("%s is not a timeline file." % file_path)
+            if version not in [1, TIMELINE_VERSION]:
+                raise ValueError("%s: unsupported timeline version %u." % (file_path, version))
+            f.seek(TIMELINE_HEADER.size + count * TIMELINE_RECORD.itemsize)
+            labels = f.read()
+        self.labels = TimelineFile._readLabels(labels, version) if num_labels else []
+        if len(self.labels) != num_labels:
+            raise ValueError("%s: %u labels instead of the %u in the header." % (file_path, len(self.labels), num_labels))
+        if count:
+            self.records = np.memmap(file_path, dtype = TIMELINE_RECORD, mode = "r", offset = TIMELINE_HEADER.size, shape = (count,))
+        else:
+            self.records = np.zeros(0, dtype = TIMELINE_RECORD)
+        self.start = self.records["start"]
+        self.end = self.records["end"]
+        self.label = self.records["label"]
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def _readLabels(data, version):
+        if version == 1:
+            return data.decode("utf-8").split("\n")
+        labels = []
+        pos = 0
+        while pos + TIMELINE_LABEL_LENGTH.size <= len(data):
+            length, = TIMELINE_LABEL_LENGTH.unpack_from(data, pos)
+            pos += TIMELINE_LABEL_LENGTH.size
+            if pos + length > len(data):
+                break   # Truncated, caught by the label count check
+            labels.append(data[pos:pos + length].decode("utf-8"))
+            pos += length
+        return labels
+
+    # -------------------------------------------------------------------- #
+
+    def __len__(self):
+        return len(self.records)
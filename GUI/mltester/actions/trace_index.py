@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import numpy as np
+
+from mltester.actions.trace_table import StringTable, TraceTable
+
+#--------------------------------------------------------------------#
+
+class TraceIndex(object):
+    ''' Sidecar directory (<trace>.idx) holding the trace table columns sorted by (pid, ts) as .npy files.
+        The columns are memory-mapped, and a window query binary-searches the time range of each process,
+        so it only touches the pages of the rows it returns. '''
+
+    VERSION = 1
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.columns = dict((col, np.load(os.path.join(index_dir, col + ".npy"), mmap_mode = "r")) for col in TraceTable.COLUMNS)
+        self.names = StringTable(meta["names"])
+        self.categories = StringTable(meta["categories"])
+        self.processes = dict((int(pid), pname) for pid, pname in meta["processes"].iteritems())
+        self.pids = np.array(meta["pids"], dtype = np.int32)          # Distinct pids, sorted
+        self.offsets = np.array(meta["offsets"], dtype = np.int64)    # Rows of pids[i] are offsets[i]:offsets[i + 1]
+        self.max_dur = np.array(meta["max_dur"], dtype = np.int64)    # Longest event of pids[i]
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def indexPath(file_path):
+        return file_path + ".idx"
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def _meta(index_dir):
+        try:
+            with open(os.path.join(index_dir, "meta.json")) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def build(table, index_dir, source_size = 0):
+        ''' Writes the index of a table. The directory is replaced atomically. '''
+        order = np.lexsort((table.ts, table.pid))
+        pids = table.pid[order]
+        pid_values, offsets = np.unique(pids, return_index = True)
+        offsets = np.append(offsets, len(pids))
+        durs = table.dur[order]
+        max_dur = [int(durs[offsets[i]:offsets[i + 1]].max()) for i in xrange(len(pid_values))]
+
+        tmp_dir = index_dir + ".tmp"
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.mkdir(tmp_dir)
+        for col in TraceTable.COLUMNS:
+            np.save(os.path.join(tmp_dir, col + ".npy"), getattr(table, col)[order])
+        meta = {"version": TraceIndex.VERSION,
+                "source_size": source_size,
+                "names": table.names.strings,
+                "categories": table.categories.strings,
+                "processes": dict((str(pid), pname) for pid, pname in table.processes.iteritems()),
+                "pids": pid_values.tolist(),
+                "offsets": offsets.tolist(),
+                "max_dur": max_dur}
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir)
+        os.rename(tmp_dir, index_dir)
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def fromFile(file_path, use_cache = True):
+        ''' Opens the index of a trace file, building it (and the .npz table cache) first if it is missing or stale. '''
+        index_dir = TraceIndex.indexPath(file_path)
+        source_size = os.path.getsize(file_path)
+        meta = TraceIndex._meta(index_dir)
+        is_valid = (meta is not None) and (meta.get("version") == TraceIndex.VERSION) and (meta.get("source_size") == source_size) and \
+                   (os.path.getmtime(os.path.join(index_dir, "meta.json")) >= os.path.getmtime(file_path))
+        if not is_valid:
+            TraceIndex.build(TraceTable.fromFile(file_path, use_cache), index_dir, source_size)
+        return TraceIndex(index_dir)
+
+    # -------------------------------------------------------------------- #
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    # -------------------------------------------------------------------- #
+
+    def timeRange(self, pid):
+        ''' (first start, last start) of the events of a process. '''
+        i = np.searchsorted(self.pids, pid)
+        ts = self.columns["ts"]
+        return int(ts[self.offsets[i]]), int(ts[self.offsets[i + 1] - 1])
+
+    # -------------------------------------------------------------------- #
+
+    def devicePids(self, devices):
+        ''' The pids whose process name contains one of devices (e.g. "GPU:0"). '''
+        return [pid for pid in self.pids.tolist() if any(device in self.processes.get(pid, "") for device in devices)]
+
+    # -------------------------------------------------------------------- #
+
+    def query(self, t0 = None, t1 = None, pids = None):
+        ''' TraceTable of the events that overlap [t0, t1) on the given pids (default: all), in (pid, ts) order. '''
+        ts = self.columns["ts"]
+        dur = self.columns["dur"]
+        rows = []
+        for i, pid in enumerate(self.pids.tolist()):
+            if (pids is not None) and (pid not in pids):
+                continue
+            first, last = self.offsets[i], self.offsets[i + 1]
+            lo = first if t0 is None else first + np.searchsorted(ts[first:last], t0 - self.max_dur[i])
+            hi = last if t1 is None else first + np.searchsorted(ts[first:last], t1)
+            if lo >= hi:
+                continue
+            in_range = np.arange(lo, hi)
+            if t0 is not None:
+                window_ts = ts[lo:hi]
+                in_range = in_range[(window_ts + dur[lo:hi] > t0) | (window_ts >= t0)]
+            rows.append(in_range)
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype = np.int64)
+        columns = dict((col, np.asarray(self.columns[col][rows])) for col in TraceTable.COLUMNS)
+        return TraceTable(columns, self.names, self.categories, self.processes)
@@ -0,0 +1,246 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from mltester.actions.analysis_util import estimateClockOffset, alignClocks
+from mltester.actions.analyze_trace import TraceDevices, TensorTransfers, jobName
+from mltester.actions.trace_reader import iterTraceEvents, createTrace
+from mltester.actions.trace_table import TraceTable
+
+#--------------------------------------------------------------------#
+
+def _labelHost(label):
+    ''' "worker_1" (a findTraceFiles label) -> "worker:1", the jobName of the worker's own devices. '''
+    job, _, task = label.rpartition("_")
+    return "%s:%s" % (job, task) if job else label
+
+#--------------------------------------------------------------------#
+
+class _TraceSource(object):
+    ''' The processes of one input trace and the merged processes / hosts they map to. '''
+
+    def __init__(self, index, label, path, table):
+        self.index = index
+        self.label = label
+        self.path = path
+        self.processes = dict(table.processes)
+        devices = TraceDevices(table)
+        self.hosts = {}
+        for pid in np.unique(np.append(table.pid, table.processes.keys()).astype(np.int64)).tolist():
+            host = jobName(devices.deviceName(pid))
+            self.hosts[pid] = host if host != "local" else _labelHost(label)
+        self.thread_names = {}
+
+    # -------------------------------------------------------------------- #
+
+    def mergedProcessName(self, pid):
+        ''' Processes of a job (/job:...) are shared by all the traces that ran ops on it, e.g. a parameter server;
+            local lanes (streams, memcpy, allocators) are per trace. '''
+        pname = self.processes.get(pid, "pid_%d" % pid)
+        return pname if pname.startswith("/job:") else "%s %s" % (self.label, pname)
+
+#--------------------------------------------------------------------#
+
+class TraceMerger(object):
+    ''' Merges the traces of all the workers of a step into one chrome trace on a common clock.
+        Every host (job:task) gets an offset relative to the first trace's worker, estimated NTP-style from the
+        fastest flow (producer -> consumer) in each direction between each pair of hosts; offsets given explicitly,
+        e.g. from timestamps taken at launch, take precedence. Each trace is cut into time-sorted runs in a temporary
+        directory, and the runs are k-way merged, at most MAX_FAN_IN at a time, so neither memory nor the number of
+        open files grows with the number of workers. '''
+
+    RUN_SIZE = 1 << 18
+    MAX_FAN_IN = 64
+
+    def __init__(self, traces, offsets = None, align = True, use_cache = True):
+        ''' traces: [(label, path)] as returned by findTraceFiles. offsets: {host: usec} to force. '''
+        if not traces:
+            raise ValueError("No traces to merge.")
+        self._sources = []
+        delays = {}
+        for index, (label, path) in enumerate(traces):
+            table = TraceTable.fromFile(path, use_cache)
+            source = _TraceSource(index, label, path, table)
+            self._sources.append(source)
+            if align:
+                transfers = TensorTransfers(table)
+                for src_pid, dst_pid, latency in zip(transfers.src_pid.tolist(), transfers.dst_pid.tolist(), transfers.latency.tolist()):
+                    pair = (source.hosts.get(src_pid), source.hosts.get(dst_pid))
+                    if pair[0] != pair[1]:
+                        delays[pair] = min(delays.get(pair, latency), latency)
+
+        # Pairwise estimates need flows in both directions:
+        pair_offsets = {}
+        for (a, b), forward in delays.iteritems():
+            if (a < b) and ((b, a) in delays):
+                pair_offsets[(a, b)] = estimateClockOffset([forward], [delays[(b, a)]])
+        self.reference = _labelHost(traces[0][0])
+        self.clocks = alignClocks(pair_offsets, self.reference)
+        for host, offset in (offsets or {}).iteritems():
+            self.clocks[host] = (float(offset), 0.0)
+        self.hosts = sorted(set(host for source in self._sources for host in source.hosts.values()))
+        self.count = 0
+        self._threads = {}  # merged pid -> {(trace index, pid, tid): merged tid}
+        self._num_runs = 0
+
+    # -------------------------------------------------------------------- #
+
+    def offset(self, host):
+        ''' usec to subtract from the timestamps of a host (0 for hosts that could not be aligned). '''
+        return int(round(self.clocks.get(host, (0.0, 0.0))[0]))
+
+    # -------------------------------------------------------------------- #
+
+    def _mergedPids(self):
+        names = []
+        for source in self._sources:
+            for pid in sorted(source.hosts.keys()):
+                name = source.mergedProcessName(pid)
+                if name not in names:
+                    names.append(name)
+        return dict((name, i) for i, name in enumerate(names))
+
+    # -------------------------------------------------------------------- #
+
+    def _mergedTid(self, merged_pid, source, pid, tid):
+        ''' Threads of different traces that land in the same merged process (a shared /job: process) are kept apart by
+            numbering the (trace, thread) pairs of every merged process densely, in the order they are first seen. '''
+        threads = self._threads.setdefault(merged_pid, {})
+        key = (source.index, pid, tid)
+        merged_tid = threads.get(key)
+        if merged_tid is None:
+            merged_tid = threads[key] = len(threads)
+        return merged_tid
+
+    # -------------------------------------------------------------------- #
+
+    def _metadata(self, merged_pids):
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}} for name, pid in sorted(merged_pids.items(), key = lambda item: item[1])]
+        for merged_pid, threads in sorted(self._threads.items()):
+            for (index, pid, tid), merged_tid in sorted(threads.items(), key = lambda item: item[1]):
+                source = self._sources[index]
+                thread_name = source.thread_names.get((pid, tid), str(tid))
+                events.append({"name": "thread_name", "ph": "M", "pid": merged_pid, "tid": merged_tid,
+                               "args": {"name": "%s %s" % (source.label, thread_name)}})
+        return events
+
+    # -------------------------------------------------------------------- #
+
+    def _newRun(self, tmp_dir):
+        self._num_runs += 1
+        return os.path.join(tmp_dir, "run_%u" % self._num_runs)
+
+    # -------------------------------------------------------------------- #
+
+    def _writeRun(self, events, tmp_dir):
+        events.sort(key = lambda event: event["ts"])
+        run_path = self._newRun(tmp_dir)
+        with open(run_path, "wb") as f:
+            for event in events:
+                f.write("%s\t%s\n" % (json.dumps(event["ts"]), json.dumps(event)))
+        return run_path
+
+    # -------------------------------------------------------------------- #
+
+    def _splitRuns(self, source, merged_pids, tmp_dir):
+        ''' Rewrites the events of one trace (pids, tids, flow ids, clock) into sorted runs. '''
+        num_sources = len(self._sources)
+        runs = []
+        events = []
+        for event in iterTraceEvents(source.path):
+            pid = event.get("pid")
+            if event.get("ph") == "M":
+                if (event.get("name") == "thread_name") and ("tid" in event):
+                    source.thread_names[(pid, event["tid"])] = event.get("args", {}).get("name", "")
+                continue
+            if "ts" not in event:
+                continue
+            if pid in source.hosts:
+                event["pid"] = merged_pids[source.mergedProcessName(pid)]
+                event["ts"] = event["ts"] - self.offset(source.hosts[pid])
+            if "tid" in event:
+                event["tid"] = self._mergedTid(event["pid"], source, pid, event["tid"])
+            if "id" in event:
+                flow_id = event["id"]
+                event["id"] = flow_id * num_sources + source.index if isinstance(flow_id, (int, long)) else "%s:%u" % (flow_id, source.index)
+            events.append(event)
+            if len(events) >= TraceMerger.RUN_SIZE:
+                runs.append(self._writeRun(events, tmp_dir))
+                events = []
+        if events:
+            runs.append(self._writeRun(events, tmp_dir))
+        return runs
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def _readRun(run_path):
+        with open(run_path, "rb") as f:
+            for line in f:
+                ts, _, event = line.partition("\t")
+                yield float(ts), event.rstrip("\n")
+
+    # -------------------------------------------------------------------- #
+
+    def _mergeRuns(self, runs, tmp_dir):
+        ''' Merges groups of MAX_FAN_IN runs into longer runs until at most MAX_FAN_IN are left. '''
+        while len(runs) > TraceMerger.MAX_FAN_IN:
+            merged_runs = []
+            for i in xrange(0, len(runs), TraceMerger.MAX_FAN_IN):
+                group = runs[i:i + TraceMerger.MAX_FAN_IN]
+                if len(group) == 1:
+                    merged_runs += group
+                    continue
+                run_path = self._newRun(tmp_dir)
+                with open(run_path, "wb") as f:
+                    for ts, event in heapq.merge(*[TraceMerger._readRun(run) for run in group]):
+                        f.write("%s\t%s\n" % (json.dumps(ts), event))
+                for run in group:
+                    os.remove(run)
+                merged_runs.append(run_path)
+            runs = merged_runs
+        return runs
+
+    # -------------------------------------------------------------------- #
+
+    def write(self, output_file_path, tmp_dir = None):
+        ''' Writes the merged trace (compressed if output_file_path ends with .gz/.zst). Returns the number of events. '''
+        merged_pids = self._mergedPids()
+        self._threads = {}
+        self._num_runs = 0
+        tmp_dir = tempfile.mkdtemp(prefix = "trace_merge_", dir = tmp_dir)
+        try:
+            runs = []
+            for source in self._sources:
+                runs += self._splitRuns(source, merged_pids, tmp_dir)
+            runs = self._mergeRuns(runs, tmp_dir)
+            count = 0
+            with createTrace(output_file_path) as f:
+                f.write('{"traceEvents": [')
+                for event in self._metadata(merged_pids):
+                    f.write(",\n" if count else "\n")
+                    f.write(json.dumps(event))
+                    count += 1
+                for _, line in heapq.merge(*[TraceMerger._readRun(run) for run in runs]):
+                    f.write(",\n" if count else "\n")
+                    f.write(line)
+                    count += 1
+                f.write("\n]}\n")
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.count = count
+        return count
+
+#--------------------------------------------------------------------#
+
+def mergeTraces(traces, output_file_path, offsets = None, align = True, use_cache = True):
+    ''' Merges [(label, path)] traces into output_file_path. Returns the TraceMerger (for its clock offsets). '''
+    merger = TraceMerger(traces, offsets, align, use_cache)
+    merger.write(output_file_path)
+    return merger
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import codecs
+import gzip
+import json
+import re
+
+GZIP_MAGIC = "\x1f\x8b"
+ZSTD_MAGIC = "\x28\xb5\x2f\xfd"
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+#--------------------------------------------------------------------#
+
+def openTrace(file_path):
+    ''' Opens a chrome trace for reading. Handles .json, .json.gz and .json.zst. '''
+    with open(file_path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(file_path, "rb")
+    if magic == ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("Reading %s requires the zstandard package (pip install zstandard)." % file_path)
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"))
+    return open(file_path, "rb")
+
+#--------------------------------------------------------------------#
+
+def createTrace(file_path):
+    ''' Opens a chrome trace for writing. Compresses according to the file extension. '''
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "wb")
+    if file_path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("Writing %s requires the zstandard package (pip install zstandard)." % file_path)
+        return zstandard.ZstdCompressor().stream_writer(open(file_path, "wb"))
+    return open(file_path, "wb")
+
+#--------------------------------------------------------------------#
+
+class TraceEventReader(object):
+    ''' Incremental parser of a chrome trace.
+        Only one event (plus one read chunk) is held in memory at a time. '''
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, f, chunk_size = CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    # -------------------------------------------------------------------- #
+
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + self._utf8.decode(chunk)
+        self._pos = 0
+        return True
+
+    # -------------------------------------------------------------------- #
+
+    def _skipWhitespace(self):
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or not self._fill():
+                return
+
+    # -------------------------------------------------------------------- #
+
+    def _peek(self):
+        self._skipWhitespace()
+        if self._pos >= len(self._buf):
+            raise ValueError("Unexpected end of trace file.")
+        return self._buf[self._pos]
+
+    # -------------------------------------------------------------------- #
+
+    def _expect(self, c):
+        if self._peek() != c:
+            raise ValueError("Expected '%s' at trace offset %u, got '%s'." % (c, self._pos, self._buf[self._pos]))
+        self._pos += 1
+
+    # -------------------------------------------------------------------- #
+
+    def _decode(self):
+        self._skipWhitespace()
+        while True:
+            try:
+                # A value that ends exactly at the end of the buffer may be a truncated number:
+                val, end = self._decoder.raw_decode(self._buf, self._pos)
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return val
+            except ValueError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    # -------------------------------------------------------------------- #
+
+    def _events(self):
+        self._expect("[")
+        if self._peek() == "]":
+            return
+        while True:
+            yield self._decode()
+            c = self._peek()
+            self._pos += 1
+            if c == "]":
+                return
+            if c != ",":
+                raise ValueError("Expected ',' or ']' at trace offset %u, got '%s'." % (self._pos - 1, c))
+
+    # -------------------------------------------------------------------- #
+
+    def __iter__(self):
+        # Both {"traceEvents": [...], ...} and a bare [...] are valid chrome traces:
+        if self._peek() == "[":
+            for event in self._events():
+                yield event
+            return
+
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._decode()
+            self._expect(":")
+            if key == "traceEvents":
+                for event in self._events():
+                    yield event
+                return
+            self._decode() # Skip other top-level values (e.g. displayTimeUnit)
+            c = self._peek()
+            self._pos += 1
+            if c == "}":
+                return
+
+#--------------------------------------------------------------------#
+
+def iterTraceEvents(file_path):
+    ''' Yields the traceEvents of a (possibly compressed) chrome trace one at a time. '''
+    with openTrace(file_path) as f:
+        for event in TraceEventReader(f):
+            yield event
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import heapq
+import os
+import numpy as np
+
+from mltester.actions.analysis_util import writeReport
+from mltester.actions.analyze_trace import COMMUNICATION_OPS, detectSteps, jobName
+
+# Bytes per element of the TF dtypes that carry tensors between jobs:
+DTYPE_SIZES = {"DT_FLOAT": 4, "DT_HALF": 2, "DT_BFLOAT16": 2, "DT_DOUBLE": 8, "DT_INT8": 1, "DT_UINT8": 1,
+               "DT_INT16": 2, "DT_UINT16": 2, "DT_INT32": 4, "DT_INT64": 8, "DT_BOOL": 1, "DT_COMPLEX64": 8}
+
+#--------------------------------------------------------------------#
+
+def _parseValue(val):
+    val = val.strip()
+    if val.startswith('"') and val.endswith('"'):
+        return val[1:-1].decode("string_escape")
+    return val
+
+#--------------------------------------------------------------------#
+
+def iterGraphNodes(graph_file_path):
+    ''' Yields the nodes of a text GraphDef (graph.txt of tf_cnn_benchmarks --graph_file) one at a time.
+        A message is a dict of field -> [values]; nested messages are dicts too. '''
+    stack = []
+    with open(graph_file_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.endswith("{"):
+                message = {}
+                if not stack:
+                    if line[:-1].strip() != "node":
+                        message = None # versions, library, ...
+                elif stack[-1] is None:
+                    message = None
+                else:
+                    stack[-1].setdefault(line[:-1].strip().rstrip(":").strip(), []).append(message)
+                stack.append(message)
+            elif line == "}":
+                message = stack.pop()
+                if not stack and (message is not None):
+                    yield message
+            elif stack and (stack[-1] is not None):
+                key, _, val = line.partition(":")
+                stack[-1].setdefault(key.strip(), []).append(_parseValue(val))
+
+#--------------------------------------------------------------------#
+
+def _attr(node, key):
+    for attr in node.get("attr", []):
+        if attr.get("key") == [key]:
+            return attr["value"][0]
+    return None
+
+#--------------------------------------------------------------------#
+
+class GraphNode(object):
+    def __init__(self, message):
+        self.name = message["name"][0]
+        self.op = message.get("op", [""])[0]
+        self.device = message.get("device", [""])[0]
+        self.inputs = message.get("input", [])
+        dtype = None
+        for key in ["T", "dtype"]:
+            val = _attr(message, key)
+            if (val is not None) and ("type" in val):
+                dtype = val["type"][0].replace("_REF", "")
+                break
+        self.output_bytes = []
+        shapes = _attr(message, "_output_shapes")
+        for shape in (shapes["list"][0].get("shape", []) if shapes and ("list" in shapes) else []):
+            dims = [int(dim.get("size", ["0"])[0]) for dim in shape.get("dim", [])]
+            known = ("unknown_rank" not in shape) and all(dim >= 0 for dim in dims)
+            self.output_bytes.append(int(np.prod(dims)) * DTYPE_SIZES.get(dtype, 4) if known else 0)
+
+    # -------------------------------------------------------------------- #
+
+    def outputBytes(self, slot):
+        return self.output_bytes[slot] if slot < len(self.output_bytes) else 0
+
+#--------------------------------------------------------------------#
+
+def readGraph(graph_file_path):
+    return [GraphNode(message) for message in iterGraphNodes(graph_file_path) if "name" in message]
+
+#--------------------------------------------------------------------#
+
+def _splitInput(name):
+    ''' (node, output slot, is control dependency) of a graph input. '''
+    if name.startswith("^"):
+        return name[1:], 0, True
+    node, _, slot = name.partition(":")
+    return node, int(slot) if slot else 0, False
+
+#--------------------------------------------------------------------#
+
+class SimulationConditions(object):
+    def __init__(self, bandwidth = 25.0, latency = 0.0, workers = 1, compute_scale = 1.0):
+        self.bandwidth = bandwidth          # Gb/s of every job's link
+        self.latency = latency              # Extra usec per transfer
+        self.workers = workers              # Workers sharing each parameter server
+        self.compute_scale = compute_scale  # Compute speedup (2 = ops take half the time)
+
+#--------------------------------------------------------------------#
+
+class SimulationResult(object):
+    def __init__(self, step_time, transfers, transfer_bytes, unscheduled):
+        self.step_time = step_time              # usec
+        self.transfers = transfers              # Number of cross-job edges
+        self.transfer_bytes = transfer_bytes
+        self.unscheduled = unscheduled          # Nodes never ready (cycles, missing inputs)
+
+#--------------------------------------------------------------------#
+
+class StepSimulator(object):
+    ''' Replays one step of a graph: every node runs for its traced duration once its inputs have arrived.
+        GPUs run one op at a time; other devices run ops in parallel. A tensor that crosses jobs is queued on the
+        link of the (src, dst) job pair, and a parameter server's link is shared by all the workers. '''
+
+    def __init__(self, nodes, durations, default_job = "worker:0"):
+        ''' durations: node name -> usec per step. '''
+        self._nodes = nodes
+        index = dict((node.name, i) for i, node in enumerate(nodes))
+        self._jobs = [jobName(node.device) if node.device.startswith("/job:") else default_job for node in nodes]
+        self._serial = ["GPU" in node.device.upper() for node in nodes]
+        self._durations = np.array([durations.get(node.name, 0.0) for node in nodes], dtype = np.float64)
+        self._is_comm = np.array([COMMUNICATION_OPS.match(node.op) is not None for node in nodes], dtype = bool)
+        # Edges: node -> [(consumer, bytes)]
+        self._consumers = [[] for _ in nodes]
+        self._num_inputs = np.zeros(len(nodes), dtype = np.int64)
+        for i, node in enumerate(nodes):
+            for name in node.inputs:
+                src_name, slot, is_control = _splitInput(name)
+                src = index.get(src_name)
+                if src is None:
+                    continue
+                self._consumers[src].append((i, 0 if is_control else nodes[src].outputBytes(slot)))
+                self._num_inputs[i] += 1
+
+    # -------------------------------------------------------------------- #
+
+    def run(self, conditions):
+        durations = np.where(self._is_comm, self._durations, self._durations / conditions.compute_scale)
+        usec_per_byte = 8.0 / (conditions.bandwidth * 1000.0)
+        pending = self._num_inputs.copy()
+        ready_time = np.zeros(len(self._nodes))
+        device_free = {}
+        link_free = {}
+        transfers = 0
+        transfer_bytes = 0
+        step_time = 0.0
+
+        ready = [(0.0, i) for i in np.nonzero(pending == 0)[0].tolist()]
+        heapq.heapify(ready)
+        scheduled = 0
+        while ready:
+            t, i = heapq.heappop(ready)
+            if self._serial[i]:
+                device = self._nodes[i].device
+                t = max(t, device_free.get(device, 0.0))
+                device_free[device] = t + durations[i]
+            finish = t + durations[i]
+            step_time = max(step_time, finish)
+            scheduled += 1
+            for consumer, num_bytes in self._consumers[i]:
+                arrival = finish
+                src_job, dst_job = self._jobs[i], self._jobs[consumer]
+                if src_job != dst_job:
+                    sharing = conditions.workers if (src_job.startswith("ps:") or dst_job.startswith("ps:")) else 1
+                    link = (src_job, dst_job)
+                    start = max(finish, link_free.get(link, 0.0))
+                    link_free[link] = start + num_bytes * usec_per_byte * sharing
+                    arrival = link_free[link] + conditions.latency
+                    transfers += 1
+                    transfer_bytes += num_bytes
+                ready_time[consumer] = max(ready_time[consumer], arrival)
+                pending[consumer] -= 1
+                if pending[consumer] == 0:
+                    heapq.heappush(ready, (ready_time[consumer], consumer))
+        return SimulationResult(step_time, transfers, transfer_bytes, len(self._nodes) - scheduled)
+
+#--------------------------------------------------------------------#
+
+def traceDurations(table):
+    ''' node name -> traced usec per step, from the op lanes (/job:... processes; stream and memcpy lanes
+        repeat the same nodes as GPU kernels). '''
+    op_pids = [pid for pid, pname in table.processes.iteritems() if pname.startswith("/job:")]
+    mask = table.mask(ph = "X", pid = op_pids) & (table.node_id >= 0)
+    num_steps = max(len(detectSteps(table)), 1)
+    totals = np.bincount(table.node_id[mask], weights = table.dur[mask], minlength = len(table.names))
+    return dict((table.names[i], totals[i] / num_steps) for i in np.nonzero(totals)[0].tolist())
+
+#--------------------------------------------------------------------#
+
+class ThroughputPrediction(object):
+    def __init__(self, measured_step_time, base, what_if, images_per_step_base, images_per_step_what_if):
+        self.measured_step_time = measured_step_time
+        self.base = base                # SimulationResult under the measured conditions
+        self.what_if = what_if          # SimulationResult under the changed conditions
+        # The replay ignores framework overheads; scale it to the measured step time:
+        self.calibration = measured_step_time / base.step_time if base.step_time else 1.0
+        self.predicted_step_time = what_if.step_time * self.calibration
+        self.base_images_per_sec = images_per_step_base * 1000000.0 / measured_step_time if measured_step_time else 0.0
+        self.predicted_images_per_sec = images_per_step_what_if * 1000000.0 / self.predicted_step_time if self.predicted_step_time else 0.0
+
+#--------------------------------------------------------------------#
+
+def predictThroughput(table, nodes, base, what_if, batch_size):
+    ''' Replays a step of the graph under the measured (base) and changed (what_if) conditions.
+        images/sec counts batch_size images per GPU of the graph, per worker. '''
+    steps = detectSteps(table)
+    measured_step_time = float(np.median(steps.completeDurations())) if steps.numComplete() else 0.0
+    simulator = StepSimulator(nodes, traceDurations(table))
+    num_gpus = max(len(set(node.device for node in nodes if "GPU" in node.device.upper())), 1)
+    return ThroughputPrediction(measured_step_time, simulator.run(base), simulator.run(what_if),
+                                batch_size * num_gpus * base.workers, batch_size * num_gpus * what_if.workers)
+
+#--------------------------------------------------------------------#
+
+def generateSimulationReport(table, graph_file_path, output_dir, base, what_if, batch_size):
+    nodes = readGraph(graph_file_path)
+    prediction = predictThroughput(table, nodes, base, what_if, batch_size)
+    
+    columns = [("Run", 18), ("Bandwidth (Gb/s)", 16), ("Latency (us)", 12), ("Workers", 7), ("Compute scale", 13),
+               ("Step (us)", 10), ("Images/sec", 10)]
+    rows = [["Measured", base.bandwidth, base.latency, base.workers, base.compute_scale,
+             "%.0lf" % prediction.measured_step_time, "%.1lf" % prediction.base_images_per_sec],
+            ["Simulated", base.bandwidth, base.latency, base.workers, base.compute_scale,
+             "%.0lf" % prediction.base.step_time, "---"],
+            ["Simulated what-if", what_if.bandwidth, what_if.latency, what_if.workers, what_if.compute_scale,
+             "%.0lf" % prediction.what_if.step_time, "---"],
+            ["Predicted", what_if.bandwidth, what_if.latency, what_if.workers, what_if.compute_scale,
+             "%.0lf" % prediction.predicted_step_time, "%.1lf" % prediction.predicted_images_per_sec]]
+    writeReport(columns, rows, os.path.join(output_dir, "simulation.csv"), max_screen_rows = len(rows))
+    print "Graph: %u nodes, %u cross-job transfers (%.1lf MB) per step, %u not scheduled." % \
+        (len(nodes), prediction.base.transfers, prediction.base.transfer_bytes / float(1 << 20), prediction.base.unscheduled)
+    print "Calibration: x%.3lf (measured / simulated step time)" % prediction.calibration
+    return prediction
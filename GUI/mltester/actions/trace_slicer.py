@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+
+from mltester.actions.trace_reader import iterTraceEvents, createTrace
+
+FLOW_PHASES = ["s", "t", "f"]
+
+#--------------------------------------------------------------------#
+
+def _inWindow(event, t0, t1):
+    ''' Whether an event overlaps [t0, t1). None means unbounded. '''
+    ts = event.get("ts")
+    if ts is None:
+        return False
+    if (t1 is not None) and (ts >= t1):
+        return False
+    if (t0 is not None) and (ts + event.get("dur", 0) <= t0) and (ts < t0):
+        return False
+    return True
+
+#--------------------------------------------------------------------#
+
+class TraceSlicer(object):
+    ''' Writes the part of a chrome trace in a time window and on chosen processes as a new, loadable trace.
+        Streams the input twice: first to collect process names and the flows that touch the slice, then to write.
+        Flows are kept whole, so an arrow that crosses the window edge still leads to (or from) its other end. '''
+
+    def __init__(self, input_file_path, t0 = None, t1 = None, pids = None, devices = None):
+        self._input_file_path = input_file_path
+        self._t0 = t0
+        self._t1 = t1
+        self._pids = set(pids) if pids else None
+        self._devices = devices or []
+        self.processes = {}
+        self._flow_ids = set()
+
+    # -------------------------------------------------------------------- #
+
+    def _selectPids(self):
+        ''' The pids to keep, or None for all of them. '''
+        if (self._pids is None) and not self._devices:
+            return None
+        res = set(self._pids or [])
+        for pid, pname in self.processes.iteritems():
+            if any(device in pname for device in self._devices):
+                res.add(pid)
+        return res
+
+    # -------------------------------------------------------------------- #
+
+    def _scan(self):
+        flows = []
+        for event in iterTraceEvents(self._input_file_path):
+            phase = event.get("ph")
+            if phase == "M":
+                if event.get("name") == "process_name":
+                    self.processes[event["pid"]] = event["args"]["name"]
+            elif (phase in FLOW_PHASES) and _inWindow(event, self._t0, self._t1):
+                flows.append((event.get("pid"), event.get("id")))
+        pids = self._selectPids()
+        self._flow_ids = set(flow_id for pid, flow_id in flows if (pids is None) or (pid in pids))
+        return pids
+
+    # -------------------------------------------------------------------- #
+
+    def _keep(self, event, pids):
+        phase = event.get("ph")
+        if phase in FLOW_PHASES:
+            return event.get("id") in self._flow_ids
+        if phase == "M":
+            return (pids is None) or (event.get("pid") in pids)
+        return ((pids is None) or (event.get("pid") in pids)) and _inWindow(event, self._t0, self._t1)
+
+    # -------------------------------------------------------------------- #
+
+    def write(self, output_file_path):
+        ''' Writes the slice (compressed if output_file_path ends with .gz/.zst). Returns the number of events written. '''
+        pids = self._scan()
+        # Flows to processes outside the slice still need those processes' names:
+        flow_pids = set()
+        count = 0
+        with createTrace(output_file_path) as f:
+            f.write('{"traceEvents": [')
+            for event in iterTraceEvents(self._input_file_path):
+                if not self._keep(event, pids):
+                    continue
+                if (event.get("ph") in FLOW_PHASES) and (pids is not None) and (event.get("pid") not in pids):
+                    flow_pids.add(event.get("pid"))
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(event))
+                count += 1
+            for pid in sorted(flow_pids):
+                if pid in self.processes:
+                    f.write(",\n" if count else "\n")
+                    f.write(json.dumps({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.processes[pid]}}))
+                    count += 1
+            f.write("\n]}\n")
+        return count
+
+#--------------------------------------------------------------------#
+
+def sliceTrace(input_file_path, output_file_path, t0 = None, t1 = None, pids = None, devices = None):
+    ''' Writes the events of input_file_path in [t0, t1) (usec, trace time) on the given pids, or on the processes whose
+        name contains one of devices (e.g. "GPU:0"), to output_file_path. Returns the number of events written. '''
+    return TraceSlicer(input_file_path, t0, t1, pids, devices).write(output_file_path)
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+from array import array
+import numpy as np
+
+from mltester.actions.trace_reader import iterTraceEvents
+
+# Size of a tensor in the snapshot of a TF "Tensor" object ("ph": "O"):
+REQUESTED_BYTES = re.compile(r"requested_bytes: ([0-9]+)")
+
+#--------------------------------------------------------------------#
+
+def _toNumpy(arr, dtype):
+    return np.frombuffer(arr, dtype = "i%u" % arr.itemsize).astype(dtype) if len(arr) else np.zeros(0, dtype)
+
+#--------------------------------------------------------------------#
+
+# id of events without one:
+NO_EVENT_ID = -1
+
+def _eventId(event_id, string_ids):
+    ''' Numeric ids ("0x" hex or decimal strings too) as numbers; other strings get distinct ids from -2 down,
+        interned in string_ids. '''
+    if isinstance(event_id, (int, long)):
+        return event_id
+    if not isinstance(event_id, basestring):
+        return NO_EVENT_ID
+    try:
+        return int(event_id, 16) if event_id[:2] in ["0x", "0X"] else int(event_id, 10)
+    except ValueError:
+        res = string_ids.get(event_id)
+        if res is None:
+            res = string_ids[event_id] = NO_EVENT_ID - 1 - len(string_ids)
+        return res
+
+#--------------------------------------------------------------------#
+
+def _snapshotBytes(args):
+    snapshot = args.get("snapshot")
+    description = snapshot.get("tensor_description") if isinstance(snapshot, dict) else None
+    m = REQUESTED_BYTES.search(description) if isinstance(description, basestring) else None
+    return float(m.group(1)) if m else 0.0
+
+#--------------------------------------------------------------------#
+
+def _counterValue(name, args):
+    ''' The series of a counter event named like the counter (TF allocators: {"GPU_0_bfc": bytes}), else its first number. '''
+    val = args.get(name)
+    if isinstance(val, (int, long, float)):
+        return float(val)
+    for val in args.values():
+        if isinstance(val, (int, long, float)):
+            return float(val)
+    return 0.0
+
+#--------------------------------------------------------------------#
+
+class StringTable(object):
+    ''' Interns strings into dense integer ids. '''
+    def __init__(self, strings = None):
+        self.strings = list(strings or [])
+        self._ids = dict((s, i) for i, s in enumerate(self.strings))
+
+    def intern(self, s):
+        i = self._ids.get(s)
+        if i is None:
+            i = len(self.strings)
+            self._ids[s] = i
+            self.strings.append(s)
+        return i
+
+    def find(self, s):
+        return self._ids.get(s, -1)
+
+    def __getitem__(self, i):
+        return self.strings[i]
+
+    def __len__(self):
+        return len(self.strings)
+
+#--------------------------------------------------------------------#
+
+class TraceTable(object):
+    ''' Columnar view of the events of a chrome trace.
+        Metadata events are not rows; process names are kept in 'processes'. '''
+
+    CACHE_VERSION = 5
+    COLUMNS = ["pid", "tid", "ts", "dur", "name_id", "cat_id", "ph", "node_id", "value", "id"]
+
+    def __init__(self, columns, names, categories, processes):
+        self.pid = columns["pid"]           # int32
+        self.tid = columns["tid"]           # int32
+        self.ts = columns["ts"]             # int64, usec
+        self.dur = columns["dur"]           # int64, usec
+        self.name_id = columns["name_id"]   # int32, index into names
+        self.cat_id = columns["cat_id"]     # int32, index into categories
+        self.ph = columns["ph"]             # uint8, ord() of the event phase
+        self.node_id = columns["node_id"]   # int32, index into names of args["name"] (graph node name), or -1
+        self.value = columns["value"]       # float64, value of counter ("C") events, bytes of tensor snapshots ("O"), 0 otherwise
+        self.id = columns["id"]             # int64, id of flow and object events, or NO_EVENT_ID
+        self.names = names
+        self.categories = categories
+        self.processes = processes          # pid -> process name
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def build(file_path):
+        names = StringTable()
+        categories = StringTable()
+        processes = {}
+        pid = array("i")
+        tid = array("i")
+        ts = array("l")
+        dur = array("l")
+        name_id = array("i")
+        cat_id = array("i")
+        ph = array("B")
+        node_id = array("i")
+        value = array("d")
+        event_id = array("l")
+        string_ids = {}
+
+        for event in iterTraceEvents(file_path):
+            phase = event.get("ph", "X")
+            if phase == "M":
+                if event.get("name") == "process_name":
+                    processes[int(event["pid"])] = event["args"]["name"]
+                continue
+            event_ts = event.get("ts")
+            if event_ts is None:
+                continue
+            pid.append(int(event.get("pid", 0)))
+            tid.append(int(event.get("tid", 0)))
+            ts.append(int(event_ts))
+            dur.append(int(event.get("dur", 0)))
+            name_id.append(names.intern(event.get("name", "")))
+            cat_id.append(categories.intern(event.get("cat", "")))
+            ph.append(ord(phase[0]))
+            args = event.get("args")
+            node = args.get("name") if isinstance(args, dict) else None
+            node_id.append(names.intern(node) if isinstance(node, basestring) else -1)
+            if (phase == "C") and isinstance(args, dict):
+                value.append(_counterValue(event.get("name", ""), args))
+            elif (phase == "O") and isinstance(args, dict):
+                value.append(_snapshotBytes(args))
+            else:
+                value.append(0.0)
+            event_id.append(_eventId(event.get("id", NO_EVENT_ID), string_ids))
+
+        columns = {"pid": _toNumpy(pid, np.int32),
+                   "tid": _toNumpy(tid, np.int32),
+                   "ts": _toNumpy(ts, np.int64),
+                   "dur": _toNumpy(dur, np.int64),
+                   "name_id": _toNumpy(name_id, np.int32),
+                   "cat_id": _toNumpy(cat_id, np.int32),
+                   "ph": np.frombuffer(ph, dtype = np.uint8).copy(),
+                   "node_id": _toNumpy(node_id, np.int32),
+                   "value": np.frombuffer(value, dtype = np.float64).copy(),
+                   "id": _toNumpy(event_id, np.int64)}
+        return TraceTable(columns, names, categories, processes)
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def cachePath(file_path):
+        return file_path + ".npz"
+
+    # -------------------------------------------------------------------- #
+
+    def save(self, npz_path, source_size = 0):
+        pids = sorted(self.processes.keys())
+        tmp_path = npz_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     version = np.int64(TraceTable.CACHE_VERSION),
+                     source_size = np.int64(source_size),
+                     names = np.array(self.names.strings, dtype = np.unicode_),
+                     categories = np.array(self.categories.strings, dtype = np.unicode_),
+                     process_pids = np.array(pids, dtype = np.int32),
+                     process_names = np.array([self.processes[pid] for pid in pids], dtype = np.unicode_),
+                     **dict((col, getattr(self, col)) for col in TraceTable.COLUMNS))
+        os.rename(tmp_path, npz_path)
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def load(npz_path, source_size = None):
+        ''' Returns None if the cache is stale or was written by another version. '''
+        with np.load(npz_path) as data:
+            if int(data["version"]) != TraceTable.CACHE_VERSION:
+                return None
+            if (source_size is not None) and (int(data["source_size"]) != source_size):
+                return None
+            columns = dict((col, data[col]) for col in TraceTable.COLUMNS)
+            names = StringTable(data["names"].tolist())
+            categories = StringTable(data["categories"].tolist())
+            processes = dict(zip(data["process_pids"].tolist(), data["process_names"].tolist()))
+        return TraceTable(columns, names, categories, processes)
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def fromFile(file_path, use_cache = True):
+        ''' Builds the table of a trace file, or loads it from the .npz sidecar. '''
+        cache_path = TraceTable.cachePath(file_path)
+        source_size = os.path.getsize(file_path)
+        if use_cache and os.path.isfile(cache_path) and (os.path.getmtime(cache_path) >= os.path.getmtime(file_path)):
+            try:
+                table = TraceTable.load(cache_path, source_size)
+                if table is not None:
+                    return table
+            except (IOError, ValueError, KeyError):
+                print "Warning: Ignoring corrupted trace cache %s." % cache_path
+
+        table = TraceTable.build(file_path)
+        if use_cache:
+            try:
+                table.save(cache_path, source_size)
+            except (IOError, OSError):
+                print "Warning: Failed to write trace cache %s." % cache_path
+        return table
+
+    # -------------------------------------------------------------------- #
+
+    def __len__(self):
+        return len(self.ts)
+
+    # -------------------------------------------------------------------- #
+
+    def end(self):
+        return self.ts + self.dur
+
+    # -------------------------------------------------------------------- #
+
+    def processName(self, pid):
+        return self.processes.get(pid, "pid_%d" % pid)
+
+    # -------------------------------------------------------------------- #
+
+    def nodeName(self, i):
+        ''' Graph node name of event i, or its event name if it has none. '''
+        node_id = self.node_id[i]
+        return self.names[node_id if node_id >= 0 else self.name_id[i]]
+
+    # -------------------------------------------------------------------- #
+
+    def mask(self, cat = None, name = None, ph = None, pid = None, tid = None, t0 = None, t1 = None):
+        ''' Boolean mask of the events matching all given filters.
+            The time window [t0, t1) selects events that overlap it. '''
+        res = np.ones(len(self), dtype = bool)
+        if cat is not None:
+            res &= self.cat_id == self.categories.find(cat)
+        if name is not None:
+            res &= self.name_id == self.names.find(name)
+        if ph is not None:
+            res &= self.ph == ord(ph)
+        if pid is not None:
+            res &= np.in1d(self.pid, pid) if isinstance(pid, (list, tuple, set, np.ndarray)) else (self.pid == pid)
+        if tid is not None:
+            res &= np.in1d(self.tid, tid) if isinstance(tid, (list, tuple, set, np.ndarray)) else (self.tid == tid)
+        if t1 is not None:
+            res &= self.ts < t1
+        if t0 is not None:
+            res &= (self.ts + self.dur > t0) | (self.ts >= t0)
+        return res
+
+    # -------------------------------------------------------------------- #
+
+    def select(self, mask):
+        ''' A new table with the rows selected by a mask or an index array. The string tables are shared. '''
+        columns = dict((col, getattr(self, col)[mask]) for col in TraceTable.COLUMNS)
+        return TraceTable(columns, self.names, self.categories, self.processes)
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from collections import OrderedDict
+
+from mltester.actions.analysis_util import LogHistogram, writeReport
+from mltester.actions.analyze_verbs import RequestInfo, jobTask
+
+#--------------------------------------------------------------------#
+
+class LogTail(object):
+    ''' Reads the lines appended to a file since the last call. The file may not exist yet, and is read from the
+        start again if it is truncated. A partly written last line is held back until it is complete. '''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = None
+        self._partial = ""
+
+    # -------------------------------------------------------------------- #
+
+    def readLines(self):
+        if self._file is None:
+            if not os.path.isfile(self.file_path):
+                return []
+            self._file = open(self.file_path)
+        if os.path.getsize(self.file_path) < self._file.tell():
+            self._file.seek(0)
+            self._partial = ""
+        else:
+            self._file.seek(self._file.tell())  # Clears the EOF of the previous read
+        lines = (self._partial + self._file.read()).split("\n")
+        self._partial = lines.pop()
+        return [line for line in lines if line]
+
+    # -------------------------------------------------------------------- #
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+#--------------------------------------------------------------------#
+
+class KeyWindow(object):
+    ''' Completed requests of one key since the last publish. '''
+    __slots__ = ["count", "bytes", "busy", "size", "max", "latency"]
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.busy = 0.0         # Sum of latencies (sec)
+        self.size = 0
+        self.max = 0            # usec
+        self.latency = LogHistogram()   # usec
+
+#--------------------------------------------------------------------#
+
+class VerbsFollower(object):
+    ''' Matches the verbs request logs while they are being written, and publishes per-tensor latency and bandwidth
+        of the requests completed since the previous publish. State is bounded: after each poll only the starts of the last
+        max_steps steps are kept (older ones are evicted as never completed), and a done line whose start hasn't been read yet
+        waits for one more poll. '''
+
+    def __init__(self, requests_start_file, requests_done_file, output_dir, interval = 10.0, max_steps = 16, max_screen_rows = 20):
+        self._start_tail = LogTail(requests_start_file)
+        self._done_tail = LogTail(requests_done_file)
+        self._output_dir = output_dir
+        self._interval = interval
+        self._max_steps = max_steps
+        self._max_screen_rows = max_screen_rows
+        self._pending = OrderedDict()   # step -> {key: start ts (usec)}, oldest step first
+        self._orphans = []              # Done lines without a start, retried once
+        self._window = {}               # key -> KeyWindow
+        self._window_start = time.time()
+        self.last_step = None
+        self.num_completed = 0
+        self.num_evicted = 0
+        self.num_unmatched = 0
+
+    # -------------------------------------------------------------------- #
+
+    def _addStart(self, line):
+        parts = line.split(",")
+        if len(parts) < 3:
+            return
+        step = self._pending.get(parts[1])
+        if step is None:
+            step = self._pending[parts[1]] = {}
+            self.last_step = parts[1]
+        step[parts[2]] = int(parts[0])
+
+    # -------------------------------------------------------------------- #
+
+    def _addDone(self, line):
+        ''' False if the request's start hasn't been read. '''
+        parts = line.split(",")
+        if len(parts) < 4:
+            return True
+        step = self._pending.get(parts[1])
+        start_ts = step.pop(parts[2], None) if step is not None else None
+        if start_ts is None:
+            return False
+        latency = int(parts[0]) - start_ts
+        size = int(parts[3], 16)
+        window = self._window.get(parts[2])
+        if window is None:
+            window = self._window[parts[2]] = KeyWindow()
+        window.count += 1
+        window.bytes += size
+        window.busy += latency / 1000000.0
+        window.size = size
+        window.max = max(window.max, latency)
+        window.latency.addValue(latency)
+        self.num_completed += 1
+        return True
+
+    # -------------------------------------------------------------------- #
+
+    def poll(self):
+        ''' Matches the lines written since the last poll. Returns the number of requests completed. '''
+        num_completed = self.num_completed
+        for line in self._start_tail.readLines():
+            self._addStart(line)
+        orphans = []
+        for line in self._orphans:
+            if not self._addDone(line):
+                self.num_unmatched += 1
+        for line in self._done_tail.readLines():
+            if not self._addDone(line):
+                orphans.append(line)
+        self._orphans = orphans
+        # Evicted after the done lines of this poll were matched, so a burst of start lines doesn't evict its own steps:
+        while len(self._pending) > self._max_steps:
+            self.num_evicted += len(self._pending.popitem(last = False)[1])
+        return self.num_completed - num_completed
+
+    # -------------------------------------------------------------------- #
+
+    def publish(self):
+        ''' Writes verbs_live.csv with the requests completed since the previous publish, and starts a new window. '''
+        now = time.time()
+        elapsed = max(now - self._window_start, 1e-6)
+        columns = [("Tensor", 60), ("Src", 8), ("Dst", 8), ("Requests", 8), ("Size", 10), ("p50 (us)", 10), ("p99 (us)", 10),
+                   ("Max (us)", 10), ("BW (Gb/s)", 10), ("Throughput (Gb/s)", 17)]
+        rows = []
+        for key, window in sorted(self._window.iteritems(), key = lambda item: -item[1].latency.quantile(99)):
+            request = RequestInfo(key)
+            rows.append([request.name, jobTask(request.src), jobTask(request.dst),
+                         window.count, window.size, "%.0lf" % window.latency.quantile(50), "%.0lf" % window.latency.quantile(99),
+                         window.max, "%.3lf" % (window.bytes * 8.0 / window.busy / 1e9 if window.busy else 0.0),
+                         "%.3lf" % (window.bytes * 8.0 / elapsed / 1e9)])
+        print "%s: step %s, %u requests in the last %.0lf sec (%u total), %u pending in %u steps, %u evicted, %u unmatched" % \
+            (time.strftime("%H:%M:%S", time.localtime(now)), self.last_step, sum(window.count for window in self._window.values()), elapsed,
+             self.num_completed, sum(len(step) for step in self._pending.values()), len(self._pending), self.num_evicted, self.num_unmatched)
+        writeReport(columns, rows, os.path.join(self._output_dir, "verbs_live.csv"), self._max_screen_rows)
+        self._window = {}
+        self._window_start = now
+
+    # -------------------------------------------------------------------- #
+
+    def run(self, duration = None, stop = None, poll_interval = 0.5):
+        ''' Polls and publishes every interval seconds until duration has passed, stop() returns True or
+            KeyboardInterrupt; then publishes what is left. '''
+        end_time = time.time() + duration if duration is not None else None
+        next_publish = time.time() + self._interval
+        try:
+            while ((end_time is None) or (time.time() < end_time)) and not (stop and stop()):
+                self.poll()
+                if time.time() >= next_publish:
+                    self.publish()
+                    next_publish += self._interval
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        self.poll()
+        self.publish()
+        self._start_tail.close()
+        self._done_tail.close()
+
+#--------------------------------------------------------------------#
+
+def followVerbs(requests_start_file, requests_done_file, output_dir = None, interval = 10.0, max_steps = 16, duration = None, stop = None):
+    ''' Tails the verbs request logs of a running job and publishes rolling per-tensor reports every interval seconds. '''
+    if output_dir is None:
+        output_dir = os.path.dirname(requests_start_file)
+    follower = VerbsFollower(requests_start_file, requests_done_file, output_dir, interval, max_steps)
+    follower.run(duration, stop)
+    return follower
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from itertools import imap
+import numpy as np
+
+from mltester.actions.trace_table import StringTable
+
+#--------------------------------------------------------------------#
+
+def _splitLines(text, num_columns, file_path):
+    ''' The columns of complete lines with num_columns comma-separated columns each, as lists of strings. '''
+    if "\r" in text:
+        text = text.replace("\r", "")
+    # One split over the whole chunk; the columns are then strided slices:
+    num_lines = text.count("\n") + (0 if text.endswith("\n") or not text else 1)
+    fields = text.replace("\n", ",").split(",")
+    if fields[-1] == "":
+        fields.pop()
+    if len(fields) != num_lines * num_columns:
+        raise ValueError("%s: expected %u columns per line." % (file_path, num_columns))
+    return [fields[i::num_columns] for i in xrange(num_columns)]
+
+#--------------------------------------------------------------------#
+
+def _readLog(file_path, num_columns, chunk_size = 1 << 24):
+    ''' Yields the columns of a verbs log, about chunk_size bytes of whole lines at a time, so that only one chunk
+        is held as Python strings. '''
+    with open(file_path) as f:
+        while True:
+            lines = f.readlines(chunk_size)
+            if not lines:
+                break
+            yield _splitLines("".join(lines), num_columns, file_path)
+
+#--------------------------------------------------------------------#
+
+def _parseInts(strings):
+    ''' int64 array of decimal strings, parsed by numpy in one call. '''
+    return np.fromstring(" ".join(strings), dtype = np.int64, sep = " ") if len(strings) else np.zeros(0, dtype = np.int64)
+
+#--------------------------------------------------------------------#
+
+class _Interner(object):
+    ''' Assigns ids to strings chunk by chunk; finish() renumbers them in sorted order. '''
+    __slots__ = ["ids"]
+
+    def __init__(self):
+        self.ids = {}
+
+    def add(self, column):
+        ids = self.ids
+        for s in set(column).difference(ids):
+            ids[s] = len(ids)
+        return np.fromiter(imap(ids.__getitem__, column), dtype = np.int32, count = len(column))
+
+    def finish(self, *id_arrays):
+        ''' (StringTable, id_arrays renumbered into it). '''
+        strings = sorted(self.ids)
+        order = np.zeros(len(strings), dtype = np.int32)
+        order[[self.ids[string] for string in strings]] = np.arange(len(strings), dtype = np.int32)
+        return StringTable(strings), [order[ids] for ids in id_arrays]
+
+#--------------------------------------------------------------------#
+
+def _concatChunks(chunks, dtypes):
+    ''' One array per column of a list of per-chunk column tuples. '''
+    return [np.concatenate([chunk[i] for chunk in chunks]) if chunks else np.zeros(0, dtype = dtype) for i, dtype in enumerate(dtypes)]
+
+#--------------------------------------------------------------------#
+
+class VerbsTable(object):
+    ''' Columnar join of the RDMA verbs request logs: one row per done line, matched to the start line of the same
+        request key and step (the last one, in host order, if a request was started more than once in a step). Times are in seconds.
+        With the logs of several hosts, start_host/done_host are the indices of the hosts whose clocks the times are on. '''
+
+    COLUMNS = ["key_id", "step_id", "start", "done", "size", "start_host", "done_host"]
+
+    def __init__(self, columns, keys, steps, num_started = 0):
+        self.key_id = columns["key_id"]         # int32, index into keys ("src;?;dst;tensor")
+        self.step_id = columns["step_id"]       # int32, index into steps
+        self.start = columns["start"]           # float64
+        self.done = columns["done"]             # float64
+        self.size = columns["size"]             # int64, bytes
+        self.start_host = columns["start_host"] # int32, index of the log the start line was read from
+        self.done_host = columns["done_host"]   # int32, index of the log the done line was read from
+        self.latency = self.done - self.start
+        self.keys = keys
+        self.steps = steps
+        self.num_started = num_started          # Start lines, including requests that never completed
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def fromFiles(requests_start_file, requests_done_file, chunk_size = 1 << 24):
+        ''' Reads and joins the logs, chunk_size bytes at a time. Raises ValueError for a done line without a start,
+            or a non-positive latency. '''
+        table = VerbsTable.fromHosts([(requests_start_file, requests_done_file)], chunk_size)
+        if (table.latency <= 0).any():
+            raise ValueError("Request %s: latency is not a positive number." % table.keys[table.key_id[np.argmax(table.latency <= 0)]])
+        return table
+
+    # -------------------------------------------------------------------- #
+
+    @staticmethod
+    def fromHosts(logs, chunk_size = 1 << 24):
+        ''' Joins the [(requests_start_file, requests_done_file)] of several hosts: a request may be started on one
+            host and done on another. Times are left on each host's clock, so latencies aren't checked.
+            Raises ValueError for a done line without a start. '''
+        # Each chunk is reduced to typed arrays before the next one is read:
+        key_ids = _Interner()
+        step_ids = _Interner()
+        start_chunks = []
+        done_chunks = []
+        # Sizes repeat per key; each distinct hex string is parsed once:
+        size_values = {}
+        for host, (requests_start_file, requests_done_file) in enumerate(logs):
+            for chunk_ts, chunk_steps, chunk_keys in _readLog(requests_start_file, 3, chunk_size):
+                start_chunks.append((_parseInts(chunk_ts), key_ids.add(chunk_keys), step_ids.add(chunk_steps),
+                                     np.full(len(chunk_ts), host, dtype = np.int32)))
+            for chunk_ts, chunk_steps, chunk_keys, chunk_sizes in _readLog(requests_done_file, 4, chunk_size):
+                for s in set(chunk_sizes).difference(size_values):
+                    size_values[s] = int(s, 16)
+                done_chunks.append((_parseInts(chunk_ts), key_ids.add(chunk_keys), step_ids.add(chunk_steps),
+                                    np.fromiter(imap(size_values.__getitem__, chunk_sizes), dtype = np.int64, count = len(chunk_sizes)),
+                                    np.full(len(chunk_ts), host, dtype = np.int32)))
+        start_ts, start_key_id, start_step_id, start_host = _concatChunks(start_chunks, [np.int64, np.int32, np.int32, np.int32])
+        done_ts, done_key_id, done_step_id, size, done_host = _concatChunks(done_chunks, [np.int64, np.int32, np.int32, np.int64, np.int32])
+        del start_chunks, done_chunks
+        keys, (start_key_id, done_key_id) = key_ids.finish(start_key_id, done_key_id)
+        steps, (start_step_id, done_step_id) = step_ids.finish(start_step_id, done_step_id)
+        starts = start_ts / 1000000.0
+        dones = done_ts / 1000000.0
+
+        # Sort-merge join on (key, step): stable sort, so the last of equal start codes is the latest start line:
+        num_steps = max(len(steps), 1)
+        start_code = start_key_id.astype(np.int64) * num_steps + start_step_id
+        done_code = done_key_id.astype(np.int64) * num_steps + done_step_id
+        order = np.argsort(start_code, kind = "mergesort")
+        sorted_code = start_code[order]
+        pos = np.searchsorted(sorted_code, done_code, side = "right") - 1
+        matched = (pos >= 0) & (sorted_code[pos.clip(0, max(len(sorted_code) - 1, 0))] == done_code) if len(sorted_code) else \
+                  np.zeros(len(done_code), dtype = bool)
+        if not matched.all():
+            raise ValueError("Request %s was not started." % keys[done_key_id[np.argmin(matched)]])
+        start = starts[order[pos]]
+
+        columns = {"key_id": done_key_id, "step_id": done_step_id, "start": start, "done": dones, "size": size,
+                   "start_host": start_host[order[pos]], "done_host": done_host}
+        return VerbsTable(columns, keys, steps, len(starts))
+
+    # -------------------------------------------------------------------- #
+
+    def __len__(self):
+        return len(self.key_id)
+
+    # -------------------------------------------------------------------- #
+
+    def select(self, rows):
+        ''' A table of the given rows (a boolean mask or indices), with the same keys and steps. '''
+        columns = dict((column, getattr(self, column)[rows]) for column in VerbsTable.COLUMNS)
+        return VerbsTable(columns, self.keys, self.steps, self.num_started)
+
+    # -------------------------------------------------------------------- #
+
+    def shiftClocks(self, host_offsets):
+        ''' Moves the times of each host onto the common clock: host_offsets[host] (seconds) is how far ahead of it
+            the host's clock is. '''
+        host_offsets = np.asarray(host_offsets, dtype = np.float64)
+        self.start = self.start - host_offsets[self.start_host]
+        self.done = self.done - host_offsets[self.done_host]
+        self.latency = self.done - self.start
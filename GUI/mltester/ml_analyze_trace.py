@@ -1,77 +1,83 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import json
+import argparse
 import os
 import sys
+import numpy as np
 from commonpylib.util import toFileName
+from mltester.actions.trace_table import TraceTable
+from mltester.actions.trace_slicer import sliceTrace
+from mltester.actions.trace_index import TraceIndex
+from mltester.actions.trace_merge import mergeTraces
+from mltester.actions.analyze_layers import MODEL_BLOCKS, generateLayerReport
+from mltester.actions.trace_simulator import SimulationConditions, generateSimulationReport
+from mltester.actions.timeline_file import TIMELINE_FORMAT_BINARY, TIMELINE_FORMAT_CSV, createTimelineWriter
+from mltester.actions.analyze_trace import generateOpReport, generateUtilizationReport, generateStallReport, \
+    generateStepReport, generateDiffReport, generateMemoryReport, writeCounterSeries, \
+    generateTransferReport, analyzeWorkers, generateSkewReport, detectSteps, findTraceFiles
 
 #--------------------------------------------------------------------#
 
 class ProcessInfo(object):
-    def __init__(self, pname, output_dir_name):
+    def __init__(self, pname, output_dir_name, timeline_format = TIMELINE_FORMAT_BINARY):
         self.pname = pname
         self._output_dir_name = output_dir_name 
+        self._timeline_format = timeline_format
         self._files = {}
     
     def _getOrCreateLog(self, tid):
         f = self._files.get(tid)
         if not f:
-            file_name = "TL-" + toFileName(self.pname) + ("_%u.csv" % tid)
-            file_path = os.path.join(self._output_dir_name, file_name)
-            print file_path
-            f = open(file_path, "w")
+            file_name = "TL-" + toFileName(self.pname) + ("_%u" % tid)
+            f = createTimelineWriter(os.path.join(self._output_dir_name, file_name), self._timeline_format)
+            print f.file_path
             self._files[tid] = f
         return f
     
     def log(self, tid, ts, dur, label):
-        f = self._getOrCreateLog(tid)
-        f.write("%lf, 0, %s\n" % (ts / 1000000.0, label))
-        f.write("%lf, 1\n" % (ts / 1000000.0))
-        f.write("%lf, 1\n" % ((ts + dur) / 1000000.0))
-        f.write("%lf, 0\n" % ((ts + dur) / 1000000.0))
+        self._getOrCreateLog(tid).add(ts / 1000000.0, (ts + dur) / 1000000.0, label)
+    
+    def logMany(self, tid, ts, dur, label_ids, labels):
+        self._getOrCreateLog(tid).addMany(ts / 1000000.0, (ts + dur) / 1000000.0, label_ids, labels)
+    
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
 
 #--------------------------------------------------------------------#
 
-def analyzeTrace(input_file_path, output_dir):
-    processes = {}
-    
-    
-    with open(input_file_path) as f:
-        data = json.load(f)
+def analyzeTrace(input_file_path, output_dir, use_cache = True, timeline_format = TIMELINE_FORMAT_BINARY):
+    if output_dir is None:
+        output_dir = os.path.dirname(input_file_path)
     
-    min_ts = sys.maxint
-    max_ts = 0
-    events = data["traceEvents"]
-    for event in events:
-        ts = event.get("ts")
-        if ts:
-            min_ts = min(min_ts, ts)
-            max_ts = max(max_ts, ts)
+    table = TraceTable.fromFile(input_file_path, use_cache)
+    processes = dict((pid, ProcessInfo(pname, output_dir, timeline_format)) for pid, pname in table.processes.iteritems())
     
-    for event in events:
-        if event["name"] != "process_name":
-            break
-        pinfo = ProcessInfo(event["args"]["name"], output_dir)
-        pid = int(event["pid"])
-        processes[pid] = pinfo
+    timestamps = table.ts[table.ts != 0]
+    min_ts = timestamps.min() if len(timestamps) else sys.maxint
+    max_ts = timestamps.max() if len(timestamps) else 0
     
-    for event in events:
-        name = event["name"]
-        if name == "process_name":
+    # One timeline per (process, thread): op threads, GPU streams and memcpy lanes.
+    # Events keep their trace order within a timeline:
+    ops = table.select(table.mask(ph = "X"))
+    order = np.lexsort((np.arange(len(ops)), ops.tid, ops.pid))
+    ops = ops.select(order)
+    bounds = np.flatnonzero((ops.pid[1:] != ops.pid[:-1]) | (ops.tid[1:] != ops.tid[:-1])) + 1
+    for first, last in zip([0] + bounds.tolist(), bounds.tolist() + [len(ops)]):
+        if first == last:
             continue
-        if event["tid"] != 0: # For now only thread 0 is traced
-            continue
-        if event["cat"] != "Op":
-            continue
-        
-        pid = int(event["pid"])
-        tid = int(event["tid"])
-        ts = int(event["ts"])
-        dur = int(event["dur"])
-        pinfo = processes[pid]
-        pinfo.log(tid, ts, dur, name)
+        pid = int(ops.pid[first])
+        pinfo = processes.get(pid)
+        if pinfo is None:
+            pinfo = ProcessInfo(table.processName(pid), output_dir, timeline_format)
+            processes[pid] = pinfo
+        pinfo.logMany(int(ops.tid[first]), ops.ts[first:last], ops.dur[first:last], ops.name_id[first:last], table.names)
     
+    for pinfo in processes.values():
+        pinfo.close()
+    writeCounterSeries(table, output_dir)
     
     print "Start: %u" % min_ts
     print "End: %u" % max_ts
@@ -79,14 +85,316 @@ def analyzeTrace(input_file_path, output_dir):
 
 #--------------------------------------------------------------------#
 
+def _outputDir(args):
+    return args.output_dir if args.output_dir is not None else os.path.dirname(args.trace_file)
+
+#--------------------------------------------------------------------#
+
+def _addWindowArgs(arg_parser):
+    arg_parser.add_argument("--window", default=None, help="Only analyze the events in T0:T1 (usec, trace time; either may be empty), through the .idx index.")
+    arg_parser.add_argument("--device", action="append", help="Only analyze the processes whose name contains this, e.g. GPU:0 (repeatable).")
+
+#--------------------------------------------------------------------#
+
+def _loadTable(args):
+    ''' The trace table, or the part of it selected by --window/--device, read through the trace index. '''
+    if (args.window is None) and not args.device:
+        return TraceTable.fromFile(args.trace_file, not args.no_cache)
+    
+    index = TraceIndex.fromFile(args.trace_file, not args.no_cache)
+    t0, t1 = None, None
+    if args.window is not None:
+        try:
+            t0, _, t1 = args.window.partition(":")
+            t0 = float(t0) if t0 else None
+            t1 = float(t1) if t1 else None
+        except ValueError:
+            print "Error: Bad window: %s (expected T0:T1)." % args.window
+            sys.exit(1)
+    pids = index.devicePids(args.device) if args.device else None
+    return index.query(t0, t1, pids)
+
+#--------------------------------------------------------------------#
+
+def reportMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s report" % os.path.basename(sys.argv[0]),
+                                         description = "Per-op duration statistics (count, total, mean, p50/p90/p99, max, step share).")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write op_stats.csv (default: next to the trace).")
+    arg_parser.add_argument("--top", type=int, default=30, help="Number of ops to print.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    _addWindowArgs(arg_parser)
+    args = arg_parser.parse_args(argv)
+    
+    table = _loadTable(args)
+    generateOpReport(table, _outputDir(args), args.top)
+
+#--------------------------------------------------------------------#
+
+def overlapMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s overlap" % os.path.basename(sys.argv[0]),
+                                         description = "Per-device busy, idle and compute/communication overlap time.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write utilization.csv (default: next to the trace).")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    _addWindowArgs(arg_parser)
+    args = arg_parser.parse_args(argv)
+    
+    table = _loadTable(args)
+    generateUtilizationReport(table, _outputDir(args))
+
+#--------------------------------------------------------------------#
+
+def stallsMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s stalls" % os.path.basename(sys.argv[0]),
+                                         description = "Critical path of every step and the longest GPU idle gaps with the op they waited on.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write the reports (default: next to the trace).")
+    arg_parser.add_argument("--top", type=int, default=10, help="Number of gaps to report per GPU and step.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    _addWindowArgs(arg_parser)
+    args = arg_parser.parse_args(argv)
+    
+    table = _loadTable(args)
+    generateStallReport(table, _outputDir(args), args.top)
+
+#--------------------------------------------------------------------#
+
+def stepsMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s steps" % os.path.basename(sys.argv[0]),
+                                         description = "Detect the training steps of a trace; per-step duration and compute/communication/idle time, with outlier steps flagged.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write steps.csv (default: next to the trace).")
+    arg_parser.add_argument("--percentile", type=float, default=95, help="Flag steps slower than this percentile of the step times.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    _addWindowArgs(arg_parser)
+    args = arg_parser.parse_args(argv)
+    
+    table = _loadTable(args)
+    generateStepReport(table, _outputDir(args), args.percentile)
+
+#--------------------------------------------------------------------#
+
+def memoryMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s memory" % os.path.basename(sys.argv[0]),
+                                         description = "Allocator memory over time (MEM-<allocator>.csv) and its per-step peak and high-water mark.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write the reports (default: next to the trace).")
+    arg_parser.add_argument("--limit", type=float, default=None, help="Device memory in MB, to report the headroom left.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    _addWindowArgs(arg_parser)
+    args = arg_parser.parse_args(argv)
+    
+    table = _loadTable(args)
+    generateMemoryReport(table, _outputDir(args), args.limit * (1 << 20) if args.limit else None)
+
+#--------------------------------------------------------------------#
+
+def transfersMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s transfers" % os.path.basename(sys.argv[0]),
+                                         description = "Per-tensor and per job pair transfer latency and size, from the trace's flow events.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write the reports (default: next to the trace).")
+    arg_parser.add_argument("--top", type=int, default=30, help="Number of tensors to print.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    _addWindowArgs(arg_parser)
+    args = arg_parser.parse_args(argv)
+    
+    table = _loadTable(args)
+    generateTransferReport(table, _outputDir(args), args.top)
+
+#--------------------------------------------------------------------#
+
+def indexMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s index" % os.path.basename(sys.argv[0]),
+                                         description = "Build the <trace>.idx time-range index used by --window/--device, and print what it holds.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    args = arg_parser.parse_args(argv)
+    
+    index = TraceIndex.fromFile(args.trace_file, not args.no_cache)
+    for i, pid in enumerate(index.pids.tolist()):
+        t0, t1 = index.timeRange(pid)
+        print "%5d %-60s %9u events  %u - %u" % (pid, index.processes.get(pid, "---"), index.offsets[i + 1] - index.offsets[i], t0, t1)
+    print "Index: %s (%u events)" % (TraceIndex.indexPath(args.trace_file), len(index))
+
+#--------------------------------------------------------------------#
+
+def sliceMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s slice" % os.path.basename(sys.argv[0]),
+                                         description = "Write the events of a time window or step range, on chosen processes, as a smaller trace chrome://tracing can load.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_file", help="The sliced trace (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("--t0", type=float, default=None, help="Window start (usec, trace time).")
+    arg_parser.add_argument("--t1", type=float, default=None, help="Window end (usec, trace time).")
+    arg_parser.add_argument("--steps", default=None, help="Step range FIRST[:LAST] (inclusive), instead of --t0/--t1.")
+    arg_parser.add_argument("--pid", type=int, action="append", help="A process to keep (repeatable).")
+    arg_parser.add_argument("--device", action="append", help="Keep the processes whose name contains this, e.g. GPU:0 (repeatable).")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar (for --steps).")
+    args = arg_parser.parse_args(argv)
+    
+    t0, t1 = args.t0, args.t1
+    if args.steps is not None:
+        steps = detectSteps(TraceTable.fromFile(args.trace_file, not args.no_cache))
+        try:
+            first, _, last = args.steps.partition(":")
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            print "Error: Bad step range: %s (expected FIRST[:LAST])." % args.steps
+            sys.exit(1)
+        if not (0 <= first <= last < len(steps)):
+            print "Error: Step range %s is out of the trace's %u steps." % (args.steps, len(steps))
+            sys.exit(1)
+        t0, t1 = int(steps.start[first]), int(steps.end[last])
+    
+    count = sliceTrace(args.trace_file, args.output_file, t0, t1, args.pid, args.device)
+    print "Wrote %u events to %s." % (count, args.output_file)
+
+#--------------------------------------------------------------------#
+
+def simulateMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s simulate" % os.path.basename(sys.argv[0]),
+                                         description = "Replay a step of the model graph with the traced op durations, and predict step time and images/sec under changed conditions.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write simulation.csv (default: next to the trace).")
+    arg_parser.add_argument("--graph-file", default=None, help="The graph.txt of the run (default: next to the trace).")
+    arg_parser.add_argument("--batch-size", type=int, default=32, help="Images per GPU per step.")
+    arg_parser.add_argument("--base-bandwidth", type=float, default=25.0, help="Link bandwidth of the traced run (Gb/s).")
+    arg_parser.add_argument("--base-workers", type=int, default=1, help="Number of workers in the traced run.")
+    arg_parser.add_argument("--bandwidth", type=float, default=None, help="What-if link bandwidth (Gb/s).")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="What-if extra latency per transfer (usec).")
+    arg_parser.add_argument("--workers", type=int, default=None, help="What-if number of workers.")
+    arg_parser.add_argument("--compute-scale", type=float, default=1.0, help="What-if compute speedup (2 = ops take half the time).")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    args = arg_parser.parse_args(argv)
+    
+    graph_file = args.graph_file if args.graph_file is not None else os.path.join(os.path.dirname(args.trace_file), "graph.txt")
+    if not os.path.isfile(graph_file):
+        print "Error: Graph file %s not found (run with model_graph_file enabled)." % graph_file
+        sys.exit(1)
+    base = SimulationConditions(args.base_bandwidth, 0.0, args.base_workers, 1.0)
+    what_if = SimulationConditions(args.bandwidth if args.bandwidth is not None else args.base_bandwidth,
+                                   args.latency,
+                                   args.workers if args.workers is not None else args.base_workers,
+                                   args.compute_scale)
+    table = TraceTable.fromFile(args.trace_file, not args.no_cache)
+    output_dir = args.output_dir if args.output_dir is not None else os.path.dirname(args.trace_file)
+    generateSimulationReport(table, graph_file, output_dir, base, what_if, args.batch_size)
+
+#--------------------------------------------------------------------#
+
+def layersMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s layers" % os.path.basename(sys.argv[0]),
+                                         description = "Per model layer and block compute time, gradient size and exchange time, flagging communication-bound layers.")
+    arg_parser.add_argument("trace_file", help="A trace file (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write layers.csv and blocks.csv (default: next to the trace).")
+    arg_parser.add_argument("--model", default=None, help="The tf_cnn_benchmarks model, to group layers into blocks (%s)." % ", ".join(sorted(MODEL_BLOCKS.keys())))
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecar.")
+    _addWindowArgs(arg_parser)
+    args = arg_parser.parse_args(argv)
+    
+    table = _loadTable(args)
+    generateLayerReport(table, _outputDir(args), args.model)
+
+#--------------------------------------------------------------------#
+
+def diffMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s diff" % os.path.basename(sys.argv[0]),
+                                         description = "Per-op change in count, total and mean time between two runs, ranked by contribution to the step time change.")
+    arg_parser.add_argument("trace_a", help="The baseline trace file.")
+    arg_parser.add_argument("trace_b", help="The trace file to compare.")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write op_diff.csv (default: next to trace_b).")
+    arg_parser.add_argument("--top", type=int, default=30, help="Number of ops to print.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecars.")
+    args = arg_parser.parse_args(argv)
+    
+    table_a = TraceTable.fromFile(args.trace_a, not args.no_cache)
+    table_b = TraceTable.fromFile(args.trace_b, not args.no_cache)
+    generateDiffReport(table_a, table_b, args.output_dir if args.output_dir is not None else os.path.dirname(args.trace_b), args.top)
+
+#--------------------------------------------------------------------#
+
+def workersMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s workers" % os.path.basename(sys.argv[0]),
+                                         description = "Analyze all trace_<job>_<task>.json files of a step in parallel and report step-time skew between workers.")
+    arg_parser.add_argument("logs_dir", help="The step's logs directory.")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write the reports (default: logs_dir).")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of processes (default: number of CPUs).")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecars.")
+    args = arg_parser.parse_args(argv)
+    
+    workers = analyzeWorkers(args.logs_dir, args.jobs, not args.no_cache)
+    if not workers:
+        print "Error: No trace files found in %s." % args.logs_dir
+        sys.exit(1)
+    generateSkewReport(workers, args.output_dir if args.output_dir is not None else args.logs_dir)
+
+#--------------------------------------------------------------------#
+
+def mergeMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s merge" % os.path.basename(sys.argv[0]),
+                                         description = "Merge the trace_<job>_<task>.json files of a step into one trace, with the hosts' clocks aligned.")
+    arg_parser.add_argument("logs_dir", help="The step's logs directory.")
+    arg_parser.add_argument("output_file", help="The merged trace (.json|.json.gz|.json.zst).")
+    arg_parser.add_argument("--offset", action="append", default=[], help="HOST=USEC: a host's (e.g. worker:1) clock offset, e.g. measured at launch (repeatable).")
+    arg_parser.add_argument("--no-align", action="store_true", help="Don't estimate clock offsets from the flows between hosts.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't read or write the .npz sidecars.")
+    args = arg_parser.parse_args(argv)
+    
+    traces = findTraceFiles(args.logs_dir)
+    if not traces:
+        print "Error: No trace files found in %s." % args.logs_dir
+        sys.exit(1)
+    offsets = {}
+    for arg in args.offset:
+        host, _, usec = arg.partition("=")
+        try:
+            offsets[host] = float(usec)
+        except ValueError:
+            print "Error: Bad offset: %s (expected HOST=USEC)." % arg
+            sys.exit(1)
+    
+    merger = mergeTraces(traces, args.output_file, offsets, not args.no_align, not args.no_cache)
+    for host in merger.hosts:
+        if host in merger.clocks:
+            offset, uncertainty = merger.clocks[host]
+            print "%-20s offset %10.1lf us  +/- %.1lf us" % (host, offset, uncertainty)
+        else:
+            print "%-20s not aligned (no flows in both directions)" % host
+    print "Wrote %u events from %u traces to %s." % (merger.count, len(traces), args.output_file)
+
+#--------------------------------------------------------------------#
+
+MODES = {"report": reportMain,
+         "diff": diffMain,
+         "index": indexMain,
+         "layers": layersMain,
+         "memory": memoryMain,
+         "merge": mergeMain,
+         "overlap": overlapMain,
+         "simulate": simulateMain,
+         "slice": sliceMain,
+         "stalls": stallsMain,
+         "steps": stepsMain,
+         "transfers": transfersMain,
+         "workers": workersMain}
+
 def main():
-    if len(sys.argv) < 2:
-        print "Usage: %s <gpu_trace_file> [output_dir]" % os.path.basename(sys.argv[0])
+    if (len(sys.argv) >= 2) and (sys.argv[1] in MODES):
+        MODES[sys.argv[1]](sys.argv[2:])
+        return
+    
+    args = [arg for arg in sys.argv[1:] if arg != "--csv"]
+    timeline_format = TIMELINE_FORMAT_CSV if len(args) < len(sys.argv) - 1 else TIMELINE_FORMAT_BINARY
+    if len(args) < 1:
+        print "Usage: %s <gpu_trace_file(.json|.json.gz|.json.zst)> [output_dir] [--csv]" % os.path.basename(sys.argv[0])
+        print "       %s <%s> ... (-h for help)" % (os.path.basename(sys.argv[0]), "|".join(sorted(MODES.keys())))
         sys.exit(1)
-    output_dir = sys.argv[2] if len(sys.argv) >= 3 else None
-    analyzeTrace(sys.argv[1], output_dir)
+    output_dir = args[1] if len(args) >= 2 else None
+    analyzeTrace(args[0], output_dir, timeline_format = timeline_format)
 
 #--------------------------------------------------------------------#
 
 if __name__ == '__main__':
-    main()
+    main()
\ No newline at end of file
@@ -1,18 +1,88 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import argparse
 import os
 import sys
-from mltester.actions.analyze_verbs import analyzeVerbs
+from mltester.actions.analyze_verbs import DEFAULT_QUEUE_DEPTH, analyzeVerbs, mergeVerbs
+from mltester.actions.verbs_follow import followVerbs
+from mltester.actions.timeline_file import TIMELINE_FORMATS, TIMELINE_FORMAT_BINARY
 
 #--------------------------------------------------------------------#
 
-def main():
-    if len(sys.argv) < 3:
-        print "Usage: %s <request_starts_file> <requests_done_file> [output_dir]" % os.path.basename(sys.argv[0])
+def _addReportArguments(arg_parser):
+    arg_parser.add_argument("--link-bandwidth", type=float, default=None, help="Link rate (Gb/s), to report link utilization.")
+    arg_parser.add_argument("--series", action="store_true", help="Write VDTA/VINF link series for the graph viewer.")
+    arg_parser.add_argument("--timelines", action="store_true", help="Write a timeline of the requests for the graph viewer.")
+    arg_parser.add_argument("--timeline-format", choices=TIMELINE_FORMATS, default=TIMELINE_FORMAT_BINARY, help="Timeline file format.")
+    arg_parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH, help="RDMA_QUEUE_DEPTH of the run, to compare the requests in flight with.")
+
+def _checkReportArguments(args):
+    if args.queue_depth < 1:
+        print "Error: --queue-depth must be at least 1."
         sys.exit(1)
-    output_dir = sys.argv[3] if len(sys.argv) >= 4 else None
-    analyzeVerbs(sys.argv[1], sys.argv[2], output_dir)
+
+#--------------------------------------------------------------------#
+
+def mergeMain(argv):
+    arg_parser = argparse.ArgumentParser(prog = "%s merge" % os.path.basename(sys.argv[0]),
+                                         description = "Analyze the verbs request logs of every host of a cluster together, with the hosts' clocks aligned.")
+    arg_parser.add_argument("output_dir", help="Where to write the reports.")
+    arg_parser.add_argument("--host", nargs=3, action="append", required=True, metavar=("HOST", "START_FILE", "DONE_FILE"),
+                            help="A host (e.g. worker:1) and its requests start/done logs (repeatable). The first host's clock is the reference.")
+    arg_parser.add_argument("--offset", action="append", default=[], help="HOST=USEC: a host's clock offset, e.g. measured at launch (repeatable).")
+    arg_parser.add_argument("--no-align", action="store_true", help="Don't estimate clock offsets from the requests between hosts.")
+    _addReportArguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    _checkReportArguments(args)
+    
+    offsets = {}
+    for arg in args.offset:
+        host, _, usec = arg.partition("=")
+        try:
+            offsets[host] = float(usec)
+        except ValueError:
+            print "Error: Bad offset: %s (expected HOST=USEC)." % arg
+            sys.exit(1)
+    
+    mergeVerbs([tuple(host) for host in args.host], args.output_dir, offsets, not args.no_align,
+               generate_timelines = args.timelines,
+               timeline_format = args.timeline_format,
+               generate_link_series = args.series,
+               link_bandwidth = args.link_bandwidth,
+               queue_depth = args.queue_depth)
+
+#--------------------------------------------------------------------#
+
+def main():
+    if (len(sys.argv) >= 2) and (sys.argv[1] == "merge"):
+        mergeMain(sys.argv[2:])
+        return
+    
+    arg_parser = argparse.ArgumentParser(prog = os.path.basename(sys.argv[0]),
+                                         description = "Match the RDMA verbs request start/done logs of a run and report latency and bandwidth per tensor, job pair and size. " +
+                                                       "'%s merge -h' for the logs of several hosts." % os.path.basename(sys.argv[0]))
+    arg_parser.add_argument("requests_start_file", help="The requests start log.")
+    arg_parser.add_argument("requests_done_file", help="The requests done log.")
+    arg_parser.add_argument("output_dir", nargs="?", help="Where to write the reports (default: next to the start log).")
+    _addReportArguments(arg_parser)
+    arg_parser.add_argument("--follow", action="store_true", help="Tail the logs of a running job and publish rolling reports until interrupted.")
+    arg_parser.add_argument("--interval", type=float, default=10.0, help="Seconds between rolling reports (with --follow).")
+    arg_parser.add_argument("--max-steps", type=int, default=16, help="Steps whose unfinished requests are kept (with --follow).")
+    args = arg_parser.parse_args()
+    _checkReportArguments(args)
+    
+    if args.follow:
+        followVerbs(args.requests_start_file, args.requests_done_file, args.output_dir,
+                    interval = args.interval,
+                    max_steps = args.max_steps)
+        return
+    analyzeVerbs(args.requests_start_file, args.requests_done_file, args.output_dir,
+                 generate_timelines = args.timelines,
+                 timeline_format = args.timeline_format,
+                 generate_link_series = args.series,
+                 link_bandwidth = args.link_bandwidth,
+                 queue_depth = args.queue_depth)
 
 #--------------------------------------------------------------------#
 
@@ -1,6 +1,8 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 import sys, os
+import numpy as np
+from mltester.actions.timeline_file import TimelineFile
 from PyQt4.Qt import QVBoxLayout, QMainWindow, QTreeWidgetItem, QIcon,\
     QMessageBox, QFileDialog, QWidget, QSplitter, QTreeWidget, QPushButton,\
     QLabel, QAction, QApplication, QHBoxLayout, QBrush, QColor, QSpinBox, Qt, \
@@ -78,12 +80,18 @@ class Graph(object):
         elif kind in ["STIME", "UTIME"]:
             ymax = 3200
             graph_type = Graph.TYPE_RATE
-        elif kind in ["RDTA", "TDTA"]:
+        elif kind in ["RDTA", "TDTA", "VDTA"]:
             ymax = 150000
             graph_type = Graph.TYPE_RATE
+        elif kind in ["VINF", "VREQ"]:
+            ymax = 1024
+            graph_type = Graph.TYPE_NORMAL
         elif kind in ["GPU"]:
             ymax = 300
             graph_type = Graph.TYPE_NORMAL
+        elif kind in ["MEM"]:
+            ymax = 16384
+            graph_type = Graph.TYPE_NORMAL
         else:
             return None
         return GraphDesc(graph_type, ymax, yshift, line_width, marker, zorder)
@@ -104,7 +112,42 @@ class Graph(object):
     
     # -------------------------------------------------------------------- #
         
+    def _readTimeline(self):
+        ''' Expands the samples of a binary timeline into the square wave the csv timelines hold. '''
+        timeline = TimelineFile(self._csv_path)
+        keep = np.ones(len(timeline), dtype = bool)
+        if self._ltrim:
+            keep &= timeline.start >= self._ltrim
+        if self._rtrim:
+            keep &= timeline.end <= self._rtrim
+        starts = timeline.start[keep] - self._xstart
+        ends = timeline.end[keep] - self._xstart
+        label_ids = timeline.label[keep]
+        
+        # A new section whenever the label changes:
+        bounds = np.flatnonzero(label_ids[1:] != label_ids[:-1]) + 1
+        x = np.column_stack((starts, starts, ends, ends)).ravel()
+        y = np.tile([0.0, 1.0, 1.0, 0.0], len(starts)) + self._desc.yshift
+        self._sections = []
+        for first, last in zip([0] + bounds.tolist(), bounds.tolist() + [len(starts)]):
+            if first == last:
+                continue
+            label = timeline.labels[label_ids[first]]
+            section = Section(label)
+            section.x = x[first * 4:last * 4].tolist()
+            section.y = y[first * 4:last * 4].tolist()
+            self._sections.append(section)
+            if not label in label_colors:
+                color_id = len(label_colors) % len(COLORS)
+                label_colors[label] = COLORS[color_id]
+    
+    # -------------------------------------------------------------------- #
+        
     def _readData(self):
+        if self._csv_path.endswith(".tl"):
+            self._readTimeline()
+            return
+        
         self._current_section = Section(None)
         self._sections = [self._current_section]
         
@@ -590,7 +633,7 @@ class MLGraphViewer(QMainWindow):
     def _loadDir(self, base_path, tree):
         for element in os.listdir(base_path):
             path = os.path.join(base_path, element)
-            if (not os.path.isdir(path)) and (not path.endswith(".csv")):
+            if (not os.path.isdir(path)) and (not path.endswith(".csv")) and (not path.endswith(".tl")):
                 continue
             
             if os.path.isdir(path):
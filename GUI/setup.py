@@ -9,8 +9,12 @@ setup(
 	package_data={'mltester': ['images/*']},	
 	install_requires=[
 		"matplotlib",
+		"numpy",
 		"CommonPyLib>=1.0.3",
 	],
+	extras_require={
+		"zstd": ["zstandard"],
+	},
 	dependency_links = ["git+https://github.com/Mellanox/CommonPyLib.git@master#egg=CommonPyLib-1.0.3"],
 	entry_points='''
 		[console_scripts]
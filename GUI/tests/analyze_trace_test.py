@@ -0,0 +1,313 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from mltester.actions.analysis_util import groupIds, groupStats, mergeIntervals
+from mltester.actions.analyze_trace import OpStatistics, TraceDevices, CriticalPathFinder, WorkerSteps, deviceUtilization, gpuIdleGaps, \
+    findTraceFiles, generateSkewReport, detectSteps, stepBreakdown, outlierSteps, OpDiff, \
+    memoryUsage, counterSeries, TensorTransfers, flowProducers
+from mltester.actions.analyze_layers import LayerCosts, blockName, layerName
+from mltester.actions.trace_table import StringTable, TraceTable
+
+###############################################################################
+
+def createTable(events, processes):
+    ''' events: (pid, tid, ts, dur, name[, node]) tuples. '''
+    names = StringTable()
+    categories = StringTable(["Op"])
+    columns = {"pid": np.array([e[0] for e in events], dtype = np.int32),
+               "tid": np.array([e[1] for e in events], dtype = np.int32),
+               "ts": np.array([e[2] for e in events], dtype = np.int64),
+               "dur": np.array([e[3] for e in events], dtype = np.int64),
+               "name_id": np.array([names.intern(e[4]) for e in events], dtype = np.int32),
+               "cat_id": np.zeros(len(events), dtype = np.int32),
+               "ph": np.array([ord("X")] * len(events), dtype = np.uint8),
+               "node_id": np.array([names.intern(e[5]) if len(e) > 5 else -1 for e in events], dtype = np.int32),
+               "value": np.zeros(len(events)),
+               "id": np.array([-1] * len(events), dtype = np.int64)}
+    return TraceTable(columns, names, categories, processes)
+
+###############################################################################
+
+class AnalyzeTraceTest(unittest.TestCase):
+
+    def test_group_stats(self):
+        ''' Vectorized per-group statistics match numpy on every group. '''
+        rand = np.random.RandomState(0)
+        keys_a = rand.randint(0, 4, 1000)
+        keys_b = rand.randint(0, 3, 1000)
+        values = rand.exponential(100.0, 1000)
+        ids, first = groupIds(keys_a, keys_b)
+        stats = groupStats(ids, len(first), values, (50, 90, 99))
+        self.assertEqual(len(first), 12)
+        for g in range(len(first)):
+            group = values[(keys_a == keys_a[first[g]]) & (keys_b == keys_b[first[g]])]
+            self.assertEqual(stats["count"][g], len(group))
+            self.assertAlmostEqual(stats["total"][g], group.sum())
+            self.assertAlmostEqual(stats["max"][g], group.max())
+            for q in (50, 90, 99):
+                self.assertAlmostEqual(stats["p%s" % q][g], np.percentile(group, q))
+
+    # --------------------------------------------------------------------------- #
+
+    def test_op_statistics(self):
+        table = createTable([(0, 0, 0, 10, "Conv2D"),
+                             (0, 0, 20, 30, "Conv2D"),
+                             (0, 0, 60, 5, "Relu"),
+                             (1, 0, 10, 80, "_Recv")],
+                            {0: "/job:worker/replica:0/task:0/device:GPU:0 Compute"})
+        stats = OpStatistics(table)
+        self.assertEqual(stats.step_time, 90)
+        self.assertEqual(stats.ops, ["_Recv", "Conv2D", "Relu"])
+        self.assertEqual(stats.processes[0], "pid_1")
+        self.assertEqual(stats.count.tolist(), [1, 2, 1])
+        self.assertEqual(stats.total.tolist(), [80, 40, 5])
+        self.assertEqual(stats.mean.tolist(), [80, 20, 5])
+        self.assertAlmostEqual(stats.share[1], 40 * 100.0 / 90)
+        
+        # Over 2 steps of 50 us, Conv2D takes 20 us per step:
+        stats = OpStatistics(table, step_time = 50, num_steps = 2)
+        self.assertEqual(stats.per_step.tolist(), [40, 20, 2.5])
+        self.assertEqual(stats.share.tolist(), [80, 40, 5])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_merge_intervals(self):
+        starts, ends = mergeIntervals(np.array([5, 0, 2, 20, 30]), np.array([8, 3, 4, 25, 30]))
+        self.assertEqual(starts.tolist(), [0, 5, 20, 30])
+        self.assertEqual(ends.tolist(), [4, 8, 25, 30])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_device_utilization(self):
+        processes = {0: "/job:localhost/replica:0/task:0/device:GPU:0 Compute",
+                     1: "/device:GPU:0/stream:all Compute",
+                     2: "/device:GPU:0/memcpy Compute",
+                     3: "/job:localhost/replica:0/task:0/device:CPU:0 Compute"}
+        table = createTable([(0, 0, 0, 10, "Conv2D"),
+                             (1, 5, 5, 20, "volta_sgemm"),
+                             (2, 7, 20, 20, "MEMCPYDtoH"),
+                             (3, 1, 50, 50, "_Recv")],
+                            processes)
+        devices = TraceDevices(table)
+        self.assertEqual(devices.deviceName(1), "/job:localhost/replica:0/task:0/device:GPU:0")
+        self.assertEqual(devices.deviceName(2), "/job:localhost/replica:0/task:0/device:GPU:0")
+        self.assertEqual(devices.communicationMask(table).tolist(), [False, False, True, True])
+        
+        gpu, cpu = [], []
+        for sample in deviceUtilization(table, [(0, 100), (30, 60)]):
+            (gpu if "GPU" in sample.device else cpu).append(sample)
+        self.assertEqual([(s.busy, s.compute, s.comm, s.overlap, s.idle) for s in gpu], [(40, 25, 20, 5, 60), (10, 0, 10, 0, 20)])
+        self.assertEqual([(s.busy, s.comm, s.idle) for s in cpu], [(50, 50, 50), (10, 10, 20)])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_stalls(self):
+        processes = {0: "/job:worker/replica:0/task:0/device:GPU:0 Compute",
+                     1: "/job:worker/replica:0/task:0/device:CPU:0 Compute"}
+        table = createTable([(0, 0, 0, 10, "Conv2D"),
+                             (1, 0, 5, 40, "_Recv"),
+                             (0, 0, 50, 10, "Conv2D"),
+                             (0, 0, 62, 8, "Relu")],
+                            processes)
+        gaps = gpuIdleGaps(table, [(0, 70)])
+        self.assertEqual([(gap.start, gap.end) for gap in gaps], [(10, 50), (60, 62)])
+        self.assertEqual(gaps[0].waited_on, 1)
+        self.assertEqual(gaps[1].waited_on, None)
+        
+        path = CriticalPathFinder(table).path(0, 70)
+        self.assertEqual([segment.event for segment in path], [1, 2, 3])
+        self.assertEqual([segment.wait for segment in path], [5, 5, 2])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_flow_stalls(self):
+        # The PS read feeds the worker's MatMul through a flow, while an unrelated copy finishes later in the gap:
+        events = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "/job:worker/replica:0/task:0/device:GPU:0 Compute"}},
+                  {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "/job:worker/replica:0/task:0/device:CPU:0 Compute"}},
+                  {"name": "process_name", "ph": "M", "pid": 2, "args": {"name": "/job:ps/replica:0/task:0/device:CPU:0 Compute"}},
+                  {"name": "process_name", "ph": "M", "pid": 3, "args": {"name": "/device:GPU:0/memcpy Compute"}},
+                  {"name": "Identity", "ph": "X", "pid": 2, "tid": 0, "ts": 0, "dur": 50, "args": {"name": "w/read"}},
+                  {"name": "_Recv", "ph": "X", "pid": 1, "tid": 0, "ts": 0, "dur": 390, "args": {"name": "w/_recv"}},
+                  {"name": "MEMCPYHtoD", "ph": "X", "pid": 3, "tid": 0, "ts": 300, "dur": 95, "args": {"name": "edge_1"}},
+                  {"name": "MatMul", "ph": "X", "pid": 0, "tid": 0, "ts": 400, "dur": 100, "args": {"name": "w/MatMul"}},
+                  {"name": "w/read", "ph": "s", "cat": "DataFlow", "pid": 2, "tid": 0, "ts": 50, "id": 1},
+                  {"name": "w/read", "ph": "t", "cat": "DataFlow", "pid": 0, "tid": 0, "ts": 400, "id": 1}]
+        trace_dir = tempfile.mkdtemp()
+        try:
+            trace_path = os.path.join(trace_dir, "trace_worker_0.json")
+            with open(trace_path, "w") as f:
+                json.dump({"traceEvents": events}, f)
+            table = TraceTable.fromFile(trace_path, use_cache = False)
+        finally:
+            shutil.rmtree(trace_dir)
+        
+        ops = dict((table.nodeName(i), i) for i in np.nonzero(table.mask(ph = "X"))[0].tolist())
+        producers = flowProducers(table)
+        self.assertEqual(producers[ops["w/MatMul"]], ops["w/read"])
+        self.assertEqual(producers[ops["edge_1"]], -1)
+        
+        gaps = gpuIdleGaps(table, [(0, 500)])
+        self.assertEqual([(gap.start, gap.end) for gap in gaps], [(0, 400)])
+        self.assertEqual(gaps[0].waited_on, ops["w/read"])
+        
+        path = CriticalPathFinder(table).path(0, 500)
+        self.assertEqual([segment.event for segment in path], [ops["w/read"], ops["w/MatMul"]])
+        self.assertEqual([segment.wait for segment in path], [0, 350])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_steps(self):
+        processes = {0: "/job:worker/replica:0/task:0/device:GPU:0 Compute",
+                     1: "/job:worker/replica:0/task:0/device:CPU:0 Compute"}
+        events = []
+        for step, start in enumerate([10, 100, 200]):
+            events += [(0, 0, start, 1, "NoOp", "_SOURCE"),
+                       (0, 0, start + 10, 40, "Conv2D", "conv0/Conv2D"),
+                       (1, 0, start + 30, 30, "_Recv", "conv0/read/_%u" % step)]
+        events.append((1, 0, 5, 2, "NoOp", "init"))
+        steps = detectSteps(createTable(events, processes))
+        self.assertEqual(steps.source, "markers")
+        self.assertEqual(steps.windows(), [(5, 100), (100, 200), (200, 260)])
+        # The last step ends with the trace, and is left out of the step time:
+        self.assertEqual(steps.complete.tolist(), [True, True, False])
+        self.assertEqual(steps.meanDuration(), 97.5)
+        self.assertEqual(steps.completeMask(createTable(events, processes)).sum(), 7)
+        self.assertEqual(WorkerSteps("worker_0", "a", steps.windows(), steps.complete.tolist()).durations, [95, 100])
+        
+        # Without markers, from the first node of each device:
+        periodic = detectSteps(createTable([e for e in events if e[5] != "_SOURCE"], processes))
+        self.assertEqual(periodic.source, "periodicity")
+        self.assertEqual(periodic.windows(), [(5, 110), (110, 210), (210, 260)])
+        
+        breakdown = stepBreakdown(createTable(events, processes), steps)
+        self.assertEqual([(s.compute, s.comm, s.overlap, s.idle) for s in breakdown[1:]], [(41, 30, 20, 49), (41, 30, 20, 9)])
+        
+        outliers, threshold = outlierSteps([100, 100, 100, 100, 300], 75)
+        self.assertEqual(outliers.tolist(), [False, False, False, False, True])
+        self.assertEqual(threshold, 100)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_op_diff(self):
+        processes = {0: "/job:worker/replica:0/task:0/device:GPU:0 Compute"}
+        table_a = createTable([(0, 0, 0, 10, "Conv2D"), (0, 0, 10, 5, "Relu"), (0, 0, 15, 5, "Relu")], processes)
+        table_b = createTable([(0, 0, 0, 30, "Conv2D"), (0, 0, 30, 4, "Relu"), (0, 0, 34, 6, "MatMul")], processes)
+        diff = OpDiff(OpStatistics(table_a), OpStatistics(table_b))
+        self.assertEqual(diff.step_delta, 20)
+        self.assertEqual(diff.ops, ["Conv2D", "MatMul", "Relu"])
+        self.assertEqual(diff.delta.tolist(), [20, 6, -6])
+        self.assertEqual(diff.contribution.tolist(), [100, 30, -30])
+        self.assertEqual(diff.count_a.tolist(), [1, 0, 2])
+        self.assertEqual(diff.mean_b.tolist(), [30, 6, 4])
+        
+        # Totals are per step:
+        diff = OpDiff(OpStatistics(table_a, step_time = 10), OpStatistics(table_b, step_time = 20), 2, 2)
+        self.assertEqual(diff.total_b.tolist(), [15, 3, 2])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_memory(self):
+        events = [{"name": "GPU_0_bfc", "ph": "C", "cat": "Memory", "pid": 7, "tid": 0, "ts": ts, "args": {"GPU_0_bfc": val}}
+                  for ts, val in [(30, 300), (10, 100), (50, 200), (120, 50), (150, 250)]]
+        events.append({"name": "Conv2D", "ph": "X", "cat": "Op", "pid": 0, "tid": 0, "ts": 0, "dur": 200})
+        trace_dir = tempfile.mkdtemp()
+        try:
+            trace_path = os.path.join(trace_dir, "trace_worker_0.json")
+            with open(trace_path, "w") as f:
+                json.dump({"traceEvents": events}, f)
+            table = TraceTable.fromFile(trace_path, use_cache = False)
+        finally:
+            shutil.rmtree(trace_dir)
+        
+        ts, values = counterSeries(table)["GPU_0_bfc"]
+        self.assertEqual(ts.tolist(), [10, 30, 50, 120, 150])
+        self.assertEqual(values.tolist(), [100, 300, 200, 50, 250])
+        usage = memoryUsage(table, [(0, 100), (100, 140), (140, 200)])
+        self.assertEqual([(u.start, u.peak, u.high_water) for u in usage], [(0, 300, 300), (200, 200, 300), (50, 250, 300)])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_transfers(self):
+        snapshot = {"tensor_description": "dtype: DT_FLOAT\nallocation_description {\n  requested_bytes: 4096\n}\n"}
+        events = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "/job:worker/replica:0/task:1/device:GPU:0 Compute"}},
+                  {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "/job:ps/replica:0/task:0/device:CPU:0 Compute"}},
+                  {"name": "w/read:0", "ph": "O", "cat": "Tensor", "pid": 1, "tid": 0, "ts": 5, "id": 100, "args": {"snapshot": snapshot}},
+                  {"name": "w/read", "ph": "s", "cat": "DataFlow", "pid": 1, "tid": 0, "ts": 10, "id": 1},
+                  {"name": "w/read", "ph": "t", "cat": "DataFlow", "pid": 0, "tid": 0, "ts": 60, "id": 1},
+                  {"name": "w/read", "ph": "s", "cat": "DataFlow", "pid": 1, "tid": 0, "ts": 100, "id": 2},
+                  {"name": "w/read", "ph": "f", "cat": "DataFlow", "pid": 0, "tid": 0, "ts": 130, "id": 2},
+                  {"name": "b/read", "ph": "t", "cat": "DataFlow", "pid": 0, "tid": 0, "ts": 130, "id": 3}]
+        trace_dir = tempfile.mkdtemp()
+        try:
+            trace_path = os.path.join(trace_dir, "trace_worker_1.json")
+            with open(trace_path, "w") as f:
+                json.dump({"traceEvents": events}, f)
+            transfers = TensorTransfers(TraceTable.fromFile(trace_path, use_cache = False))
+        finally:
+            shutil.rmtree(trace_dir)
+        
+        self.assertEqual(transfers.latency.tolist(), [50, 30])
+        self.assertEqual(transfers.size.tolist(), [4096, 4096])
+        names, stats = transfers.byTensor()
+        self.assertEqual(names, ["w/read"])
+        self.assertEqual(stats["mean"].tolist(), [40])
+        pairs, stats = transfers.byJobPair()
+        self.assertEqual(pairs, [("ps:0", "worker:1")])
+        self.assertEqual(stats["bytes"].tolist(), [8192])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_layers(self):
+        self.assertEqual(layerName("v0/tower_0/gradients/v0/cg/resnet_v15/conv3/Conv2D_grad/Conv2DBackpropFilter"), "resnet_v15")
+        self.assertEqual(layerName("v0/cg/conv0/kernel/read/_5"), "conv0")
+        self.assertEqual(layerName("input_processing/Cast"), None)
+        self.assertEqual([blockName("resnet_v1%u" % i, "resnet50") for i in [0, 2, 3, 15]], ["block1", "block1", "block2", "block4"])
+        self.assertEqual([blockName(layer, "vgg16") for layer in ["conv1", "conv2", "mpool0"]], ["block1", "block2", "mpool0"])
+        self.assertEqual(blockName("conv1", "trivial"), "conv1")
+        
+        processes = {0: "/job:worker/replica:0/task:0/device:GPU:0 Compute",
+                     1: "/job:worker/replica:0/task:0/device:CPU:0 Compute",
+                     2: "/device:GPU:0/stream:all Compute"}
+        costs = LayerCosts(createTable([(0, 0, 10, 40, "Conv2D", "v0/cg/conv1/conv2d/Conv2D"),
+                                        (0, 0, 0, 10, "Conv2D", "v0/cg/conv0/conv2d/Conv2D"),
+                                        (2, 0, 0, 10, "volta_scudnn", "v0/cg/conv0/conv2d/Conv2D"),
+                                        (0, 0, 50, 30, "Conv2DBackpropFilter", "v0/tower_0/gradients/v0/cg/conv1/conv2d/Conv2D_grad/Conv2DBackpropFilter"),
+                                        (1, 0, 0, 25, "_Recv", "v0/cg/conv0/kernel/read/_1"),
+                                        (0, 0, 80, 5, "ApplyGradientDescent", "v0/GradientDescent/update")], processes))
+        self.assertEqual(costs.layers, ["conv0", "conv1"])
+        self.assertEqual(costs.forward.tolist(), [10, 40])
+        self.assertEqual(costs.backward.tolist(), [0, 30])
+        self.assertEqual(costs.exchange.tolist(), [25, 0])
+        self.assertEqual(costs.is_comm_bound.tolist(), [True, False])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_worker_skew(self):
+        logs_dir = tempfile.mkdtemp()
+        try:
+            for file_name in ["trace_worker_10.json", "trace_worker_2.json.gz", "trace_ps_0.json", "graph.txt", "trace_worker_1.json.npz"]:
+                open(os.path.join(logs_dir, file_name), "w").close()
+            self.assertEqual([label for label, _ in findTraceFiles(logs_dir)], ["ps_0", "worker_2", "worker_10"])
+            
+            workers = [WorkerSteps("worker_0", "a", [(0, 100), (100, 150)]),
+                       WorkerSteps("worker_1", "b", [(0, 120), (120, 160)]),
+                       WorkerSteps("worker_2", "c", [(0, 110)])]
+            generateSkewReport(workers, logs_dir)
+            with open(os.path.join(logs_dir, "worker_skew.csv")) as f:
+                rows = [line.strip().split(",") for line in f.readlines()[1:]]
+            self.assertEqual([row[1] for row in rows], ["worker_1", "worker_0"])
+            self.assertEqual([int(row[6]) for row in rows], [20, 10])
+        finally:
+            shutil.rmtree(logs_dir)
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
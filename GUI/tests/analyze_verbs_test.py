@@ -0,0 +1,331 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+from mltester.actions.analysis_util import LogHistogram, groupHistograms
+from mltester.actions.analyze_verbs import analyzeVerbs, mergeVerbs, TimelineList, TimelineSample, generateReport, generateHistogramReport, sizeBuckets, \
+    linkSeries, jobPairs, requestBandwidth, estimateHostClocks, generateClockReport, concurrencyProfile, inFlightAtStart, \
+    generateConcurrencyReport, stepStragglers, generateStragglerReport
+from mltester.actions.timeline_file import TimelineFile
+from mltester.actions.verbs_follow import VerbsFollower
+from mltester.actions.verbs_table import VerbsTable
+
+###############################################################################
+
+def linearLanes(samples):
+    ''' Lane of every sample (in start order) by scanning all the lanes for the first free one. '''
+    last_ts = []
+    res = []
+    for sample in sorted(samples, key=lambda x: x.start):
+        lane = ([i for i, ts in enumerate(last_ts) if sample.start >= ts] or [len(last_ts)])[0]
+        if lane == len(last_ts):
+            last_ts.append(0)
+        last_ts[lane] = sample.end
+        res.append((lane, sample.start, sample.end))
+    return res
+
+###############################################################################
+
+WORKER = "/job:worker/replica:0/task:0/device:CPU:0"
+PS = "/job:ps/replica:0/task:0/device:CPU:0"
+KEY_A = "%s;1;%s;v0/cg/conv0/kernel/read" % (PS, WORKER)
+KEY_B = "%s;2;%s;v0/cg/conv1/kernel/read" % (PS, WORKER)
+
+###############################################################################
+
+class AnalyzeVerbsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    # --------------------------------------------------------------------------- #
+
+    def _quiet(self, fn, *args, **kwargs):
+        ''' fn(*args, **kwargs) with its report tables kept off the test output. '''
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    # --------------------------------------------------------------------------- #
+
+    def _writeLog(self, start_lines, done_lines):
+        paths = [os.path.join(self._temp_dir, file_name) for file_name in ["requests_start.csv", "requests_done.csv"]]
+        for path, lines in zip(paths, [start_lines, done_lines]):
+            with open(path, "w") as f:
+                f.write("".join(line + "\n" for line in lines))
+        return paths
+
+    # --------------------------------------------------------------------------- #
+
+    def test_join(self):
+        start_path, done_path = self._writeLog(["1000000,7,%s" % KEY_A, "1000100,7,%s" % KEY_B, "1000200,7,%s" % KEY_A,
+                                                "2000000,8,%s" % KEY_A, "2000000,8,%s" % KEY_B],
+                                               ["1000500,7,%s,400" % KEY_B, "1000700,7,%s,1000" % KEY_A, "2000300,8,%s,1000" % KEY_A])
+        table = VerbsTable.fromFiles(start_path, done_path)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.num_started, 5)
+        self.assertEqual([table.keys[i] for i in table.key_id.tolist()], [KEY_B, KEY_A, KEY_A])
+        self.assertEqual([table.steps[i] for i in table.step_id.tolist()], ["7", "7", "8"])
+        # KEY_A was started twice in step 7; the request is the later one:
+        self.assertEqual(table.start.tolist(), [1.0001, 1.0002, 2.0])
+        self.assertEqual([round(latency * 1000000) for latency in table.latency.tolist()], [400, 500, 300])
+        self.assertEqual(table.size.tolist(), [0x400, 0x1000, 0x1000])
+
+        # Read a few lines at a time, the ids are the same:
+        chunked = VerbsTable.fromFiles(start_path, done_path, chunk_size = 100)
+        for column in VerbsTable.COLUMNS:
+            self.assertEqual(getattr(chunked, column).tolist(), getattr(table, column).tolist())
+        self.assertEqual(chunked.keys.strings, table.keys.strings)
+
+        start_path, done_path = self._writeLog(["1000000,7,%s" % KEY_A], ["1000500,8,%s,400" % KEY_A])
+        self.assertRaises(ValueError, VerbsTable.fromFiles, start_path, done_path)
+        start_path, done_path = self._writeLog(["1000000,7,%s" % KEY_A], ["1000000,7,%s,400" % KEY_A])
+        self.assertRaises(ValueError, VerbsTable.fromFiles, start_path, done_path)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_log_histogram(self):
+        rand = np.random.RandomState(0)
+        values = rand.lognormal(6.0, 1.5, 5000)
+        hist = LogHistogram(1.0, 1e7, 20)
+        hist.add(values[:2000])
+        part = LogHistogram(1.0, 1e7, 20)
+        part.add(values[2000:])
+        hist.merge(part)
+        self.assertEqual(len(hist), len(values))
+        for q in (50, 90, 99, 99.9):
+            self.assertLess(abs(np.log10(hist.quantile(q) / np.percentile(values, q))), 1.0 / 20)
+        self.assertRaises(ValueError, hist.merge, LogHistogram(1.0, 1e7, 10))
+
+        ids = rand.randint(0, 3, len(values))
+        for group, group_hist in enumerate(groupHistograms(ids, 4, values, 1.0, 1e7, 20)):
+            expected = LogHistogram(1.0, 1e7, 20)
+            expected.add(values[ids == group])
+            self.assertEqual(group_hist.counts.tolist(), expected.counts.tolist())
+
+    # --------------------------------------------------------------------------- #
+
+    def test_latency_report(self):
+        self.assertEqual(sizeBuckets(np.array([10, 1 << 10, 5000, 1 << 30]))[0].tolist(), [0, 1, 2, 8])
+        start_lines = ["%u,%u,%s" % (1000000 * step, step, key) for step in xrange(1000) for key in [KEY_A, KEY_B]]
+        done_lines = ["%u,%u,%s,%x" % (1000000 * step + (step + 1 if key == KEY_A else 10), step, key, 1 << 20 if key == KEY_A else 100)
+                      for step in xrange(1000) for key in [KEY_A, KEY_B]]
+        table = VerbsTable.fromFiles(*self._writeLog(start_lines, done_lines))
+        self._quiet(generateReport, table, self._temp_dir, min_steps = 1)
+        self._quiet(generateHistogramReport, table, self._temp_dir, min_steps = 1)
+        with open(os.path.join(self._temp_dir, "verbs_latency.csv")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "Tensor,Src,Dst,Requests,Size,Mean (us),Min (us),p50 (us),p90 (us),p99 (us),p99.9 (us),Max (us)")
+        self.assertEqual(lines[1], "v0/cg/conv0/kernel/read,ps:0,worker:0,1000,1048576,500.5,1.0,500.5,900.1,990.0,999.0,1000.0")
+        with open(os.path.join(self._temp_dir, "verbs_size_histogram.csv")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual([line.split(",")[:2] for line in lines[1:]], [["<1K", "1000"], ["1M-4M", "1000"]])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_short_run(self):
+        # 50 steps: no tensor reaches the default min_steps, so the per-tensor reports are empty:
+        start_lines = ["%u,%u,%s" % (1000000 * step, step, key) for step in xrange(50) for key in [KEY_A, KEY_B]]
+        done_lines = ["%u,%u,%s,400" % (1000000 * step + 100, step, key) for step in xrange(50) for key in [KEY_A, KEY_B]]
+        start_path, done_path = self._writeLog(start_lines, done_lines)
+        table = self._quiet(analyzeVerbs, start_path, done_path, self._temp_dir)
+        self.assertEqual(len(table), 100)
+        with open(os.path.join(self._temp_dir, "verbs_histogram.csv")) as f:
+            self.assertEqual(f.read().splitlines(), ["Tensor,Requests"])
+        with open(os.path.join(self._temp_dir, "verbs_latency.csv")) as f:
+            self.assertEqual(len(f.read().splitlines()), 1)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_link_series(self):
+        # 1000 bytes over [0.5, 2.5) ms and 3000 bytes over [1, 1.9) ms:
+        ts, in_flight, completed = linkSeries(np.array([0.0005, 0.001]), np.array([0.0025, 0.0019]), np.array([1000, 3000]))
+        self.assertEqual(len(ts), 3)
+        self.assertTrue(np.allclose(ts, [0.001, 0.002, 0.003]))
+        self.assertTrue(np.allclose(in_flight, [500, 3700, 500]))
+        self.assertEqual(completed.tolist(), [0, 3000, 4000])
+
+        start_path, done_path = self._writeLog(["1000000,1,%s" % KEY_A, "1000000,1,%s" % KEY_B.replace(PS, WORKER + "x")],
+                                               ["1000100,1,%s,4e2" % KEY_A, "1000400,1,%s,4e2" % KEY_B.replace(PS, WORKER + "x")])
+        table = VerbsTable.fromFiles(start_path, done_path)
+        pair_ids, pairs = jobPairs(table)
+        self.assertEqual(pairs, ["ps:0->worker:0", "worker:0->worker:0"])
+        self.assertEqual([pairs[i] for i in pair_ids.tolist()], ["ps:0->worker:0", "worker:0->worker:0"])
+        self.assertTrue(np.allclose(requestBandwidth(table), [0x4e2 * 8 / 100e-6 / 1e9, 0x4e2 * 8 / 400e-6 / 1e9]))
+
+    # --------------------------------------------------------------------------- #
+
+    def test_concurrency(self):
+        start, done = np.array([0.0, 1.0, 1.0, 5.0]), np.array([2.0, 3.0, 4.0, 6.0])
+        time_at, peak = concurrencyProfile(start, done)
+        self.assertEqual((time_at.tolist(), peak), ([1, 3, 1, 1], 3))
+        self.assertEqual(inFlightAtStart(start, done).tolist(), [1, 3, 3, 1])
+        # A request that ends when the next one starts doesn't overlap it:
+        self.assertEqual(concurrencyProfile(np.array([0.0, 1.0]), np.array([1.0, 2.0]))[1], 1)
+        self.assertEqual(inFlightAtStart(np.array([0.0, 1.0]), np.array([1.0, 2.0])).tolist(), [1, 1])
+
+        table = VerbsTable.fromFiles(*self._writeLog(["%u,%u,%s" % (ts * 1000000, step, KEY_A) for step, ts in enumerate(start)],
+                                                     ["%u,%u,%s,400" % (ts * 1000000, step, KEY_A) for step, ts in enumerate(done)]))
+        self._quiet(generateConcurrencyReport, table, self._temp_dir, queue_depth = 2)
+        with open(os.path.join(self._temp_dir, "verbs_concurrency.csv")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1].split(",")[:8], ["ps:0->worker:0", "4", "1.3", "1", "3", "3", "150.0", "33.33"])
+        with open(os.path.join(self._temp_dir, "verbs_concurrency_latency.csv")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual([line.split(",")[1:] for line in lines[1:]], [["1", "2", "1500000.0", "1990000.0", "1.00"],
+                                                                       [">=2", "2", "2500000.0", "2990000.0", "1.67"]])
+
+        # A request left with a non-positive latency by a clock correction is skipped, not counted below zero:
+        table.done[0] = table.start[0]
+        table.latency = table.done - table.start
+        self._quiet(generateConcurrencyReport, table, self._temp_dir, queue_depth = 2)
+        with open(os.path.join(self._temp_dir, "verbs_concurrency.csv")) as f:
+            self.assertEqual(f.read().splitlines()[1].split(",")[:2], ["ps:0->worker:0", "3"])
+        self.assertRaises(ValueError, generateConcurrencyReport, table, self._temp_dir, queue_depth = 0)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_stragglers(self):
+        # (step, key, start, done) in usec; step 3 has a single request:
+        requests = [(1, KEY_A, 0, 10), (1, KEY_B, 1, 4), (2, KEY_A, 100, 103), (2, KEY_B, 101, 108), (3, KEY_A, 200, 202)]
+        table = VerbsTable.fromFiles(*self._writeLog(["%u,%u,%s" % (1000000 + start, step, key) for step, key, start, _ in requests],
+                                                     ["%u,%u,%s,400" % (1000000 + done, step, key) for step, key, _, done in requests]))
+        steps, stragglers, wall, exposed = stepStragglers(table)
+        self.assertEqual([table.steps[i] for i in steps.tolist()], ["1", "2", "3"])
+        self.assertEqual([table.keys[table.key_id[i]] for i in stragglers.tolist()], [KEY_A, KEY_B, KEY_A])
+        self.assertEqual([round(t * 1000000) for t in wall.tolist()], [10, 8, 2])
+        self.assertEqual([round(t * 1000000) for t in exposed.tolist()], [6, 5, 2])
+
+        self._quiet(generateStragglerReport, table, self._temp_dir)
+        with open(os.path.join(self._temp_dir, "verbs_step_stragglers.csv")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[2], "2,v0/cg/conv1/kernel/read,8.0,7.0,87.5,5.0")
+        with open(os.path.join(self._temp_dir, "verbs_stragglers.csv")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual([line.split(",")[:7] for line in lines[1:]], [["v0/cg/conv0/kernel/read", "ps:0", "worker:0", "2", "66.7", "100.0", "4.0"],
+                                                                       ["v0/cg/conv1/kernel/read", "ps:0", "worker:0", "1", "33.3", "87.5", "5.0"]])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_timeline_lanes(self):
+        random.seed(3)
+        samples = []
+        for i in xrange(2000):
+            start = random.randint(0, 20000)
+            samples.append(TimelineSample(start, start + random.choice([0, 1, random.randint(1, 300)]), "t%u" % i))
+        self._quiet(TimelineList(self._temp_dir).generate, samples)
+
+        lanes = []
+        for file_name in sorted(os.listdir(self._temp_dir)):
+            tl = TimelineFile(os.path.join(self._temp_dir, file_name))
+            lanes += [(int(file_name[-6:-3]), start, end) for start, end in zip(tl.start.tolist(), tl.end.tolist())]
+        expected = linearLanes(samples)
+        self.assertEqual(sorted(lanes), sorted(expected))
+        self.assertEqual(len(set(lane for lane, _, _ in lanes)), max(lane for lane, _, _ in expected) + 1)
+
+    # --------------------------------------------------------------------------- #
+
+    def _writeHostLogs(self):
+        ''' [(start, done)] of a worker and a ps whose clock is 500 usec ahead; requests take 10 usec at best, each way. '''
+        logs = []
+        for host, lines in [("worker", [("1000000,1,%s" % KEY_A, "1000210,2,%s,400" % KEY_B)]),
+                            ("ps", [("1000700,2,%s" % KEY_B, "1000510,1,%s,400" % KEY_A),
+                                    ("2000500,3,%s" % KEY_A, "2000520,3,%s,400" % KEY_A)])]:
+            host_dir = os.path.join(self._temp_dir, host)
+            os.mkdir(host_dir)
+            paths = [os.path.join(host_dir, file_name) for file_name in ["requests_start.csv", "requests_done.csv"]]
+            for path, column in zip(paths, zip(*lines)):
+                with open(path, "w") as f:
+                    f.write("".join(line + "\n" for line in column))
+            logs.append(paths)
+        return logs
+
+    # --------------------------------------------------------------------------- #
+
+    def test_host_clocks(self):
+        table = VerbsTable.fromHosts(self._writeHostLogs())
+        # Done lines in host order:
+        self.assertEqual(table.start_host.tolist(), [1, 0, 1])
+        self.assertEqual(table.done_host.tolist(), [0, 1, 1])
+
+        hosts = ["worker:0", "ps:0"]
+        clocks = estimateHostClocks(table, hosts)
+        self.assertEqual(sorted(clocks), hosts[::-1])
+        self.assertAlmostEqual(clocks["ps:0"][0], 500e-6)
+        self.assertAlmostEqual(clocks["ps:0"][1], 10e-6)
+        self.assertEqual(estimateHostClocks(table, hosts, {"ps:0": 480}, align = False), {"worker:0": (0.0, 0.0), "ps:0": (480e-6, 0.0)})
+
+        table.shiftClocks([clocks[host][0] for host in hosts])
+        self.assertEqual([round(latency * 1000000) for latency in table.latency.tolist()], [10, 10, 20])
+        self._quiet(generateClockReport, table, hosts, clocks, self._temp_dir)
+        with open(os.path.join(self._temp_dir, "verbs_one_way.csv")) as f:
+            rows = [line.split(",") for line in f.read().splitlines()[1:]]
+        self.assertEqual([row[:3] + row[-1:] for row in rows], [["worker:0", "ps:0", "1", "10.0"], ["ps:0", "worker:0", "1", "10.0"],
+                                                                ["ps:0", "ps:0", "1", "0.0"]])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_merge(self):
+        # Forcing 400 usec instead of 500 leaves the ps -> worker request at -90 usec; it is left out of the reports:
+        logs = [(host, start_path, done_path) for host, (start_path, done_path) in zip(["worker:0", "ps:0"], self._writeHostLogs())]
+        table, clocks = self._quiet(mergeVerbs, logs, self._temp_dir, {"ps:0": 400}, align = False)
+        self.assertEqual(clocks["ps:0"], (400e-6, 0.0))
+        self.assertEqual([round(latency * 1000000) for latency in table.latency.tolist()], [110, 20])
+        with open(os.path.join(self._temp_dir, "verbs_one_way.csv")) as f:
+            self.assertEqual(len(f.read().splitlines()), 4)
+        with open(os.path.join(self._temp_dir, "verbs_bandwidth.csv")) as f:
+            row = f.read().splitlines()[1].split(",")
+        self.assertEqual(row[:2], ["ps:0->worker:0", "2"])
+        self.assertTrue(all(np.isfinite(float(value)) and (float(value) >= 0) for value in row[2:-1]))
+
+    # --------------------------------------------------------------------------- #
+
+    def test_follow(self):
+        start_path, done_path = [os.path.join(self._temp_dir, file_name) for file_name in ["requests_start.csv", "requests_done.csv"]]
+        follower = VerbsFollower(start_path, done_path, self._temp_dir, max_steps = 2)
+        self.assertEqual(follower.poll(), 0)    # Not created yet
+        with open(start_path, "w") as start_file, open(done_path, "w") as done_file:
+            start_file.write("1000000,1,%s\n1000000,1,%s\n1000" % (KEY_A, KEY_B))
+            start_file.flush()
+            # KEY_B's done is read before its start line is complete, and is matched on the next poll:
+            done_file.write("1000100,1,%s,400\n1000200,2,%s,400\n" % (KEY_A, KEY_B))
+            done_file.flush()
+            self.assertEqual(follower.poll(), 1)
+            start_file.write("100,2,%s\n" % KEY_B)
+            start_file.flush()
+            self.assertEqual(follower.poll(), 1)
+            # Steps 1 and 2 are evicted by steps 3 and 4, along with KEY_B of step 1 which never completed:
+            start_file.write("3000000,3,%s\n4000000,4,%s\n" % (KEY_A, KEY_A))
+            start_file.flush()
+            done_file.write("4000300,4,%s,400\n5000000,5,%s,400\n" % (KEY_A, KEY_A))
+            done_file.flush()
+            self.assertEqual(follower.poll(), 1)
+            self.assertEqual(follower.poll(), 0)
+        self.assertEqual((follower.num_completed, follower.num_evicted, follower.num_unmatched), (3, 1, 1))
+
+        self._quiet(follower.publish)
+        with open(os.path.join(self._temp_dir, "verbs_live.csv")) as f:
+            lines = f.read().splitlines()
+        # The max is exact, not a histogram bin:
+        self.assertEqual([line.split(",")[:5] + line.split(",")[7:8] for line in lines[1:]],
+                         [["v0/cg/conv0/kernel/read", "ps:0", "worker:0", "2", "1024", "300"],
+                          ["v0/cg/conv1/kernel/read", "ps:0", "worker:0", "1", "1024", "100"]])
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from mltester.actions.timeline_file import TimelineFile, createTimelineWriter
+
+###############################################################################
+
+class TestTimelineFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_round_trip(self):
+        writer = createTimelineWriter(os.path.join(self.dir, "TL-a"))
+        writer.add(1.0, 1.5, "Conv2D")
+        writer.add(2.0, 2.25, u"Relu→")
+        writer.addMany(np.array([3.0, 4.0]), np.array([3.5, 4.5]), np.array([2, 0]), ["Conv2D", "MatMul", "Relu"])
+        writer.close()
+        
+        timeline = TimelineFile(os.path.join(self.dir, "TL-a.tl"))
+        self.assertEqual(len(timeline), 4)
+        self.assertEqual(timeline.start.tolist(), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(timeline.end.tolist(), [1.5, 2.25, 3.5, 4.5])
+        self.assertEqual([timeline.labels[i] for i in timeline.label], [u"Conv2D", u"Relu→", u"Relu", u"Conv2D"])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_labels(self):
+        file_path = os.path.join(self.dir, "TL-labels.tl")
+        writer = createTimelineWriter(os.path.join(self.dir, "TL-labels"))
+        for i, label in enumerate(["a\nb", "", u"c→"]):
+            writer.add(i, i + 0.5, label)
+        writer.close()
+        self.assertEqual(TimelineFile(file_path).labels, [u"a\nb", u"", u"c→"])
+        
+        # A truncated label section doesn't match the header's label count:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        with open(file_path, "wb") as f:
+            f.write(data[:-2])
+        self.assertRaises(ValueError, TimelineFile, file_path)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_empty(self):
+        createTimelineWriter(os.path.join(self.dir, "TL-empty")).close()
+        timeline = TimelineFile(os.path.join(self.dir, "TL-empty.tl"))
+        self.assertEqual(len(timeline), 0)
+        self.assertEqual(timeline.labels, [])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_csv(self):
+        writer = createTimelineWriter(os.path.join(self.dir, "TL-b"), "csv")
+        writer.addMany(np.array([1.0]), np.array([1.5]), np.array([0]), ["Conv2D"])
+        writer.close()
+        with open(os.path.join(self.dir, "TL-b.csv")) as f:
+            self.assertEqual(f.read(), "1.000000, 0, Conv2D\n1.000000, 1\n1.500000, 1\n1.500000, 0\n")
+        self.assertRaises(ValueError, createTimelineWriter, os.path.join(self.dir, "TL-c"), "xml")
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
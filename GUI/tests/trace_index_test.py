@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from mltester.actions.trace_index import TraceIndex
+from mltester.actions.trace_table import TraceTable
+
+###############################################################################
+
+class TraceIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._trace_path = os.path.join(self._temp_dir, "trace_worker_0.json")
+        rand = np.random.RandomState(0)
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "/device:GPU:%u/stream:all Compute" % pid}} for pid in range(3)]
+        for i in range(500):
+            events.append({"name": "op%u" % (i % 7), "ph": "X", "cat": "Op", "pid": int(rand.randint(0, 3)), "tid": 0,
+                           "ts": int(rand.randint(0, 10000)), "dur": int(rand.exponential(100))})
+        with open(self._trace_path, "w") as f:
+            json.dump({"traceEvents": events}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_query(self):
+        ''' Window queries return the same events as masking the whole table. '''
+        table = TraceTable.fromFile(self._trace_path)
+        index = TraceIndex.fromFile(self._trace_path)
+        self.assertEqual(len(index), len(table))
+        for t0, t1, pids in [(None, None, None), (2000, 2500, None), (0, 100, [1]), (9000, None, [0, 2]), (5000, 5000, None)]:
+            expected = table.select(table.mask(t0 = t0, t1 = t1, pid = pids))
+            res = index.query(t0, t1, pids)
+            self.assertEqual(sorted(zip(res.pid, res.ts, res.dur, res.name_id)),
+                             sorted(zip(expected.pid, expected.ts, expected.dur, expected.name_id)))
+        self.assertEqual(index.devicePids(["GPU:1", "GPU:2"]), [1, 2])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_rebuild(self):
+        index_dir = TraceIndex.indexPath(self._trace_path)
+        TraceIndex.fromFile(self._trace_path)
+        with open(self._trace_path, "w") as f:
+            json.dump([{"name": "op", "ph": "X", "pid": 5, "tid": 0, "ts": 1, "dur": 2}], f)
+        os.utime(os.path.join(index_dir, "meta.json"), (0, 0))
+        index = TraceIndex.fromFile(self._trace_path)
+        self.assertEqual(index.pids.tolist(), [5])
+        self.assertEqual(index.timeRange(5), (1, 1))
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
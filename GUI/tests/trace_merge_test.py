@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mltester.actions.analysis_util import estimateClockOffset, alignClocks
+from mltester.actions.trace_reader import iterTraceEvents
+from mltester.actions.trace_merge import TraceMerger, mergeTraces
+
+###############################################################################
+
+# Host clocks relative to worker:0 (usec); every transfer takes 10 usec:
+CLOCKS = {"worker:0": 0, "worker:1": -300, "ps:0": 500}
+DELAY = 10
+
+def workerTrace(task, t):
+    worker = "worker:%u" % task
+    events = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "/job:worker/replica:0/task:%u/device:GPU:0 Compute" % task}},
+              {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "/job:ps/replica:0/task:0/device:CPU:0 Compute"}}]
+    for i, (src_pid, src, dst_pid, dst) in enumerate([(1, "ps:0", 0, worker), (0, worker, 1, "ps:0")]):
+        events.append({"name": "t", "ph": "s", "pid": src_pid, "tid": 0, "ts": t + CLOCKS[src], "id": i})
+        events.append({"name": "t", "ph": "t", "pid": dst_pid, "tid": 0, "ts": t + DELAY + CLOCKS[dst], "id": i})
+        events.append({"name": "Op", "ph": "X", "pid": dst_pid, "tid": 0, "ts": t + DELAY + CLOCKS[dst], "dur": 5})
+        t += 100
+    return events
+
+###############################################################################
+
+class TraceMergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._traces = []
+        for task, t in [(0, 1000), (1, 1050)]:
+            path = os.path.join(self._temp_dir, "trace_worker_%u.json" % task)
+            with open(path, "w") as f:
+                json.dump({"traceEvents": workerTrace(task, t)}, f)
+            self._traces.append(("worker_%u" % task, path))
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_clock_offset(self):
+        self.assertEqual(estimateClockOffset([510, 530], [-490, -480]), (500.0, 10.0))
+        clocks = alignClocks({("a", "b"): (500.0, 10.0), ("c", "b"): (800.0, 5.0), ("d", "e"): (1.0, 1.0)}, "a")
+        self.assertEqual(clocks, {"a": (0.0, 0.0), "b": (500.0, 10.0), "c": (-300.0, 15.0)})
+
+    # --------------------------------------------------------------------------- #
+
+    def test_merge(self):
+        output_path = os.path.join(self._temp_dir, "merged.json")
+        merger = mergeTraces(self._traces, output_path, use_cache = False)
+        self.assertEqual(merger.clocks, {"worker:0": (0.0, 0.0), "ps:0": (500.0, 10.0), "worker:1": (-300.0, 20.0)})
+
+        events = list(iterTraceEvents(output_path))
+        self.assertEqual(len(events), merger.count)
+        processes = dict((e["pid"], e["args"]["name"]) for e in events if e["name"] == "process_name")
+        self.assertEqual(len(processes), 3)
+        timed = [e for e in events if e["ph"] != "M"]
+        self.assertEqual([e["ts"] for e in timed], sorted(e["ts"] for e in timed))
+        # On the common clock every transfer takes DELAY, and the flows of the two traces stay apart:
+        flows = {}
+        for e in timed:
+            if e["ph"] in ["s", "t"]:
+                flows.setdefault(e["id"], {})[e["ph"]] = e["ts"]
+        self.assertEqual(len(flows), 4)
+        self.assertEqual([flow["t"] - flow["s"] for flow in flows.values()], [DELAY] * 4)
+        ps_tids = set(e["tid"] for e in timed if processes[e["pid"]].startswith("/job:ps"))
+        self.assertEqual(len(ps_tids), 2)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_merged_tids(self):
+        # Thread 1000 of the first trace and thread 0 of the second share the ps process, and string tids are kept:
+        for (label, path), tids in zip(self._traces, [(5, 1000, "7"), (0, "7", 5)]):
+            with open(path, "w") as f:
+                json.dump({"traceEvents": [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "/job:ps/replica:0/task:0/device:CPU:0 Compute"}},
+                                           {"name": "thread_name", "ph": "M", "pid": 1, "tid": tids[0], "args": {"name": "main"}}] +
+                                          [{"name": "Op", "ph": "X", "pid": 1, "tid": tid, "ts": 10, "dur": 5} for tid in tids]}, f)
+        output_path = os.path.join(self._temp_dir, "merged.json")
+        mergeTraces(self._traces, output_path, align = False, use_cache = False)
+        events = list(iterTraceEvents(output_path))
+        self.assertEqual(sorted(e["tid"] for e in events if e["ph"] == "X"), range(6))
+        thread_names = dict((e["tid"], e["args"]["name"]) for e in events if e["name"] == "thread_name")
+        self.assertEqual(thread_names, {0: "worker_0 main", 1: "worker_0 1000", 2: "worker_0 7",
+                                        3: "worker_1 main", 4: "worker_1 7", 5: "worker_1 5"})
+
+    # --------------------------------------------------------------------------- #
+
+    def test_fan_in(self):
+        # One event per run, merged two at a time:
+        expected_path = os.path.join(self._temp_dir, "expected.json")
+        mergeTraces(self._traces, expected_path, use_cache = False)
+        expected = list(iterTraceEvents(expected_path))
+        open_runs = [0, 0]
+        read_run = TraceMerger._readRun
+        def countRuns(run_path):
+            open_runs[0] += 1
+            open_runs[1] = max(open_runs[1], open_runs[0])
+            try:
+                for item in read_run(run_path):
+                    yield item
+            finally:
+                open_runs[0] -= 1
+        limits = (TraceMerger.RUN_SIZE, TraceMerger.MAX_FAN_IN)
+        TraceMerger.RUN_SIZE, TraceMerger.MAX_FAN_IN, TraceMerger._readRun = 1, 2, staticmethod(countRuns)
+        try:
+            output_path = os.path.join(self._temp_dir, "merged.json")
+            mergeTraces(self._traces, output_path, use_cache = False)
+        finally:
+            TraceMerger.RUN_SIZE, TraceMerger.MAX_FAN_IN = limits
+            TraceMerger._readRun = staticmethod(read_run)
+        self.assertEqual(open_runs[1], 2)
+        events = list(iterTraceEvents(output_path))
+        self.assertEqual(len(events), len(expected))
+        self.assertEqual([e["ts"] for e in events if e["ph"] != "M"], [e["ts"] for e in expected if e["ph"] != "M"])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_forced_offset(self):
+        output_path = os.path.join(self._temp_dir, "merged.json.gz")
+        merger = mergeTraces(self._traces, output_path, offsets = {"ps:0": 400}, align = False, use_cache = False)
+        self.assertEqual(merger.clocks, {"worker:0": (0.0, 0.0), "ps:0": (400.0, 0.0)})
+        # worker_0's first flow, from the ps; worker:1 can't be aligned without the flows and keeps its clock:
+        starts = dict((e["id"], e["ts"]) for e in iterTraceEvents(output_path) if e["ph"] == "s")
+        self.assertEqual(starts[0], 1000 + 500 - 400)
+        self.assertEqual(starts[3], 1150 - 300)
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
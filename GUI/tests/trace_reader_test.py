@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mltester.actions.trace_reader import TraceEventReader, iterTraceEvents
+
+###############################################################################
+
+EVENTS = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "/job:worker/replica:0/task:0/device:GPU:0 Compute"}},
+          {"name": "Conv2D", "ph": "X", "cat": "Op", "pid": 0, "tid": 0, "ts": 1000, "dur": 250, "args": {"name": "v0/cg/conv0/conv2d/Conv2D", "op": "Conv2D"}},
+          {"name": "_Recv", "ph": "X", "cat": "Op", "pid": 0, "tid": 1, "ts": 1300, "dur": 12345678901, "args": {"name": u"v0/cg/conv0/kernel/read/_1é", "op": "_Recv"}}]
+
+###############################################################################
+
+class TraceReaderTest(unittest.TestCase):
+
+    def _read(self, text, chunk_size):
+        return list(TraceEventReader(io.BytesIO(text.encode("utf-8")), chunk_size = chunk_size))
+
+    # --------------------------------------------------------------------------- #
+
+    def test_layouts(self):
+        ''' Events are identical to json.load for any chunking of the input. '''
+        texts = [json.dumps({"traceEvents": EVENTS}),
+                 json.dumps({"displayTimeUnit": "ns", "metadata": {"a": [1, 2]}, "traceEvents": EVENTS, "tail": 1}, indent = 4),
+                 json.dumps(EVENTS, ensure_ascii = False)]
+        for text in texts:
+            for chunk_size in [1, 2, 5, 17, 1 << 20]:
+                self.assertEqual(self._read(text, chunk_size), EVENTS)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_empty_and_truncated(self):
+        self.assertEqual(self._read('{"traceEvents": []}', 3), [])
+        self.assertEqual(self._read('{"otherData": {}}', 3), [])
+        self.assertRaises(ValueError, self._read, '{"traceEvents": [{"ts": 1}, {"ts": ', 3)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_compressed(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            plain_path = os.path.join(temp_dir, "trace_worker_0.json")
+            gzip_path = os.path.join(temp_dir, "trace_worker_0.json.gz")
+            with open(plain_path, "wb") as f:
+                f.write(json.dumps({"traceEvents": EVENTS}))
+            with gzip.open(gzip_path, "wb") as f:
+                f.write(json.dumps({"traceEvents": EVENTS}))
+            self.assertEqual(list(iterTraceEvents(plain_path)), EVENTS)
+            self.assertEqual(list(iterTraceEvents(gzip_path)), EVENTS)
+        finally:
+            shutil.rmtree(temp_dir)
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mltester.actions.trace_simulator import SimulationConditions, StepSimulator, readGraph
+
+###############################################################################
+
+GRAPH = """node {
+  name: "w/read"
+  op: "Identity"
+  device: "/job:ps/replica:0/task:0/device:CPU:0"
+  attr {
+    key: "T"
+    value {
+      type: DT_HALF
+    }
+  }
+  attr {
+    key: "_output_shapes"
+    value {
+      list {
+        shape {
+          dim {
+            size: 1000
+          }
+          dim {
+            size: 500
+          }
+        }
+      }
+    }
+  }
+}
+node {
+  name: "conv"
+  op: "Conv2D"
+  input: "w/read"
+  device: "/job:worker/replica:0/task:0/device:GPU:0"
+}
+node {
+  name: "relu"
+  op: "Relu"
+  input: "conv:0"
+  input: "^w/read"
+  device: "/job:worker/replica:0/task:0/device:GPU:0"
+}
+node {
+  name: "init"
+  op: "NoOp"
+}
+library {
+  function {
+    node_def {
+      name: "not_a_node"
+    }
+  }
+}
+"""
+
+###############################################################################
+
+class TraceSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._graph_path = os.path.join(self._temp_dir, "graph.txt")
+        with open(self._graph_path, "w") as f:
+            f.write(GRAPH)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_read_graph(self):
+        nodes = readGraph(self._graph_path)
+        self.assertEqual([node.name for node in nodes], ["w/read", "conv", "relu", "init"])
+        self.assertEqual(nodes[0].output_bytes, [1000000])
+        self.assertEqual(nodes[2].inputs, ["conv:0", "^w/read"])
+        self.assertEqual(nodes[3].outputBytes(0), 0)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_simulate(self):
+        simulator = StepSimulator(readGraph(self._graph_path), {"w/read": 10, "conv": 300, "relu": 100})
+        # 1MB at 8 Gb/s takes 1000 usec:
+        res = simulator.run(SimulationConditions(bandwidth = 8))
+        self.assertEqual(res.step_time, 10 + 1000 + 300 + 100)
+        self.assertEqual((res.transfers, res.transfer_bytes, res.unscheduled), (2, 1000000, 0))
+        # Two workers share the parameter server's link; latency is added to each transfer:
+        self.assertEqual(simulator.run(SimulationConditions(bandwidth = 8, latency = 50, workers = 2, compute_scale = 2)).step_time,
+                         10 / 2.0 + 2000 + 50 + 300 / 2.0 + 100 / 2.0)
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
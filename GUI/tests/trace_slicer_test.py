@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mltester.actions.trace_reader import iterTraceEvents
+from mltester.actions.trace_slicer import sliceTrace
+
+###############################################################################
+
+EVENTS = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "/job:worker/replica:0/task:0/device:GPU:0 Compute"}},
+          {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "/job:ps/replica:0/task:0/device:CPU:0 Compute"}},
+          {"name": "Conv2D", "ph": "X", "pid": 0, "tid": 0, "ts": 100, "dur": 50},
+          {"name": "Relu", "ph": "X", "pid": 0, "tid": 0, "ts": 180, "dur": 50},
+          {"name": "MatMul", "ph": "X", "pid": 0, "tid": 0, "ts": 300, "dur": 50},
+          {"name": "Identity", "ph": "X", "pid": 1, "tid": 0, "ts": 150, "dur": 10},
+          {"name": "w/read", "ph": "s", "pid": 1, "tid": 0, "ts": 160, "id": 1},
+          {"name": "w/read", "ph": "t", "pid": 0, "tid": 0, "ts": 200, "id": 1},
+          {"name": "b/read", "ph": "s", "pid": 1, "tid": 0, "ts": 20, "id": 2},
+          {"name": "b/read", "ph": "t", "pid": 0, "tid": 0, "ts": 50, "id": 2}]
+
+###############################################################################
+
+class TraceSlicerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._trace_path = os.path.join(self._temp_dir, "trace_worker_0.json")
+        with open(self._trace_path, "w") as f:
+            json.dump({"traceEvents": EVENTS}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    # --------------------------------------------------------------------------- #
+
+    def _slice(self, **kwargs):
+        output_path = os.path.join(self._temp_dir, "slice.json.gz")
+        count = sliceTrace(self._trace_path, output_path, **kwargs)
+        events = list(iterTraceEvents(output_path))
+        self.assertEqual(len(events), count)
+        return events
+
+    # --------------------------------------------------------------------------- #
+
+    def test_window(self):
+        events = self._slice(t0 = 140, t1 = 250)
+        self.assertEqual([e["name"] for e in events], ["process_name", "process_name", "Conv2D", "Relu", "Identity", "w/read", "w/read"])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_devices(self):
+        # The flow from the ps crosses into the window, so its start and the ps process name are kept:
+        events = self._slice(t0 = 190, t1 = 400, devices = ["GPU:0"])
+        self.assertEqual([(e["name"], e["pid"]) for e in events],
+                         [("process_name", 0), ("Relu", 0), ("MatMul", 0), ("w/read", 1), ("w/read", 0), ("process_name", 1)])
+        self.assertEqual(self._slice(pids = [1], t1 = 100), [EVENTS[1], EVENTS[8], EVENTS[9], EVENTS[0]])
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mltester.actions.trace_table import NO_EVENT_ID, TraceTable
+
+###############################################################################
+
+EVENTS = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "/job:worker/replica:0/task:0/device:GPU:0 Compute"}},
+          {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "/job:ps/replica:0/task:0/device:CPU:0 Compute"}},
+          {"name": "Conv2D", "ph": "X", "cat": "Op", "pid": 0, "tid": 0, "ts": 1000, "dur": 250},
+          {"name": "_Recv", "ph": "X", "cat": "Op", "pid": 0, "tid": 1, "ts": 1300, "dur": 100},
+          {"name": "Identity", "ph": "X", "cat": "Op", "pid": 1, "tid": 0, "ts": 1200, "dur": 10},
+          {"name": "GPU_0_bfc", "ph": "C", "cat": "Memory", "pid": 2, "tid": 0, "ts": 1250, "args": {"GPU_0_bfc": 1024}},
+          {"name": "Conv2D", "ph": "X", "cat": "Op", "pid": 0, "tid": 0, "ts": 2000, "dur": 300}]
+
+###############################################################################
+
+class TraceTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._trace_path = os.path.join(self._temp_dir, "trace_worker_0.json")
+        with open(self._trace_path, "w") as f:
+            json.dump({"traceEvents": EVENTS}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_columns(self):
+        table = TraceTable.fromFile(self._trace_path)
+        self.assertEqual(len(table), 5)
+        self.assertEqual(table.processName(1), "/job:ps/replica:0/task:0/device:CPU:0 Compute")
+        self.assertEqual(table.ts.tolist(), [1000, 1300, 1200, 1250, 2000])
+        self.assertEqual(table.end().tolist(), [1250, 1400, 1210, 1250, 2300])
+        self.assertEqual([table.names[i] for i in table.name_id], ["Conv2D", "_Recv", "Identity", "GPU_0_bfc", "Conv2D"])
+        self.assertEqual(table.value.tolist(), [0, 0, 0, 1024, 0])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_queries(self):
+        table = TraceTable.fromFile(self._trace_path)
+        self.assertEqual(table.mask(cat = "Op").sum(), 4)
+        self.assertEqual(table.mask(cat = "Op", tid = 0, pid = 0).sum(), 2)
+        self.assertEqual(table.mask(name = "Conv2D").sum(), 2)
+        self.assertEqual(table.mask(name = "NoSuchOp").sum(), 0)
+        self.assertEqual(table.mask(ph = "C").sum(), 1)
+        self.assertEqual(table.select(table.mask(t0 = 1240, t1 = 1300)).ts.tolist(), [1000, 1250])
+
+    # --------------------------------------------------------------------------- #
+
+    def test_cache(self):
+        built = TraceTable.fromFile(self._trace_path)
+        self.assertTrue(os.path.isfile(TraceTable.cachePath(self._trace_path)))
+        cached = TraceTable.fromFile(self._trace_path)
+        for col in TraceTable.COLUMNS:
+            self.assertEqual(getattr(built, col).tolist(), getattr(cached, col).tolist())
+        self.assertEqual(built.names.strings, cached.names.strings)
+        self.assertEqual(built.processes, cached.processes)
+
+    # --------------------------------------------------------------------------- #
+
+    def test_event_ids(self):
+        ids = [7, "0x1f", "010", "flow:a", "flow:b", "flow:a", None]
+        events = [{"name": "t", "ph": "s", "pid": 0, "tid": 0, "ts": 10 * i, "id": event_id} for i, event_id in enumerate(ids)]
+        events[-1].pop("id")
+        with open(self._trace_path, "w") as f:
+            json.dump({"traceEvents": events}, f)
+        table = TraceTable.fromFile(self._trace_path, use_cache = False)
+        # Decimal strings are not octal; other strings get their own ids, apart from the ones of numbers and "no id":
+        self.assertEqual(table.id.tolist(), [7, 31, 10, NO_EVENT_ID - 1, NO_EVENT_ID - 2, NO_EVENT_ID - 1, NO_EVENT_ID])
+
+# --------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+''' Times analyze_verbs on a synthetic RDMA verbs log (default: a million requests).
+    Usage: verbs_benchmark.py [num_requests] [tensors_per_step] '''
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from commonpylib.monitors.measurement import StatsValue
+from mltester.actions.analyze_verbs import Timeline, TimelineList, TimelineSample
+from mltester.actions.verbs_table import VerbsTable
+
+WORKER = "/job:worker/replica:0/task:0/device:CPU:0"
+PS = "/job:ps/replica:0/task:0/device:CPU:0"
+
+###############################################################################
+
+def writeVerbsLog(output_dir, num_requests, tensors_per_step, seed = 1):
+    ''' Writes requests_start.csv / requests_done.csv as the verbs tracer does: all the tensors of a step are
+        requested at once, and one request in ten is slow enough to still be in flight several steps later. '''
+    random.seed(seed)
+    start_path = os.path.join(output_dir, "requests_start.csv")
+    done_path = os.path.join(output_dir, "requests_done.csv")
+    keys = ["%s;%016x;%s;v0/cg/conv%u/kernel/read" % (PS, random.getrandbits(64), WORKER, i) for i in xrange(tensors_per_step)]
+    sizes = [random.randint(1, 1 << 22) for _ in keys]
+    ts = 1000000
+    with open(start_path, "w") as start_file, open(done_path, "w") as done_file:
+        for i in xrange(num_requests):
+            step, tensor = divmod(i, tensors_per_step)
+            if tensor == 0:
+                ts += 5000
+            start = ts + random.randint(0, 500)
+            done = start + (random.randint(20000, 100000) if random.random() < 0.1 else random.randint(50, 2000))
+            start_file.write("%u,%u,%s\n" % (start, step, keys[tensor]))
+            done_file.write("%u,%u,%s,%x\n" % (done, step, keys[tensor], sizes[tensor]))
+    return start_path, done_path
+
+###############################################################################
+
+def readSamples(start_path, done_path):
+    starts = {}
+    with open(start_path) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            starts[(parts[2], parts[1])] = int(parts[0]) / 1000000.0
+    samples = []
+    with open(done_path) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            samples.append(TimelineSample(starts[(parts[2], parts[1])], int(parts[0]) / 1000000.0, parts[2].split(";")[3]))
+    return samples
+
+###############################################################################
+
+def legacyJoin(start_path, done_path):
+    ''' The previous line-by-line join: a dict of requests per key, with per-step dicts and a StatsValue each. '''
+    requests = {}
+    with open(start_path) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            requests.setdefault(parts[2], ({}, {}, StatsValue()))[0][parts[1]] = int(parts[0]) / 1000000.0
+    with open(done_path) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            ts = int(parts[0]) / 1000000.0
+            start_ts, done_ts, latency = requests[parts[2]]
+            done_ts[parts[1]] = ts
+            latency.update(ts - start_ts[parts[1]])
+            int(parts[3], 16)
+    return requests
+
+###############################################################################
+
+class LinearTimelineList(TimelineList):
+    ''' The previous lane search: a scan over all the timelines for every sample. '''
+
+    def _find(self, start_ts):
+        for tl in self._timelines:
+            if start_ts >= tl.last_ts:
+                return tl
+        return self._addNew()
+
+###############################################################################
+
+class NullWriter(object):
+    file_path = os.devnull
+
+    def add(self, start, end, label):
+        pass
+
+    def close(self):
+        pass
+
+###############################################################################
+
+def laneOnly(cls):
+    ''' cls without the timeline files, to time the lane search alone. '''
+    class LaneOnlyTimelineList(cls):
+        def _addNew(self):
+            tl = object.__new__(Timeline)
+            tl.index = len(self._timelines)
+            tl.last_ts = 0
+            tl.file = NullWriter()
+            self._timelines.append(tl)
+            return tl
+    return LaneOnlyTimelineList
+
+###############################################################################
+
+def timeLanes(cls, samples, output_dir):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        t0 = time.time()
+        tls = cls(output_dir)
+        tls.generate(samples)
+        return time.time() - t0, len(tls._timelines)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+###############################################################################
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tensors_per_step = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    temp_dir = tempfile.mkdtemp()
+    try:
+        start_path, done_path = writeVerbsLog(temp_dir, num_requests, tensors_per_step)
+        print "%u requests, %u tensors per step" % (num_requests, tensors_per_step)
+        t0 = time.time()
+        legacyJoin(start_path, done_path)
+        print "Join (line by line):            %8.2lf sec" % (time.time() - t0)
+        t0 = time.time()
+        VerbsTable.fromFiles(start_path, done_path)
+        print "Join (VerbsTable):              %8.2lf sec" % (time.time() - t0)
+
+        samples = readSamples(start_path, done_path)
+        for name, cls in [("linear scan", LinearTimelineList), ("heap", TimelineList)]:
+            seconds, num_timelines = timeLanes(laneOnly(cls), samples, temp_dir)
+            print "Lane search       (%-11s): %8.2lf sec, %u timelines" % (name, seconds, num_timelines)
+            output_dir = os.path.join(temp_dir, name.replace(" ", "_"))
+            os.mkdir(output_dir)
+            seconds, num_timelines = timeLanes(cls, samples, output_dir)
+            print "Lanes + .tl files (%-11s): %8.2lf sec, %u timelines" % (name, seconds, num_timelines)
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    main()